@@ -11,6 +11,14 @@ from utils.gen_data import (
     introduce_spelling_errors,
 )
 from utils.data_match import calc_match_scores, get_top_matches
+from utils.data_cache import LRUCache
+from utils.data_ingest import (
+    UPLOAD_CACHE_BYTES,
+    UPLOAD_FORMATS,
+    cached_read_upload,
+    memory_summary,
+    upload_digest,
+)
 
 
 permpage1 = {"num_records": 10, "uploadcreate": "Upload"}
@@ -33,6 +41,24 @@ if "df1_final" not in st.session_state:
     st.session_state.df1_final = None
 if "df2_final" not in st.session_state:
     st.session_state.df2_final = None
+##content hash of the upload each final df was read from, None for generated data
+if "df1_final_hash" not in st.session_state:
+    st.session_state.df1_final_hash = None
+if "df2_final_hash" not in st.session_state:
+    st.session_state.df2_final_hash = None
+
+##uploads are parsed once per file contents, and the parsed frames are kept with their
+##content hash so that reruns reuse them even once they are evicted from the cache
+if "upload_cache" not in st.session_state:
+    st.session_state.upload_cache = LRUCache(UPLOAD_CACHE_BYTES)
+if "upload_hashes" not in st.session_state:
+    st.session_state.upload_hashes = {}
+if "upload_summaries" not in st.session_state:
+    st.session_state.upload_summaries = {}
+if "df1_upload_hash" not in st.session_state:
+    st.session_state.df1_upload_hash = None
+if "df2_upload_hash" not in st.session_state:
+    st.session_state.df2_upload_hash = None
 
 if "permpage1" not in st.session_state:
     st.session_state.permpage1 = permpage1
@@ -56,38 +82,70 @@ def data_generation_page():
         uploadcol1, uploadcol2 = st.columns(2)
         with uploadcol1:
             file1 = st.file_uploader(
-                "Please upload your first file:", type="csv", key="file1"
+                "Please upload your first file:", type=UPLOAD_FORMATS, key="file1"
             )
 
         with uploadcol2:
             file2 = st.file_uploader(
-                "Please upload your second file:", type="csv", key="file2"
+                "Please upload your second file:", type=UPLOAD_FORMATS, key="file2"
             )
 
         uploaddisplaycol1, uploaddisplaycol2 = st.columns(2)
 
-        if file1 is not None:
-            st.session_state.df1_from_upload = pd.read_csv(file1)
+        if file1 is not None and (
+            upload_digest(file1, st.session_state.upload_hashes)
+            != st.session_state.df1_upload_hash
+        ):
+            (
+                st.session_state.df1_from_upload,
+                st.session_state.df1_upload_hash,
+            ) = cached_read_upload(
+                st.session_state.upload_cache, file1, st.session_state.upload_hashes
+            )
         if st.session_state.df1_from_upload is not None and (
             st.session_state.df1_final is None
-            or st.session_state.df1_from_upload.equals(st.session_state.df1_final)
+            or st.session_state.df1_upload_hash == st.session_state.df1_final_hash
         ):
             with uploaddisplaycol1:
                 st.subheader("DataFrame 1:")
                 st.write(st.session_state.df1_from_upload.head(3))
+                digest = st.session_state.df1_upload_hash
+                if digest not in st.session_state.upload_summaries:
+                    st.session_state.upload_summaries[digest] = memory_summary(
+                        st.session_state.df1_from_upload
+                    )
+                with st.expander("Memory footprint"):
+                    st.dataframe(st.session_state.upload_summaries[digest])
 
-        if file2 is not None:
-            st.session_state.df2_from_upload = pd.read_csv(file2)
+        if file2 is not None and (
+            upload_digest(file2, st.session_state.upload_hashes)
+            != st.session_state.df2_upload_hash
+        ):
+            (
+                st.session_state.df2_from_upload,
+                st.session_state.df2_upload_hash,
+            ) = cached_read_upload(
+                st.session_state.upload_cache, file2, st.session_state.upload_hashes
+            )
         if st.session_state.df2_from_upload is not None and (
             st.session_state.df2_final is None
-            or st.session_state.df2_from_upload.equals(st.session_state.df2_final)
+            or st.session_state.df2_upload_hash == st.session_state.df2_final_hash
         ):
             with uploaddisplaycol2:
                 st.subheader("DataFrame 2:")
                 st.write(st.session_state.df2_from_upload.head(3))
+                digest = st.session_state.df2_upload_hash
+                if digest not in st.session_state.upload_summaries:
+                    st.session_state.upload_summaries[digest] = memory_summary(
+                        st.session_state.df2_from_upload
+                    )
+                with st.expander("Memory footprint"):
+                    st.dataframe(st.session_state.upload_summaries[digest])
 
         st.session_state.df1_final = st.session_state.df1_from_upload
         st.session_state.df2_final = st.session_state.df2_from_upload
+        st.session_state.df1_final_hash = st.session_state.df1_upload_hash
+        st.session_state.df2_final_hash = st.session_state.df2_upload_hash
 
     else:
         # User inputs
@@ -99,10 +157,16 @@ def data_generation_page():
             step=1,
             on_change=set_num_records,
         )
+        seed = st.number_input(
+            "Random seed (leave empty for random data)",
+            min_value=0,
+            value=None,
+            step=1,
+        )
 
         # Generate DataFrames
         if st.button("Generate DataFrames"):
-            st.session_state.df1 = generate_fake_data(num_records)
+            st.session_state.df1 = generate_fake_data(num_records, seed=seed)
             st.session_state.df2 = st.session_state.df1.copy()
 
         if st.session_state.df1 is not None and st.session_state.df2 is not None:
@@ -241,6 +305,8 @@ def data_generation_page():
             st.write(st.session_state.df2_with_errors.head(3))
             st.session_state.df1_final = st.session_state.df1_with_errors
             st.session_state.df2_final = st.session_state.df2_with_errors
+            st.session_state.df1_final_hash = None
+            st.session_state.df2_final_hash = None
 
 
 data_generation_page()
@@ -1,8 +1,77 @@
+import os
+import time
+
 import streamlit as st
 import pandas as pd
 
 # Import your functions
-from utils.data_match import calc_match_scores, get_top_matches
+from utils.data_match import (
+    cached_match_scores,
+    cascade_match_scores,
+    get_top_matches,
+    stream_top_matches,
+    uses_exact_join,
+)
+from utils.data_cache import LRUCache, hash_config
+from utils.data_compare import COMPARATOR_BACKENDS, SCORE_CACHE_BYTES
+from utils.data_index import (
+    BLOCKING_KEY_TYPES,
+    SIMILARITY_INDEX_METHODS,
+    count_candidate_pairs,
+    estimate_minhash_recall,
+)
+from utils.data_estimate import (
+    DEFAULT_RUN_LIMITS,
+    ESTIMATE_SAMPLE_ROWS,
+    check_run_limits,
+    estimate_match_cost,
+    suggest_cheaper_indexer,
+)
+from utils.data_jobs import MatchJob
+from utils.data_match import pairs_per_memory_budget
+from utils.data_normalise import (
+    NORMALISATION_PRESETS,
+    find_normalisation_conflicts,
+    normalise_frames,
+)
+from utils.data_profile import MatchProfiler
+
+
+if "match_cache" not in st.session_state:
+    st.session_state.match_cache = LRUCache()
+if "score_cache" not in st.session_state:
+    st.session_state.score_cache = LRUCache(SCORE_CACHE_BYTES)
+##top matches of the last run, taken to the merge page with the frames they were matched on
+if "top_matches" not in st.session_state:
+    st.session_state.top_matches = None
+if "matched_frames" not in st.session_state:
+    st.session_state.matched_frames = None
+##stage timings of the last run, shown in the profiling panel
+if "match_profile" not in st.session_state:
+    st.session_state.match_profile = None
+##matching run in the background, and how the last one ended
+if "match_job" not in st.session_state:
+    st.session_state.match_job = None
+if "match_outcome" not in st.session_state:
+    st.session_state.match_outcome = None
+##cost estimate of the last configuration, with the frames and configuration it was made for
+if "match_estimate" not in st.session_state:
+    st.session_state.match_estimate = None
+##recall estimate of the last MinHash configuration, with the frames and configuration it was made for
+if "minhash_recall" not in st.session_state:
+    st.session_state.minhash_recall = None
+
+# Seconds between two reruns of the page while a matching run is in progress
+JOB_POLL_S = 1.0
+
+# The labels of the indexing methods in the indexing strategy selection
+INDEX_METHOD_LABELS = {
+    "full": "Full",
+    "block": "Blocking",
+    "sortedneighbourhood": "Sorted Neighbourhood",
+    "qgram": "Q-gram TF-IDF",
+    "minhash": "MinHash LSH",
+}
 
 
 def matching_process_page():
@@ -43,7 +112,8 @@ def matching_process_page():
         matchselectcol3,
         matchselectcol4,
         matchselectcol5,
-    ) = st.columns(5)
+        matchselectcol6,
+    ) = st.columns(6)
     for i in range(num_cols):
         with matchselectcol1:
             col_name1 = st.selectbox(
@@ -87,6 +157,13 @@ def matching_process_page():
                 step=0.01,
                 key=f"weight_{i}",
             )
+        with matchselectcol6:
+            normalise = st.selectbox(
+                f"Normalisation for Column {i+1}",
+                list(NORMALISATION_PRESETS),
+                key=f"normalise_{i}",
+                help="Normalises the values of both columns once per record before indexing and comparing, e.g. case, punctuation, titles, street abbreviations, phone digits or ISO dates.",
+            )
 
         col_info.append(
             {
@@ -94,6 +171,7 @@ def matching_process_page():
                 "name2": col_name2,
                 "ExactCompare": exact_compare,
                 "method": method,
+                "normalise": normalise,
             }
         )
         weights.append(weight)
@@ -103,19 +181,555 @@ def matching_process_page():
         st.warning("Please ensure that the weights sum up to 1.")
         return
 
-    # Matching process
-    if st.button("Run Matching Process"):
-        output_scores = calc_match_scores(
+    # A column is normalised once for all of its comparisons
+    conflicts = find_normalisation_conflicts(col_info)
+    if conflicts:
+        st.warning(
+            f"Please use the same normalisation for every comparison of the columns {', '.join(conflicts)}."
+        )
+        return
+
+    # Candidate pair selection
+    st.subheader("Candidate Pair Selection")
+    index_method = st.radio(
+        "Indexing strategy",
+        ["Full", "Blocking", "Sorted Neighbourhood", "Q-gram TF-IDF", "MinHash LSH"],
+        horizontal=True,
+        key="index_method",
+    )
+    index_info = {"method": "full"}
+    if index_method != "Full":
+        numblockcol1, numblockcol2, numblockcol3, numblockcol4 = st.columns(4)
+        with numblockcol1:
+            num_keys = st.number_input(
+                "Number of blocking keys", min_value=1, value=1, step=1
+            )
+        if index_method == "Sorted Neighbourhood":
+            with numblockcol2:
+                window = st.selectbox(
+                    "Window size",
+                    list(range(1, 100, 2)),
+                    index=1,
+                    help="The first blocking key is the sorting key, any further keys are blocked on exactly.",
+                )
+        if index_method == "Q-gram TF-IDF":
+            with numblockcol2:
+                q = st.number_input("Q-gram length", min_value=2, max_value=5, value=3)
+            with numblockcol3:
+                min_similarity = st.slider(
+                    "Minimum q-gram similarity",
+                    min_value=0.0,
+                    max_value=1.0,
+                    value=0.3,
+                    step=0.05,
+                    help="The keys of all blocking columns are joined into one text per record, and records are paired when the cosine similarity of their TF-IDF weighted q-grams reaches this value.",
+                )
+            with numblockcol4:
+                top_k = st.number_input(
+                    "Max candidates per record", min_value=1, value=50, step=1
+                )
+        if index_method == "MinHash LSH":
+            with numblockcol2:
+                bands = st.number_input(
+                    "Bands",
+                    min_value=1,
+                    max_value=200,
+                    value=25,
+                    step=1,
+                    help="More bands find more of the similar pairs, at the cost of more candidate pairs.",
+                )
+            with numblockcol3:
+                rows = st.number_input(
+                    "Rows per band",
+                    min_value=1,
+                    max_value=20,
+                    value=4,
+                    step=1,
+                    help="More rows per band only pair records that are more similar, so fewer candidate pairs are found.",
+                )
+            with numblockcol4:
+                reference_similarity = st.slider(
+                    "Recall reference similarity",
+                    min_value=0.05,
+                    max_value=1.0,
+                    value=0.5,
+                    step=0.05,
+                    help="The recall is estimated on the pairs of the full index whose q-gram sets have at least this Jaccard similarity.",
+                )
+        blockcol1, blockcol2, blockcol3, blockcol4 = st.columns(4)
+        block_keys = []
+        for i in range(num_keys):
+            with blockcol1:
+                key_name1 = st.selectbox(
+                    f"Blocking column {i+1} in DataFrame 1",
+                    st.session_state.df1_final.columns,
+                    key=f"block1_{i}",
+                )
+            with blockcol2:
+                key_name2 = st.selectbox(
+                    f"Blocking column {i+1} in DataFrame 2",
+                    st.session_state.df2_final.columns,
+                    key=f"block2_{i}",
+                )
+            with blockcol3:
+                key_type = st.selectbox(
+                    f"Blocking key {i+1}", BLOCKING_KEY_TYPES, key=f"blockkey_{i}"
+                )
+            with blockcol4:
+                n_chars = st.number_input(
+                    f"Prefix length for key {i+1}",
+                    min_value=1,
+                    max_value=10,
+                    value=3,
+                    step=1,
+                    disabled=key_type not in ["prefix", "surname_prefix"],
+                    key=f"blockchars_{i}",
+                )
+            block_keys.append(
+                {
+                    "name1": key_name1,
+                    "name2": key_name2,
+                    "key": key_type,
+                    "n_chars": n_chars,
+                }
+            )
+        if index_method == "Blocking":
+            index_info = {"method": "block", "keys": block_keys}
+        elif index_method == "MinHash LSH":
+            index_info = {
+                "method": "minhash",
+                "keys": block_keys,
+                "bands": bands,
+                "rows": rows,
+            }
+        elif index_method == "Q-gram TF-IDF":
+            index_info = {
+                "method": "qgram",
+                "keys": block_keys,
+                "q": q,
+                "min_similarity": min_similarity,
+                "top_k": top_k,
+            }
+        else:
+            index_info = {
+                "method": "sortedneighbourhood",
+                "keys": block_keys,
+                "window": window,
+            }
+
+    ##pick up the result of a run that finished since the last rerun
+    match_job = st.session_state.match_job
+    if match_job is not None and match_job.status != "running":
+        if match_job.status == "done":
+            result = match_job.result
+            st.session_state.top_matches = result["top_matches"]
+            st.session_state.match_profile = result["profiler"]
+            st.session_state.matched_frames = result["matched_frames"]
+            st.session_state.golden_records = None
+        st.session_state.match_outcome = {
+            "status": match_job.status,
+            "error": match_job.error,
+            "pairs_done": match_job.pairs_done,
+            "prune_report": match_job.result["prune_report"] if match_job.result else None,
+            "from_cache": match_job.result["from_cache"] if match_job.result else False,
+        }
+        st.session_state.match_job = match_job = None
+
+    # The page reruns every JOB_POLL_S seconds while a run is in progress, so the candidate pairs
+    # and the cost of the configuration are only counted and estimated when no run is
+    job_running = match_job is not None
+    if not job_running:
+        # Blocking keys are derived from the normalised columns, as in the matching process
+        normalised1, normalised2 = normalise_frames(
             st.session_state.df1_final, st.session_state.df2_final, col_info
         )
-        top_matches = get_top_matches(
-            output_scores,
-            st.session_state.df1_final,
-            st.session_state.df2_final,
-            weights,
+        # The similarity indexes have to look up every record to count their pairs, which takes
+        # minutes on large frames, so they show the count of the cost estimate below instead, and
+        # the run counts its pairs as it builds them
+        if index_info["method"] in SIMILARITY_INDEX_METHODS:
+            num_pairs = None
+        else:
+            num_pairs = count_candidate_pairs(normalised1, normalised2, index_info)
+        max_pairs = len(st.session_state.df1_final) * len(st.session_state.df2_final)
+        paircol1, paircol2, paircol3, paircol4 = st.columns(4)
+        if num_pairs is not None:
+            with paircol1:
+                st.metric(
+                    "Candidate pairs",
+                    f"{num_pairs:,}",
+                    f"{num_pairs / max(max_pairs, 1):.2%} of the full index",
+                    delta_color="off",
+                )
+        if uses_exact_join(col_info, index_info):
+            with paircol2:
+                st.caption(
+                    "All columns are compared exactly, so only the pairs with at least one equal column are scored, found by joining the DataFrames on each column."
+                )
+        if index_info["method"] == "minhash":
+            # The recall is measured by building the full index of a sample, so like the cost
+            # estimate below it is reused while the frames and the configuration are unchanged
+            recall_config = hash_config([col_info, index_info, reference_similarity])
+            minhash_recall = st.session_state.minhash_recall
+            if minhash_recall is None or not (
+                minhash_recall["df1"] is st.session_state.df1_final
+                and minhash_recall["df2"] is st.session_state.df2_final
+                and minhash_recall["config"] == recall_config
+            ):
+                minhash_recall = {
+                    "df1": st.session_state.df1_final,
+                    "df2": st.session_state.df2_final,
+                    "config": recall_config,
+                    "estimate": estimate_minhash_recall(
+                        normalised1, normalised2, index_info, reference_similarity
+                    ),
+                }
+                st.session_state.minhash_recall = minhash_recall
+            estimate = minhash_recall["estimate"]
+            with paircol2:
+                st.metric(
+                    "Estimated recall",
+                    "n/a" if estimate["recall"] is None else f"{estimate['recall']:.1%}",
+                    f"{estimate['expected_recall']:.1%} expected at the reference similarity",
+                    delta_color="off",
+                    help=f"Measured against the full index on {estimate['reference_pairs']:,} pairs of a sample of records.",
+                )
+
+    # Match selection
+    st.subheader("Match Selection")
+    selectcol1, selectcol2, selectcol3, selectcol4 = st.columns(4)
+    with selectcol1:
+        overall_similarity_threshold = st.slider(
+            "Overall similarity threshold",
+            min_value=0.0,
+            max_value=1.0,
+            value=0.45,
+            step=0.01,
+        )
+    with selectcol2:
+        top_n = st.number_input(
+            "Top matches per record", min_value=1, value=3, step=1
+        )
+
+    # Execution mode
+    st.subheader("Execution")
+    execcol1, execcol2, execcol3, execcol4 = st.columns(4)
+    with execcol1:
+        execution_mode = st.radio(
+            "Execution mode",
+            ["In memory", "Streaming", "Cascade"],
+            key="execution_mode",
+            help="Streaming scores the candidate pairs in chunks and only keeps the top matches, so memory use is bounded by the chunk size. Cascade scores the cheapest columns first and drops the pairs that can no longer reach the threshold before scoring the expensive columns.",
+        )
+    with execcol2:
+        chunk_budget_mb = st.number_input(
+            "Memory budget per chunk (MB)",
+            min_value=16,
+            value=256,
+            step=16,
+            disabled=execution_mode != "Streaming",
+        )
+    with execcol3:
+        n_jobs = st.number_input(
+            "Worker processes",
+            min_value=1,
+            max_value=os.cpu_count() or 1,
+            value=1,
+            step=1,
+            disabled=execution_mode == "Cascade",
+            help="Candidate pairs are scored in parallel partitions. The results are identical to a single worker.",
         )
-        st.subheader("Top Matches")
-        st.write(top_matches.head())
+    with execcol4:
+        backend = st.selectbox(
+            "String comparator backend",
+            COMPARATOR_BACKENDS,
+            help="rapidfuzz computes jaro, jarowinkler, levenshtein and damerau_levenshtein in compiled, multi-threaded batches ('auto' uses it when installed). The other methods always use recordlinkage.",
+        )
+        for col_dict in col_info:
+            col_dict["backend"] = backend
+        reuse_scores = st.checkbox(
+            "Reuse string scores across runs",
+            value=False,
+            help="Keeps the similarity of every scored pair of values in the session, so later runs only score new pairs of values. The lookups slow down a first run, so it only pays off when rerunning with similar settings. Only used with a single worker process.",
+        )
+        score_cache = st.session_state.score_cache if reuse_scores else None
+        trace_memory = st.checkbox(
+            "Trace memory allocations",
+            value=False,
+            key="trace_memory",
+            help="Records the peak memory allocated by every stage in the profiling panel. Tracing slows down the string comparators.",
+        )
+        match_cache = st.session_state.match_cache
+        st.caption(
+            f"Result cache: {len(match_cache)} runs, "
+            f"{match_cache.nbytes / 1024**2:.1f} of {match_cache.max_bytes / 1024**2:.0f} MB"
+        )
+        st.caption(
+            f"String score cache: {len(st.session_state.score_cache):,} value pairs, "
+            f"{st.session_state.score_cache.nbytes / 1024**2:.1f} MB"
+        )
+
+    # Pre-flight estimate of the cost of the run
+    with st.expander("Run limits"):
+        st.caption(
+            "Runs estimated above a warning limit show a warning, and runs estimated above a maximum are not started."
+        )
+        limitcol1, limitcol2, limitcol3, limitcol4 = st.columns(4)
+        run_limits = {}
+        for limitcol, limit_key, label in [
+            (limitcol1, "warn_runtime_s", "Warn above runtime (s)"),
+            (limitcol2, "max_runtime_s", "Maximum runtime (s)"),
+            (limitcol3, "warn_memory_mb", "Warn above peak memory (MB)"),
+            (limitcol4, "max_memory_mb", "Maximum peak memory (MB)"),
+        ]:
+            with limitcol:
+                run_limits[limit_key] = st.number_input(
+                    label,
+                    min_value=1,
+                    value=DEFAULT_RUN_LIMITS[limit_key],
+                    step=1,
+                    key=limit_key,
+                )
+    if job_running:
+        st.caption(
+            "The candidate pairs and the cost of the configuration are estimated again once the run is done."
+        )
+    else:
+        estimate_options = {
+            "chunk_size": (
+                pairs_per_memory_budget(chunk_budget_mb, len(col_info))
+                if execution_mode == "Streaming"
+                else None
+            ),
+            "n_jobs": 1 if execution_mode == "Cascade" else n_jobs,
+        }
+        # Hashing the DataFrames for the estimate cache takes seconds on large frames, so the
+        # estimate is reused while the frames are the same objects and the configuration is
+        # unchanged
+        estimate_config = hash_config([col_info, index_info, estimate_options])
+        match_estimate = st.session_state.match_estimate
+        if match_estimate is None or not (
+            match_estimate["df1"] is st.session_state.df1_final
+            and match_estimate["df2"] is st.session_state.df2_final
+            and match_estimate["config"] == estimate_config
+        ):
+            match_estimate = {
+                "df1": st.session_state.df1_final,
+                "df2": st.session_state.df2_final,
+                "config": estimate_config,
+                "cost": estimate_match_cost(
+                    st.session_state.df1_final,
+                    st.session_state.df2_final,
+                    col_info,
+                    index_info,
+                    **estimate_options,
+                ),
+            }
+            st.session_state.match_estimate = match_estimate
+        cost = match_estimate["cost"]
+        if num_pairs is None:
+            with paircol1:
+                st.metric(
+                    "Candidate pairs" if cost["exact"] else "Estimated candidate pairs",
+                    f"{cost['candidate_pairs']:,}",
+                    f"{cost['candidate_pairs'] / max(max_pairs, 1):.2%} of the full index",
+                    delta_color="off",
+                    help=None
+                    if cost["exact"]
+                    else f"Counted for a sample of {ESTIMATE_SAMPLE_ROWS:,} records of DataFrame 1 and scaled to all of them.",
+                )
+        run_status, limit_messages = check_run_limits(cost, run_limits)
+        costcol1, costcol2, costcol3, costcol4 = st.columns(4)
+        with costcol1:
+            st.metric(
+                "Estimated runtime",
+                f"{cost['runtime_s']:,.1f} s",
+                help="Indexing: {indexing:,.1f} s, scoring: {scoring:,.1f} s, selection: {selection:,.1f} s. The comparators are timed on a sample of the values.".format(
+                    **cost["stages"]
+                ),
+            )
+        with costcol2:
+            st.metric(
+                "Estimated peak memory",
+                f"{cost['peak_memory_mb']:,.0f} MB",
+                help="The memory of the candidate pairs and similarity scores held at once.",
+            )
+        if run_status != "ok":
+            limit_text = " ".join(limit_messages)
+            if run_status == "refuse":
+                st.error(limit_text + " Raise the limits or choose a cheaper configuration.")
+            else:
+                st.warning(limit_text)
+            if "suggestion" not in match_estimate:
+                match_estimate["suggestion"] = suggest_cheaper_indexer(
+                    st.session_state.df1_final,
+                    st.session_state.df2_final,
+                    col_info,
+                    index_info,
+                    cost,
+                    **estimate_options,
+                )
+            suggestion = match_estimate["suggestion"]
+            if suggestion is not None:
+                suggested = suggestion["index_info"]
+                st.info(
+                    f"Suggestion: the {INDEX_METHOD_LABELS[suggested['method']]} strategy on "
+                    + ", ".join(key["name1"] for key in suggested["keys"])
+                    + f" is estimated to produce {suggestion['estimate']['candidate_pairs']:,} "
+                    f"candidate pairs and to run in {suggestion['estimate']['runtime_s']:,.1f} s."
+                )
+
+    # Matching process, run in the background so that the page stays responsive
+    if st.button(
+        "Run Matching Process",
+        disabled=job_running or run_status == "refuse",
+    ):
+        df1 = st.session_state.df1_final
+        df2 = st.session_state.df2_final
+        profiler = MatchProfiler(trace_memory=trace_memory)
+
+        def run_matching(progress):
+            prune_report = None
+            from_cache = False
+            if execution_mode == "Streaming":
+                top_matches = stream_top_matches(
+                    df1,
+                    df2,
+                    col_info,
+                    weights,
+                    overall_similarity_threshold,
+                    top_n,
+                    index_info=index_info,
+                    memory_budget_mb=chunk_budget_mb,
+                    n_jobs=n_jobs,
+                    score_cache=score_cache,
+                    profiler=profiler,
+                    progress=progress,
+                )
+            elif execution_mode == "Cascade":
+                output_scores, prune_report = cascade_match_scores(
+                    df1,
+                    df2,
+                    col_info,
+                    weights,
+                    overall_similarity_threshold,
+                    index_info,
+                    score_cache=score_cache,
+                    profiler=profiler,
+                    progress=progress,
+                )
+                top_matches = get_top_matches(
+                    output_scores,
+                    df1,
+                    df2,
+                    weights,
+                    overall_similarity_threshold,
+                    top_n,
+                    profiler=profiler,
+                )
+            else:
+                output_scores, from_cache = cached_match_scores(
+                    match_cache,
+                    df1,
+                    df2,
+                    col_info,
+                    index_info,
+                    n_jobs=n_jobs,
+                    score_cache=score_cache,
+                    profiler=profiler,
+                    progress=progress,
+                )
+                top_matches = get_top_matches(
+                    output_scores,
+                    df1,
+                    df2,
+                    weights,
+                    overall_similarity_threshold,
+                    top_n,
+                    profiler=profiler,
+                )
+            return {
+                "top_matches": top_matches,
+                "profiler": profiler,
+                "matched_frames": (df1, df2),
+                "prune_report": prune_report,
+                "from_cache": from_cache,
+            }
+
+        st.session_state.match_job = MatchJob(
+            run_matching,
+            # The exact joins only score the pairs the estimate counts, not the full index
+            total_pairs=(
+                cost["candidate_pairs"]
+                if num_pairs is None or uses_exact_join(col_info, index_info)
+                else num_pairs
+            ),
+        ).start()
+        st.session_state.match_outcome = None
+        st.rerun()
+
+    if match_job is not None:
+        st.progress(
+            match_job.progress,
+            text=f"Matching: {match_job.pairs_done:,} candidate pairs scored in {match_job.elapsed_s:.0f} s",
+        )
+        if st.button("Cancel"):
+            match_job.cancel()
+            st.caption("Cancelling at the end of the chunk being scored...")
+
+    match_outcome = st.session_state.match_outcome
+    if match_outcome is not None:
+        if match_outcome["status"] == "failed":
+            st.error(f"The matching run failed: {match_outcome['error']!r}")
+        elif match_outcome["status"] == "cancelled":
+            st.info(
+                f"The matching run was cancelled after scoring {match_outcome['pairs_done']:,} candidate pairs."
+            )
+        else:
+            if match_outcome["from_cache"]:
+                st.info(
+                    "Reused the similarity scores of an earlier run with the same data and columns."
+                )
+            if match_outcome["prune_report"] is not None:
+                st.subheader("Cascade Pruning")
+                st.write(match_outcome["prune_report"])
+            st.subheader("Top Matches")
+            st.write(st.session_state.top_matches.head())
+
+    if st.session_state.match_profile is not None:
+        profile = st.session_state.match_profile.to_dict()
+        with st.expander("Profiling of the last run"):
+            profilecol1, profilecol2, profilecol3 = st.columns(3)
+            with profilecol1:
+                st.metric("Wall time", f"{profile['total_wall_s']:.2f} s")
+            with profilecol2:
+                st.metric("CPU time", f"{profile['total_cpu_s']:.2f} s")
+            with profilecol3:
+                st.metric(
+                    "Peak allocation",
+                    "n/a"
+                    if profile["peak_alloc_mb"] is None
+                    else f"{profile['peak_alloc_mb']:.1f} MB",
+                )
+            st.caption(
+                "Nested stages are indented, and their times are included in the stage above them. Stages run several times, such as the scoring of every chunk, are summed over their calls. Stages run by worker processes are timed as a whole."
+            )
+            profile_frame = st.session_state.match_profile.to_frame()
+            profile_frame.index = [
+                "\u2003" * depth + stage
+                for stage, depth in zip(profile_frame.index, profile_frame["depth"])
+            ]
+            st.dataframe(profile_frame.drop(columns="depth"))
+            st.download_button(
+                "Download profile (JSON)",
+                st.session_state.match_profile.to_json(indent=2),
+                file_name="match_profile.json",
+                mime="application/json",
+            )
+
+    ##poll the running job, so its progress is shown and its result picked up when it is done
+    if st.session_state.match_job is not None:
+        time.sleep(JOB_POLL_S)
+        st.rerun()
 
 
 matching_process_page()
@@ -0,0 +1,157 @@
+import streamlit as st
+
+# Import your functions
+from utils.data_cluster import cluster_entities
+from utils.data_merge import SURVIVORSHIP_RULES, merge_golden_records, pair_entities
+
+
+if "top_matches" not in st.session_state:
+    st.session_state.top_matches = None
+if "matched_frames" not in st.session_state:
+    st.session_state.matched_frames = None
+if "golden_records" not in st.session_state:
+    st.session_state.golden_records = None
+if "golden_records_csv" not in st.session_state:
+    st.session_state.golden_records_csv = None
+
+
+def merging_process_page():
+    st.header("Merging Process")
+
+    # Check if matches exist for the current DataFrames
+    if st.session_state.top_matches is None:
+        st.warning("Please run the matching process in the Match page first.")
+        return
+    df1, df2 = st.session_state.matched_frames
+    if df1 is not st.session_state.df1_final or df2 is not st.session_state.df2_final:
+        st.warning(
+            "The DataFrames changed since the last matching process, please run it again in the Match page."
+        )
+        return
+
+    st.write("Matched pairs:")
+    st.write(st.session_state.top_matches.head(3))
+
+    # Entity resolution
+    st.subheader("Entity Resolution")
+    entitycol1, entitycol2, entitycol3, entitycol4 = st.columns(4)
+    with entitycol1:
+        resolution = st.radio(
+            "Entities",
+            ["One to one pairs", "Transitive clusters"],
+            key="resolution",
+            help="One to one pairs keep the most similar pair of every record. Transitive clusters put all the records linked by a chain of matched pairs in one entity.",
+        )
+    with entitycol2:
+        max_cluster_size = st.number_input(
+            "Maximum records per entity (leave empty for no limit)",
+            min_value=2,
+            value=None,
+            step=1,
+            disabled=resolution != "Transitive clusters",
+            help="Larger clusters are split by dropping their weakest matched pairs.",
+        )
+
+    # Survivorship rules
+    st.subheader("Survivorship Rules")
+    recencycol1, recencycol2, recencycol3 = st.columns(3)
+    with recencycol1:
+        recency_name1 = st.selectbox(
+            "Last update column in DataFrame 1",
+            [None] + list(df1.columns),
+            index=list(df1.columns).index("timestamp") + 1
+            if "timestamp" in df1.columns
+            else 0,
+            key="recency1",
+        )
+    with recencycol2:
+        recency_name2 = st.selectbox(
+            "Last update column in DataFrame 2",
+            [None] + list(df2.columns),
+            index=list(df2.columns).index("timestamp") + 1
+            if "timestamp" in df2.columns
+            else 0,
+            key="recency2",
+        )
+    with recencycol3:
+        source_priority = st.radio(
+            "Most trusted DataFrame",
+            ["DataFrame 1", "DataFrame 2"],
+            key="source_priority",
+            help="Breaks the ties of every rule after the last update, and chooses the values of the source_priority rule.",
+        )
+    if recency_name1 is None and recency_name2 is None:
+        recency = None
+        rules = [rule for rule in SURVIVORSHIP_RULES if rule != "most_recent"]
+    else:
+        recency = {"name1": recency_name1, "name2": recency_name2}
+        rules = SURVIVORSHIP_RULES
+
+    st.divider()
+    mergeselectcol1, mergeselectcol2, mergeselectcol3 = st.columns(3)
+    merge_info = []
+    for i, col_name1 in enumerate(df1.columns):
+        with mergeselectcol1:
+            st.write(f"Column {i+1}: {col_name1}")
+        with mergeselectcol2:
+            col_name2 = st.selectbox(
+                f"Column {i+1} in DataFrame 2",
+                [None] + list(df2.columns),
+                index=list(df2.columns).index(col_name1) + 1
+                if col_name1 in df2.columns
+                else 0,
+                key=f"merge2_{i}",
+            )
+        with mergeselectcol3:
+            rule = st.selectbox(
+                f"Survivorship rule for Column {i+1}",
+                rules,
+                key=f"rule_{i}",
+            )
+        merge_info.append(
+            {"name": col_name1, "name1": col_name1, "name2": col_name2, "rule": rule}
+        )
+
+    # Merging process
+    if st.button("Run Merging Process"):
+        if resolution == "Transitive clusters":
+            entity1, entity2 = cluster_entities(
+                st.session_state.top_matches, df1, df2, max_cluster_size
+            )
+        else:
+            entity1, entity2 = pair_entities(st.session_state.top_matches, df1, df2)
+        st.session_state.golden_records = merge_golden_records(
+            df1,
+            df2,
+            entity1,
+            entity2,
+            merge_info,
+            recency=recency,
+            source_priority=(1, 2) if source_priority == "DataFrame 1" else (2, 1),
+        )
+        ##encoded once, not on every rerun of the page
+        st.session_state.golden_records_csv = (
+            st.session_state.golden_records.to_csv().encode()
+        )
+
+    if st.session_state.golden_records is not None:
+        golden_records = st.session_state.golden_records
+        st.subheader("Golden Records")
+        goldencol1, goldencol2, goldencol3, goldencol4 = st.columns(4)
+        with goldencol1:
+            st.metric("Golden records", f"{len(golden_records):,}")
+        with goldencol2:
+            st.metric(
+                "Golden records merging several records",
+                f"{int((golden_records['num_records'] > 1).sum()):,}",
+            )
+        st.write(golden_records.head())
+        st.download_button(
+            "Download golden records",
+            st.session_state.golden_records_csv,
+            file_name="golden_records.csv",
+            mime="text/csv",
+        )
+
+
+merging_process_page()
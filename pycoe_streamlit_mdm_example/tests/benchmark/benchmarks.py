@@ -0,0 +1,392 @@
+"""Benchmark cases of the generation, error-injection and matching hot paths
+
+Every case runs once in a fresh process, so its peak RSS only covers the case. The inputs are
+generated from fixed seeds, so every run of a case at a given size scores the same pairs.
+
+    python -m tests.benchmark.benchmarks --rows 1000 10000
+
+prints the measurements of every case, and `--update-baseline` stores them as the baseline
+checked by `test_benchmarks.py`.
+"""
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from utils.data_match import calc_match_scores, get_top_matches
+from utils.gen_data import (
+    generate_fake_data,
+    introduce_format_inconsistencies,
+    introduce_spelling_errors,
+)
+
+BENCHMARK_ROWS = [1_000, 10_000, 100_000, 1_000_000]
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# The generated data must not depend on the day the benchmarks run
+END_DATE = datetime.date(2024, 1, 1)
+
+# Wall time and memory over the baseline always allowed, as they are within the noise of a run
+MIN_WALL_TIME_S = 0.05
+MIN_RSS_MB = 20
+
+COMPARATOR_METHODS = [
+    "exact",
+    "jaro",
+    "jarowinkler",
+    "levenshtein",
+    "damerau_levenshtein",
+    "qgram",
+    "cosine",
+    "smith_waterman",
+    "lcs",
+]
+
+# The candidate pairs of the comparator cases, about one pair per record at every size
+BENCHMARK_BLOCKING = {
+    "method": "block",
+    "keys": [
+        {"name1": "address", "name2": "address", "key": "postcode"},
+        {"name1": "name", "name2": "name", "key": "surname_prefix", "n_chars": 2},
+    ],
+}
+
+# The indexing strategies benchmarked, with the largest number of rows they are run on. The full
+# index pairs every record with every other one, so it is only run on the smallest size. The
+# q-gram index multiplies sparse matrices whose product grows with the square of the rows sharing
+# common q-grams, and takes over an hour on 1M rows. The MinHash index holds the signatures and
+# band keys of every record, which need more than 5 GB of memory on 1M rows.
+INDEXERS = [
+    {"name": "full", "index_info": {"method": "full"}, "max_rows": 1_000},
+    {"name": "block", "index_info": BENCHMARK_BLOCKING, "max_rows": None},
+    {
+        "name": "sortedneighbourhood",
+        "index_info": {
+            "method": "sortedneighbourhood",
+            "keys": [{"name1": "name", "name2": "name", "key": "normalised"}],
+            "window": 5,
+        },
+        "max_rows": None,
+    },
+    {
+        "name": "qgram",
+        "index_info": {
+            "method": "qgram",
+            "keys": [{"name1": "name", "name2": "name"}],
+            "min_similarity": 0.5,
+            "top_k": 10,
+        },
+        "max_rows": 100_000,
+    },
+    {
+        "name": "minhash",
+        # Fewer, longer bands than the default, so only near duplicates pair on 1M rows
+        "index_info": {
+            "method": "minhash",
+            "keys": [{"name1": "name", "name2": "name"}],
+            "bands": 10,
+            "rows": 6,
+        },
+        "max_rows": 100_000,
+    },
+]
+
+TOP_MATCHES_COL_INFO = [
+    {"name1": "name", "name2": "name", "ExactCompare": False, "method": "jarowinkler"},
+    {"name1": "address", "name2": "address", "ExactCompare": False, "method": "levenshtein"},
+    {"name1": "email", "name2": "email", "ExactCompare": True, "method": None},
+]
+
+
+def _col_info(method) -> list:
+    """Compare the names with a comparator method."""
+    return [
+        {
+            "name1": "name",
+            "name2": "name",
+            "ExactCompare": method == "exact",
+            "method": None if method == "exact" else method,
+        }
+    ]
+
+
+def benchmark_cases() -> list:
+    """
+    List the benchmark cases.
+
+    Returns:
+        list: One dictionary per case, with its 'name', the 'function' of this module it runs,
+        the keyword arguments 'kwargs' of the function and the largest number of rows
+        'max_rows' it is run on (None for no limit).
+    """
+    cases = [
+        {"name": "generate_fake_data", "function": "run_generate", "kwargs": {}, "max_rows": None},
+        {
+            "name": "introduce_spelling_errors",
+            "function": "run_spelling_errors",
+            "kwargs": {},
+            "max_rows": None,
+        },
+        {
+            "name": "introduce_format_inconsistencies",
+            "function": "run_format_inconsistencies",
+            "kwargs": {},
+            "max_rows": None,
+        },
+    ]
+    for method in COMPARATOR_METHODS:
+        cases.append(
+            {
+                "name": f"calc_match_scores[{method}]",
+                "function": "run_match_scores",
+                "kwargs": {"col_info": _col_info(method), "index_info": BENCHMARK_BLOCKING},
+                "max_rows": None,
+            }
+        )
+    for indexer in INDEXERS:
+        cases.append(
+            {
+                "name": f"calc_match_scores[index={indexer['name']}]",
+                "function": "run_match_scores",
+                "kwargs": {
+                    "col_info": _col_info("jarowinkler"),
+                    "index_info": indexer["index_info"],
+                },
+                "max_rows": indexer["max_rows"],
+            }
+        )
+    cases.append(
+        {"name": "get_top_matches", "function": "run_top_matches", "kwargs": {}, "max_rows": None}
+    )
+    return cases
+
+
+def case_key(case, rows) -> str:
+    """Return the key of the measurements of a case at a size in the baseline."""
+    return f"{case['name']}@{rows}"
+
+
+def generate_inputs(path, rows) -> None:
+    """
+    Generate the seeded inputs of the matching cases and write them to a directory.
+
+    Args:
+        path (str): The directory, holding 'df1.parquet', the generated records, and
+            'df2.parquet', the same records with spelling errors and format inconsistencies.
+        rows (int): The number of records.
+    """
+    df1 = generate_fake_data(rows, seed=0, end_date=END_DATE)
+    df2 = introduce_format_inconsistencies(
+        introduce_spelling_errors(df1, error_rate=0.05, seed=1), seed=2
+    )
+    os.makedirs(path, exist_ok=True)
+    df1.to_parquet(os.path.join(path, "df1.parquet"))
+    df2.to_parquet(os.path.join(path, "df2.parquet"))
+
+
+def _read_inputs(path) -> tuple:
+    return (
+        pd.read_parquet(os.path.join(path, "df1.parquet")),
+        pd.read_parquet(os.path.join(path, "df2.parquet")),
+    )
+
+
+def run_generate(rows, inputs_path) -> tuple:
+    """
+    Time `generate_fake_data`.
+
+    Every `run_*` function of a case prepares its inputs and returns the function timed and
+    the number of rows or pairs it processes, None for the length of the result.
+    """
+    return lambda: generate_fake_data(rows, seed=0, end_date=END_DATE), rows
+
+
+def run_spelling_errors(rows, inputs_path) -> tuple:
+    """Time `introduce_spelling_errors` on the generated records."""
+    df1, _ = _read_inputs(inputs_path)
+    return lambda: introduce_spelling_errors(df1, error_rate=0.05, seed=1), rows
+
+
+def run_format_inconsistencies(rows, inputs_path) -> tuple:
+    """Time `introduce_format_inconsistencies` on the generated records."""
+    df1, _ = _read_inputs(inputs_path)
+    return lambda: introduce_format_inconsistencies(df1, seed=2), rows
+
+
+def run_match_scores(rows, inputs_path, col_info, index_info) -> tuple:
+    """Time `calc_match_scores` on the generated records and their errored copy."""
+    df1, df2 = _read_inputs(inputs_path)
+    return lambda: calc_match_scores(df1, df2, col_info, index_info), None
+
+
+def run_top_matches(rows, inputs_path) -> tuple:
+    """Time `get_top_matches` on the pairs of the benchmark blocks."""
+    df1, df2 = _read_inputs(inputs_path)
+    scores = calc_match_scores(df1, df2, TOP_MATCHES_COL_INFO, BENCHMARK_BLOCKING)
+    return (
+        lambda: get_top_matches(scores, df1, df2, [0.4, 0.3, 0.3], 0.5, top_n=3),
+        len(scores),
+    )
+
+
+def _peak_rss_mb() -> float:
+    """Return the peak resident set size of the process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def _measure(function, kwargs, rows, inputs_path) -> dict:
+    """Run a case in the current process, see `run_case`."""
+    run, num_items = globals()[function](rows=rows, inputs_path=inputs_path, **kwargs)
+    # Run once: a second run would reuse the indexes and normalised columns cached by the first
+    rss_before = _peak_rss_mb()
+    start = time.perf_counter()
+    result = run()
+    wall_time = time.perf_counter() - start
+    if num_items is None:
+        num_items = len(result)
+    measurements = {
+        "wall_time_s": wall_time,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+    measurements["run_rss_mb"] = measurements["peak_rss_mb"] - rss_before
+    if function in ("run_match_scores", "run_top_matches"):
+        measurements["pairs"] = num_items
+        measurements["pairs_per_sec"] = num_items / wall_time
+    else:
+        measurements["rows_per_sec"] = num_items / wall_time
+    return measurements
+
+
+def run_case(case, rows, inputs_path) -> dict:
+    """
+    Run a benchmark case in a fresh process.
+
+    Args:
+        case (dict): The case, see `benchmark_cases`.
+        rows (int): The number of rows.
+        inputs_path (str): The directory of the inputs written by `generate_inputs`.
+
+    Returns:
+        dict: The 'wall_time_s' of the case, the 'peak_rss_mb' of the process, the
+        'run_rss_mb' the timed run added to the peak of the process once its inputs were read,
+        and the 'pairs' scored and 'pairs_per_sec' of the matching cases or the 'rows_per_sec'
+        of the generation cases.
+
+    The process is spawned rather than forked, so it holds none of the memory of the caller.
+    The inputs are read before the case is timed, but are part of its peak RSS.
+    """
+    with ProcessPoolExecutor(
+        max_workers=1, mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        return pool.submit(
+            _measure, case["function"], case["kwargs"], rows, inputs_path
+        ).result()
+
+
+def load_baseline(path=BASELINE_PATH) -> dict:
+    """Load the stored measurements by `case_key`, empty if there is no baseline."""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(baseline, path=BASELINE_PATH) -> None:
+    """Store the measurements by `case_key`."""
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def find_regressions(measurements, baseline, time_tolerance=0.5, rss_tolerance=0.25) -> list:
+    """
+    Compare the measurements of a case with its baseline.
+
+    Args:
+        measurements (dict): The measurements, see `run_case`.
+        baseline (dict): The baseline measurements of the same case and size.
+        time_tolerance (float, optional): The share by which the wall time may exceed the
+            baseline. Default is 0.5.
+        rss_tolerance (float, optional): The share by which the peak RSS may exceed the
+            baseline. Default is 0.25.
+
+    Returns:
+        list: A message per regression, empty if there is none.
+
+    Wall times up to `MIN_WALL_TIME_S` and memory up to `MIN_RSS_MB` over the tolerance are
+    always allowed. A different number of pairs means
+    the inputs or the indexing changed, so the case is not compared with its baseline.
+    """
+    if measurements.get("pairs") != baseline.get("pairs"):
+        return [
+            f"scored {measurements.get('pairs')} pairs instead of {baseline.get('pairs')}, "
+            "the baseline must be updated"
+        ]
+    regressions = []
+    allowed_time = baseline["wall_time_s"] * (1 + time_tolerance) + MIN_WALL_TIME_S
+    if measurements["wall_time_s"] > allowed_time:
+        regressions.append(
+            f"wall time {measurements['wall_time_s']:.3f}s over {allowed_time:.3f}s "
+            f"(baseline {baseline['wall_time_s']:.3f}s)"
+        )
+    allowed_rss = baseline["peak_rss_mb"] * (1 + rss_tolerance) + MIN_RSS_MB
+    if measurements["peak_rss_mb"] > allowed_rss:
+        regressions.append(
+            f"peak RSS {measurements['peak_rss_mb']:.0f}MB over {allowed_rss:.0f}MB "
+            f"(baseline {baseline['peak_rss_mb']:.0f}MB)"
+        )
+    return regressions
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=BENCHMARK_ROWS[:2])
+    parser.add_argument("--cases", nargs="+", help="Run only the cases with these names.")
+    parser.add_argument(
+        "--inputs", default=os.path.join(tempfile.gettempdir(), "mdm_benchmark_inputs")
+    )
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    baseline = load_baseline()
+    for rows in args.rows:
+        inputs_path = os.path.join(args.inputs, str(rows))
+        if not os.path.exists(os.path.join(inputs_path, "df2.parquet")):
+            generate_inputs(inputs_path, rows)
+        for case in benchmark_cases():
+            if args.cases and case["name"] not in args.cases:
+                continue
+            if case["max_rows"] is not None and rows > case["max_rows"]:
+                continue
+            measurements = run_case(case, rows, inputs_path)
+            key = case_key(case, rows)
+            regressions = []
+            if key in baseline:
+                regressions = find_regressions(measurements, baseline[key])
+            print(
+                f"{key:<55} {measurements['wall_time_s']:>9.3f}s "
+                f"{measurements['peak_rss_mb']:>8.0f}MB "
+                f"{measurements.get('pairs_per_sec', measurements.get('rows_per_sec')):>14,.0f}/s "
+                + ("; ".join(regressions) if regressions else ""),
+                flush=True,
+            )
+            if args.update_baseline:
+                baseline[key] = measurements
+    if args.update_baseline:
+        save_baseline(baseline)
+
+
+if __name__ == "__main__":
+    main()
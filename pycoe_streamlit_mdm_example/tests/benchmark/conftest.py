@@ -0,0 +1,42 @@
+"""Allow configuration of the benchmark sizes and baseline"""
+
+import pytest
+
+from tests.benchmark.benchmarks import generate_inputs, load_baseline, save_baseline
+
+
+def pytest_addoption(parser):
+    """Add options for the benchmarks"""
+    parser.addoption(
+        "--benchmark-rows",
+        action="store",
+        default="1000",
+        help="Comma separated numbers of rows, e.g. 1000,10000,100000,1000000",
+    )
+    parser.addoption("--update-baseline", action="store_true", default=False)
+    parser.addoption("--time-tolerance", action="store", type=float, default=0.5)
+    parser.addoption("--rss-tolerance", action="store", type=float, default=0.25)
+
+
+def pytest_generate_tests(metafunc):
+    """Run the benchmarks at every requested size"""
+    if "rows" in metafunc.fixturenames:
+        rows = [int(r) for r in metafunc.config.getoption("--benchmark-rows").split(",")]
+        metafunc.parametrize("rows", rows, scope="module")
+
+
+@pytest.fixture(scope="module")
+def inputs_path(tmp_path_factory, rows):
+    """Generate the seeded inputs once per size"""
+    path = str(tmp_path_factory.mktemp(f"inputs_{rows}"))
+    generate_inputs(path, rows)
+    return path
+
+
+@pytest.fixture(scope="session")
+def baseline(request):
+    """Load the stored baseline, and store the updated one at the end of the session"""
+    stored = load_baseline()
+    yield stored
+    if request.config.getoption("--update-baseline"):
+        save_baseline(stored)
@@ -0,0 +1,29 @@
+"""Check the wall time and peak memory of the hot paths against the stored baseline"""
+
+import pytest
+
+from tests.benchmark.benchmarks import benchmark_cases, case_key, find_regressions, run_case
+
+CASES = benchmark_cases()
+
+
+@pytest.mark.parametrize("case", CASES, ids=[case["name"] for case in CASES])
+def test_benchmark(request, case, rows, inputs_path, baseline):
+    if case["max_rows"] is not None and rows > case["max_rows"]:
+        pytest.skip(f"{case['name']} is only run on up to {case['max_rows']:,} rows")
+    measurements = run_case(case, rows, inputs_path)
+    key = case_key(case, rows)
+    print(key, measurements)
+
+    if request.config.getoption("--update-baseline"):
+        baseline[key] = measurements
+        return
+    if key not in baseline:
+        pytest.skip(f"There is no baseline for {key}, run with --update-baseline to store one")
+    regressions = find_regressions(
+        measurements,
+        baseline[key],
+        request.config.getoption("--time-tolerance"),
+        request.config.getoption("--rss-tolerance"),
+    )
+    assert not regressions, f"{key} regressed: " + "; ".join(regressions)
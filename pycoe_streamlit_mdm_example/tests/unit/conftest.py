@@ -0,0 +1,13 @@
+"""Fixtures shared by the unit tests"""
+
+import pytest
+
+from utils.gen_data import generate_fake_data, introduce_spelling_errors
+
+
+@pytest.fixture(scope="session")
+def frames():
+    """A DataFrame and a copy of it with spelling errors"""
+    df1 = generate_fake_data(300, seed=1)
+    df2 = introduce_spelling_errors(df1, error_rate=0.1, seed=2)
+    return df1, df2
@@ -0,0 +1,101 @@
+"""Check the content hashes and the memory budget of the caches"""
+
+import sys
+import threading
+
+import pandas as pd
+
+from utils.data_cache import LRUCache, hash_config, hash_frame, match_cache_key
+from utils.data_match import cached_match_scores, calc_match_scores
+from utils.gen_data import generate_fake_data
+
+COL_INFO = [{"name1": "name", "name2": "name", "ExactCompare": False, "method": "jarowinkler"}]
+
+BLOCKING = {"method": "block", "keys": [{"name1": "name", "name2": "name", "key": "prefix"}]}
+
+
+def test_hash_frame_depends_on_the_contents():
+    df = pd.DataFrame({"a": [1, 2], "b": ["x", "y"]})
+    assert hash_frame(df) == hash_frame(df.copy())
+    assert hash_frame(df) != hash_frame(df.assign(b=["x", "z"]))
+    assert hash_frame(df) != hash_frame(df.set_axis([5, 6]))
+    assert hash_frame(df) != hash_frame(df.astype({"a": float}))
+    assert hash_frame(df) != hash_frame(df.rename(columns={"b": "c"}))
+
+
+def test_hash_config_ignores_the_order_of_keys():
+    assert hash_config({"method": "block", "keys": [1]}) == hash_config(
+        {"keys": [1], "method": "block"}
+    )
+    assert hash_config({"window": 3}) != hash_config({"window": 5})
+    assert hash_config(None) == hash_config(None)
+
+
+def test_lru_cache_evicts_the_least_recently_used_values():
+    cache = LRUCache(max_bytes=30)
+    cache.put("a", "A", nbytes=10)
+    cache.put("b", "B", nbytes=10)
+    cache.put("c", "C", nbytes=10)
+    assert cache.get("a") == "A"
+    cache.put("d", "D", nbytes=10)
+    assert "b" not in cache
+    assert [key for key in "acd" if key in cache] == ["a", "c", "d"]
+    assert cache.nbytes == 30
+
+
+def test_lru_cache_skips_values_over_budget_and_replaces_keys():
+    cache = LRUCache(max_bytes=30)
+    cache.put("a", "A", nbytes=10)
+    cache.put("big", "B", nbytes=31)
+    assert "big" not in cache
+    cache.put("a", "A2", nbytes=20)
+    assert cache.get("a") == "A2"
+    assert cache.nbytes == 20
+    assert cache.pop("a") == "A2"
+    assert cache.nbytes == 0
+    assert cache.get("a", "missing") == "missing"
+
+
+def test_lru_cache_can_be_shared_by_threads():
+    # A budget of two values, so that every put evicts a value another thread may be reading
+    cache = LRUCache(max_bytes=8)
+    errors = []
+
+    def use_cache(worker):
+        try:
+            for i in range(100_000):
+                cache.put(i % 4, i, nbytes=4)
+                cache.get((i + worker) % 4)
+                if i % 7 == 0:
+                    cache.pop((i + worker + 1) % 4)
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=use_cache, args=(worker,)) for worker in range(4)]
+    # Switch threads as often as possible, so that unlocked operations would interleave
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+    assert errors == []
+    assert cache.nbytes == 4 * len(cache) <= 8
+
+
+def test_cached_match_scores_reuse_earlier_runs():
+    df1 = generate_fake_data(50, seed=1)
+    df2 = generate_fake_data(50, seed=2)
+    cache = LRUCache()
+    first, from_cache = cached_match_scores(cache, df1, df2, COL_INFO, BLOCKING)
+    assert not from_cache
+    second, from_cache = cached_match_scores(cache, df1, df2, COL_INFO, BLOCKING)
+    assert from_cache
+    assert second is first
+    assert match_cache_key(df1, df2, COL_INFO, BLOCKING) in cache
+    pd.testing.assert_frame_equal(first, calc_match_scores(df1, df2, COL_INFO, BLOCKING))
+    _, from_cache = cached_match_scores(cache, df1, df2.iloc[1:], COL_INFO, BLOCKING)
+    assert not from_cache
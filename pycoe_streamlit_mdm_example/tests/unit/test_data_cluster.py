@@ -0,0 +1,61 @@
+"""Check the clustering of matched pairs into entities and the splitting of large clusters"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.data_cluster import cluster_entities, cluster_pairs
+
+
+def _clusters(labels) -> list:
+    """The clusters of nodes, as sorted lists of nodes, whatever their numbering"""
+    return sorted(sorted(np.flatnonzero(labels == label).tolist()) for label in np.unique(labels))
+
+
+def test_connected_nodes_share_a_cluster():
+    labels = cluster_pairs(6, [0, 1, 4], [1, 2, 4])
+    assert _clusters(labels) == [[0, 1, 2], [3], [4], [5]]
+    assert labels.min() == 0
+
+
+def test_large_clusters_are_cut_at_their_weakest_links():
+    # Two triangles joined by a weak edge, and a repeated edge that must not add up
+    left = [0, 1, 2, 3, 4, 5, 2, 0]
+    right = [1, 2, 0, 4, 5, 3, 3, 1]
+    weights = [0.9, 0.8, 0.85, 0.9, 0.8, 0.85, 0.5, 0.1]
+    labels = cluster_pairs(6, left, right, weights, max_cluster_size=3)
+    assert _clusters(labels) == [[0, 1, 2], [3, 4, 5]]
+    assert _clusters(cluster_pairs(6, left, right, weights)) == [[0, 1, 2, 3, 4, 5]]
+
+
+def test_chains_are_split_until_every_cluster_fits():
+    rng = np.random.default_rng(1)
+    left = np.arange(99)
+    labels = cluster_pairs(100, left, left + 1, rng.random(99), max_cluster_size=7)
+    assert np.bincount(labels).max() <= 7
+    # A cluster is only split where needed, so the chain is cut into few clusters
+    assert len(np.unique(labels)) < 100 // 7 * 2
+
+
+def test_cluster_size_is_validated():
+    with pytest.raises(ValueError, match="at least 1"):
+        cluster_pairs(2, [0], [1], max_cluster_size=0)
+
+
+def test_entities_resolve_pairs_transitively():
+    df1 = pd.DataFrame({"name": ["a", "b", "c"]}, index=[10, 11, 12])
+    df2 = pd.DataFrame({"name": ["a", "a2", "d"]}, index=[20, 21, 22])
+    top_matches = pd.DataFrame(
+        {"level_0": [10, 10, 11], "level_1": [20, 21, 21], "overall_similarity": [0.9, 0.8, 0.6]}
+    )
+    entity1, entity2 = cluster_entities(top_matches, df1, df2)
+    assert entity1.dtype == np.int64
+    assert entity1[0] == entity1[1] == entity2[0] == entity2[1]
+    assert len({entity1[0], entity1[2], entity2[2]}) == 3
+
+    entity1, entity2 = cluster_entities(top_matches, df1, df2, max_cluster_size=3)
+    assert entity1[0] == entity2[0] == entity2[1]
+    assert entity1[1] != entity1[0]
+
+    with pytest.raises(ValueError, match="not in the DataFrames"):
+        cluster_entities(top_matches.assign(level_1=[20, 21, 99]), df1, df2)
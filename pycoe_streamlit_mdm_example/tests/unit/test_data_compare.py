@@ -0,0 +1,118 @@
+"""Check that the comparator backends compute the same string similarities as recordlinkage"""
+
+import numpy as np
+import pandas as pd
+import pytest
+import recordlinkage as rl
+
+from utils.data_cache import LRUCache
+from utils.data_compare import RAPIDFUZZ_METHODS, MemoisedString
+
+METHODS = [
+    "jaro",
+    "jarowinkler",
+    "levenshtein",
+    "damerau_levenshtein",
+    "qgram",
+    "cosine",
+    "smith_waterman",
+    "lcs",
+]
+
+EDGE_CASES = [
+    ("", ""),
+    ("", "a"),
+    ("a", ""),
+    ("ab", "ba"),
+    ("abc", "acb"),
+    ("martha", "marhta"),
+    ("dwayne", "duane"),
+    ("Ünïcode", "Unicode"),
+    (None, "a"),
+    ("a", None),
+    (None, None),
+]
+
+
+@pytest.fixture(scope="module")
+def frames(frames):
+    """The shared DataFrames cut down to a few records, with the edge cases of string comparisons"""
+    df1, df2 = (df.iloc[:40][["name", "job"]] for df in frames)
+    df1 = pd.concat(
+        [df1, pd.DataFrame({"name": [a for a, _ in EDGE_CASES], "job": "x"})],
+        ignore_index=True,
+    )
+    df2 = pd.concat(
+        [df2, pd.DataFrame({"name": [b for _, b in EDGE_CASES], "job": "x"})],
+        ignore_index=True,
+    )
+    return df1, df2
+
+
+def recordlinkage_scores(frames, method, **kwargs):
+    """Score all pairs with the recordlinkage string comparison"""
+    df1, df2 = frames
+    pairs = pd.MultiIndex.from_product([df1.index, df2.index])
+    compare_cl = rl.Compare()
+    compare_cl.string("name", "name", method=method, label="name", **kwargs)
+    compare_cl.string("job", "job", method=method, label="job", **kwargs)
+    return compare_cl.compute(pairs, df1, df2)
+
+
+def memoised_scores(frames, method, backend, cache=None, **kwargs):
+    """Score all pairs with the memoised string comparison"""
+    df1, df2 = frames
+    pairs = pd.MultiIndex.from_product([df1.index, df2.index])
+    compare_cl = rl.Compare()
+    for col in ["name", "job"]:
+        compare_cl.add(
+            MemoisedString(
+                col, col, method=method, label=col, cache=cache, backend=backend, **kwargs
+            )
+        )
+    return compare_cl.compute(pairs, df1, df2)
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_recordlinkage_backend_is_identical(frames, method):
+    expected = recordlinkage_scores(frames, method)
+    pd.testing.assert_frame_equal(
+        memoised_scores(frames, method, "recordlinkage"), expected
+    )
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_rapidfuzz_backend_agrees(frames, method):
+    pytest.importorskip("rapidfuzz")
+    expected = recordlinkage_scores(frames, method)
+    pd.testing.assert_frame_equal(
+        memoised_scores(frames, method, "rapidfuzz"), expected, rtol=0, atol=1e-9
+    )
+
+
+@pytest.mark.parametrize("method", list(RAPIDFUZZ_METHODS))
+def test_rapidfuzz_backend_agrees_with_threshold_and_missing_value(frames, method):
+    pytest.importorskip("rapidfuzz")
+    kwargs = {"threshold": 0.8, "missing_value": 0.5}
+    expected = recordlinkage_scores(frames, method, **kwargs)
+    pd.testing.assert_frame_equal(
+        memoised_scores(frames, method, "rapidfuzz", **kwargs), expected
+    )
+
+
+@pytest.mark.parametrize("backend", ["rapidfuzz", "recordlinkage"])
+def test_cached_scores_are_identical(frames, backend):
+    if backend == "rapidfuzz":
+        pytest.importorskip("rapidfuzz")
+    cache = LRUCache()
+    expected = memoised_scores(frames, "jarowinkler", backend)
+    first = memoised_scores(frames, "jarowinkler", backend, cache)
+    second = memoised_scores(frames, "jarowinkler", backend, cache)
+    assert len(cache) > 0
+    pd.testing.assert_frame_equal(first, expected)
+    pd.testing.assert_frame_equal(second, expected)
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        MemoisedString("name", "name", method="jaro", backend="unknown")
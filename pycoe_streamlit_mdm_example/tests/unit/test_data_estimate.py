@@ -0,0 +1,113 @@
+"""Check the estimates of the candidate pairs, runtime and memory of a matching run"""
+
+import pytest
+
+from utils.data_estimate import (
+    DEFAULT_RUN_LIMITS,
+    SELECTION_PAIRS_PER_SEC,
+    check_run_limits,
+    estimate_candidate_pairs,
+    estimate_match_cost,
+)
+from utils.data_index import build_exact_join_index, count_candidate_pairs
+from utils.data_match import BYTES_PER_PAIR, BYTES_PER_PAIR_AND_COLUMN
+
+COL_INFO = [
+    {"name1": "name", "name2": "name", "ExactCompare": False, "method": "jarowinkler"},
+    {"name1": "job", "name2": "job", "ExactCompare": False, "method": "levenshtein"},
+]
+
+INDEXES = [
+    {"method": "block", "keys": [{"name1": "name", "name2": "name", "key": "surname_prefix"}]},
+    {
+        "method": "qgram",
+        "keys": [{"name1": "name", "name2": "name"}],
+        "min_similarity": 0.5,
+        "top_k": 5,
+    },
+]
+
+
+@pytest.mark.parametrize("index_info", INDEXES, ids=lambda info: info["method"])
+def test_pairs_are_counted_exactly_when_the_sample_covers_every_record(frames, index_info):
+    df1, df2 = frames
+    num_pairs = count_candidate_pairs(df1, df2, index_info)
+    estimate = estimate_candidate_pairs(df1, df2, index_info)
+    assert estimate["pairs"] == num_pairs
+    assert estimate["exact"]
+    assert estimate["index_s"] > 0
+
+    sampled = estimate_candidate_pairs(df1, df2, index_info, sample_rows=100)
+    assert not sampled["exact"]
+    assert sampled["pairs"] == pytest.approx(num_pairs, rel=0.5)
+
+
+@pytest.mark.parametrize("index_info", INDEXES, ids=lambda info: info["method"])
+def test_runtime_adds_up_the_stages_of_the_counted_pairs(frames, index_info):
+    df1, df2 = frames
+    estimate = estimate_match_cost(df1, df2, COL_INFO, index_info, sample_rows=len(df1))
+    num_pairs = count_candidate_pairs(df1, df2, index_info)
+    assert estimate["candidate_pairs"] == num_pairs
+    assert estimate["exact"]
+
+    stages = estimate["stages"]
+    assert list(stages) == ["indexing", "scoring", "selection"]
+    assert estimate["runtime_s"] == pytest.approx(sum(stages.values()))
+    assert stages["scoring"] == pytest.approx(
+        sum(num_pairs / pairs_per_sec for pairs_per_sec in estimate["pairs_per_sec"].values())
+    )
+    assert stages["selection"] == pytest.approx(num_pairs / SELECTION_PAIRS_PER_SEC)
+    assert all(seconds > 0 for seconds in stages.values())
+    bytes_per_pair = BYTES_PER_PAIR + BYTES_PER_PAIR_AND_COLUMN * len(COL_INFO)
+    assert estimate["peak_memory_mb"] == pytest.approx(num_pairs * bytes_per_pair / 1024**2)
+
+    # The estimate is cached, and workers divide the scoring time
+    assert estimate_match_cost(df1, df2, COL_INFO, index_info, sample_rows=len(df1)) is estimate
+    parallel = estimate_match_cost(df1, df2, COL_INFO, index_info, n_jobs=2, sample_rows=len(df1))
+    assert parallel["stages"]["scoring"] < stages["scoring"]
+
+
+def test_exact_comparisons_count_the_joined_pairs(frames):
+    df1, df2 = frames
+    col_info = [{"name1": "email", "name2": "email", "ExactCompare": True, "method": "exact"}]
+    estimate = estimate_match_cost(df1, df2, col_info)
+    join = build_exact_join_index(df1, df2, [("email", "email")])
+    assert estimate["candidate_pairs"] == len(join)
+    assert estimate["candidate_pairs"] < len(df1) * len(df2)
+
+
+def test_streamed_runs_hold_two_chunks_per_worker(frames):
+    df1, df2 = frames
+    estimate = estimate_match_cost(df1, df2, COL_INFO, INDEXES[0], chunk_size=10, n_jobs=2)
+    bytes_per_pair = BYTES_PER_PAIR + BYTES_PER_PAIR_AND_COLUMN * len(COL_INFO)
+    assert estimate["peak_memory_mb"] == pytest.approx(40 * bytes_per_pair / 1024**2)
+
+
+@pytest.mark.parametrize(
+    "runtime_s, peak_memory_mb, expected, num_messages",
+    [
+        (1, 1, "ok", 0),
+        (DEFAULT_RUN_LIMITS["warn_runtime_s"] + 1, 1, "warn", 1),
+        (1, DEFAULT_RUN_LIMITS["max_memory_mb"] + 1, "refuse", 1),
+        # A limit refused outranks a limit warned about, but both are explained
+        (
+            DEFAULT_RUN_LIMITS["max_runtime_s"] + 1,
+            DEFAULT_RUN_LIMITS["warn_memory_mb"] + 1,
+            "refuse",
+            2,
+        ),
+    ],
+)
+def test_runs_are_checked_against_the_limits(runtime_s, peak_memory_mb, expected, num_messages):
+    estimate = {"runtime_s": runtime_s, "peak_memory_mb": peak_memory_mb}
+    status, messages = check_run_limits(estimate)
+    assert status == expected
+    assert len(messages) == num_messages
+
+
+def test_limits_override_their_defaults():
+    estimate = {"runtime_s": 10, "peak_memory_mb": 1}
+    status, messages = check_run_limits(estimate, {"warn_runtime_s": 5})
+    assert status == "warn"
+    assert "over 5 s" in messages[0]
+    assert check_run_limits(estimate, {"max_runtime_s": 5})[0] == "refuse"
@@ -0,0 +1,132 @@
+"""Check that the indexing strategies, their chunks and their pair counts agree"""
+
+import pandas as pd
+import pytest
+
+from utils import data_index
+from utils.data_index import (
+    build_candidate_index,
+    build_exact_join_index,
+    count_candidate_pairs,
+    derive_blocking_key,
+    iter_candidate_chunks,
+)
+
+INDEXES = [
+    {"method": "full"},
+    {"method": "block", "keys": [{"name1": "name", "name2": "name", "key": "surname_prefix"}]},
+    {
+        "method": "block",
+        "keys": [
+            {"name1": "address", "name2": "address", "key": "postcode"},
+            {"name1": "name", "name2": "name", "key": "prefix", "n_chars": 1},
+        ],
+    },
+    {
+        "method": "sortedneighbourhood",
+        "keys": [{"name1": "name", "name2": "name", "key": "normalised"}],
+        "window": 5,
+    },
+    {
+        "method": "qgram",
+        "keys": [{"name1": "name", "name2": "name"}],
+        "min_similarity": 0.5,
+        "top_k": 5,
+    },
+    {"method": "minhash", "keys": [{"name1": "name", "name2": "name"}], "bands": 10, "rows": 3},
+]
+
+
+@pytest.mark.parametrize("index_info", INDEXES, ids=lambda info: info["method"])
+def test_count_matches_the_built_index(frames, index_info):
+    df1, df2 = frames
+    candidates = build_candidate_index(df1, df2, index_info)
+    assert count_candidate_pairs(df1, df2, index_info) == len(candidates)
+
+
+@pytest.mark.parametrize("index_info", INDEXES, ids=lambda info: info["method"])
+def test_chunks_add_up_to_the_built_index(frames, index_info):
+    df1, df2 = frames
+    candidates = build_candidate_index(df1, df2, index_info)
+    chunks = list(iter_candidate_chunks(df1, df2, index_info, chunk_size=500))
+    assert all(len(chunk) <= 500 for chunk in chunks)
+    assert pd.MultiIndex.from_tuples(
+        [pair for chunk in chunks for pair in chunk]
+    ).sort_values().equals(candidates.sort_values())
+
+
+def test_blocking_only_pairs_equal_keys(frames):
+    df1, df2 = frames
+    candidates = build_candidate_index(df1, df2, INDEXES[1])
+    surnames1 = derive_blocking_key(df1["name"], "surname_prefix")
+    surnames2 = derive_blocking_key(df2["name"], "surname_prefix")
+    assert len(candidates) > len(df1) // 2
+    assert (
+        surnames1.loc[candidates.get_level_values(0)].to_numpy()
+        == surnames2.loc[candidates.get_level_values(1)].to_numpy()
+    ).all()
+
+
+def test_derived_keys():
+    names = pd.Series(["Dr. Jane Smith Jr.", "  Bob O'Neil", None, ""])
+    assert derive_blocking_key(names, "surname_prefix").tolist() == ["smi", "one", None, None]
+    assert derive_blocking_key(names, "prefix", n_chars=2).tolist() == ["dr", "bo", None, None]
+    phones = pd.Series(["(555) 123-4567 x89", "12", "555.987.6543"])
+    assert derive_blocking_key(phones, "phone_last4").tolist() == ["4567", None, "6543"]
+    addresses = pd.Series(
+        ["1 Main St, Springfield, IL 62704", "10 Downing St, SW1A 2AA", "Nowhere"]
+    )
+    assert derive_blocking_key(addresses, "postcode").tolist() == ["62704", "SW1A2AA", None]
+    with pytest.raises(ValueError):
+        derive_blocking_key(names, "unknown")
+
+
+def test_exact_join_finds_the_pairs_with_an_equal_column(frames):
+    df1, df2 = frames
+    columns = [("email", "email"), ("phone", "phone")]
+    candidates = build_exact_join_index(df1, df2, columns)
+    full = pd.MultiIndex.from_product([df1.index, df2.index])
+    equal = False
+    for name1, name2 in columns:
+        values1 = df1[name1].loc[full.get_level_values(0)].to_numpy()
+        values2 = df2[name2].loc[full.get_level_values(1)].to_numpy()
+        equal = equal | (values1 == values2)
+    assert candidates.equals(full[equal])
+
+
+@pytest.mark.parametrize("window", [0, 4, -1, 2.5])
+def test_sorted_neighbourhood_rejects_even_windows(frames, window):
+    df1, df2 = frames
+    index_info = dict(INDEXES[3], window=window)
+    with pytest.raises(ValueError, match="odd"):
+        build_candidate_index(df1, df2, index_info)
+    with pytest.raises(ValueError, match="odd"):
+        count_candidate_pairs(df1, df2, index_info)
+    with pytest.raises(ValueError, match="odd"):
+        next(iter_candidate_chunks(df1, df2, index_info))
+
+
+@pytest.mark.parametrize("method", ["block", "sortedneighbourhood"])
+def test_chunks_of_a_skewed_block_are_built_within_the_chunk_size(monkeypatch, method):
+    # One block of 300 records on both sides, and 300 records in blocks of their own
+    names = ["Smith"] * 300 + [f"Name{i:03d}" for i in range(300)]
+    df1 = pd.DataFrame({"name": names})
+    df2 = pd.DataFrame({"name": names[::-1]})
+    index_info = {
+        "method": method,
+        "keys": [{"name1": "name", "name2": "name", "key": "normalised"}],
+        "window": 3,
+    }
+    built = []
+    index_keys = data_index._index_keys
+
+    def record_index_keys(*args):
+        candidates = index_keys(*args)
+        built.append(len(candidates))
+        return candidates
+
+    monkeypatch.setattr(data_index, "_index_keys", record_index_keys)
+    chunks = list(iter_candidate_chunks(df1, df2, index_info, chunk_size=1_000))
+    assert max(built) <= 1_000
+    assert sum(built) == sum(len(chunk) for chunk in chunks)
+    assert sum(built) == count_candidate_pairs(df1, df2, index_info)
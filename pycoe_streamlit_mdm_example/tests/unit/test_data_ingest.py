@@ -0,0 +1,141 @@
+"""Check that uploads are read with compact dtypes and can be matched against each other"""
+
+import io
+
+import pandas as pd
+import pytest
+
+from utils.data_cache import LRUCache
+from utils.data_index import build_candidate_index
+from utils.data_ingest import (
+    cached_read_upload,
+    compact_dtypes,
+    memory_summary,
+    read_upload,
+    upload_digest,
+)
+from utils.data_match import cascade_match_scores, calc_match_scores, get_top_matches
+from utils.gen_data import generate_fake_data, introduce_spelling_errors
+
+COL_INFO = [
+    {"name1": "name", "name2": "name", "ExactCompare": False, "method": "jarowinkler"},
+    {"name1": "city", "name2": "city", "ExactCompare": True, "method": "exact"},
+    {"name1": "date", "name2": "date", "ExactCompare": True, "method": "exact"},
+]
+
+INDEXES = [
+    {"method": "full"},
+    {"method": "block", "keys": [{"name1": "city", "name2": "city", "key": "prefix"}]},
+    {
+        "method": "sortedneighbourhood",
+        "keys": [{"name1": "city", "name2": "city", "key": "normalised"}],
+        "window": 3,
+    },
+]
+
+
+@pytest.fixture(scope="module")
+def uploads(tmp_path_factory):
+    """Two CSV uploads with a few shared cities in a different order, so their categories differ"""
+    df1 = generate_fake_data(120, seed=1)[["name", "date"]]
+    df2 = introduce_spelling_errors(df1, error_rate=0.1, seed=2)
+    df1["city"] = ["Springfield", "Shelbyville", "Ogdenville"] * 40
+    df2["city"] = ["Capital City", "Springfield", "Ogdenville", "Shelbyville"] * 30
+    df1["date"] = pd.to_datetime(df1["date"], format="mixed").dt.strftime("%Y-%m-%d")
+    df2["date"] = df1["date"].to_numpy()
+    paths = []
+    for i, df in enumerate([df1, df2]):
+        path = tmp_path_factory.mktemp("uploads") / f"upload{i}.csv"
+        df.to_csv(path, index=False)
+        paths.append(path)
+    return paths
+
+
+def test_read_upload_compacts_the_columns(uploads):
+    df = read_upload(uploads[0], chunk_rows=50)
+    assert len(df) == 120
+    assert isinstance(df["city"].dtype, pd.CategoricalDtype)
+    assert pd.api.types.is_datetime64_any_dtype(df["date"].dtype)
+    assert isinstance(df["name"].dtype, pd.StringDtype)
+    summary = memory_summary(df)
+    assert summary.loc["Total", "memory_mb"] < summary.loc["Total", "default_memory_mb"]
+
+
+def test_compact_dtypes_keeps_partial_dates_as_text():
+    df = compact_dtypes(pd.DataFrame({"date": ["2020-01-02", "soon"], "n": [1, 2]}))
+    assert isinstance(df["date"].dtype, pd.StringDtype)
+    assert df["n"].dtype == "int8"
+
+
+@pytest.mark.parametrize("index_info", INDEXES, ids=lambda info: info["method"])
+def test_uploads_with_different_categories_can_be_matched(uploads, index_info):
+    df1, df2 = (read_upload(path) for path in uploads)
+    assert list(df1["city"].cat.categories) != list(df2["city"].cat.categories)
+    scores = calc_match_scores(df1, df2, COL_INFO, index_info)
+    assert len(scores) > 0
+    assert set(scores["Exact_city, city_similarity"].unique()) <= {0, 1}
+    assert (scores["Exact_date, date_similarity"] == 1).any()
+
+    expected = calc_match_scores(
+        df1.astype({"city": "string"}), df2.astype({"city": "string"}), COL_INFO, index_info
+    )
+    pd.testing.assert_frame_equal(scores, expected, check_dtype=False)
+
+
+@pytest.mark.parametrize("method", ["block", "sortedneighbourhood", "qgram"])
+def test_uploads_can_be_indexed_on_categorical_keys(uploads, method):
+    df1, df2 = (read_upload(path) for path in uploads)
+    index_info = {"method": method, "keys": [{"name1": "city", "name2": "city"}], "window": 3}
+    expected = build_candidate_index(
+        df1.astype({"city": "string"}), df2.astype({"city": "string"}), index_info
+    )
+    assert build_candidate_index(df1, df2, index_info).sort_values().equals(
+        expected.sort_values()
+    )
+
+
+def test_cascade_matches_uploads_with_different_categories(uploads):
+    df1, df2 = (read_upload(path) for path in uploads)
+    weights = [0.5, 0.25, 0.25]
+    scores, _ = cascade_match_scores(df1, df2, COL_INFO, weights, 0.6, INDEXES[1])
+    expected = calc_match_scores(df1, df2, COL_INFO, INDEXES[1])
+    assert len(scores) > 0
+    pd.testing.assert_frame_equal(
+        get_top_matches(scores, df1, df2, weights, 0.6),
+        get_top_matches(expected, df1, df2, weights, 0.6),
+    )
+
+
+def test_cached_read_upload_parses_the_same_bytes_once(uploads):
+    cache = LRUCache()
+    upload_hashes = {}
+    first, digest = cached_read_upload(cache, uploads[0], upload_hashes)
+    second, second_digest = cached_read_upload(cache, str(uploads[0]), upload_hashes)
+    assert second is first
+    assert second_digest == digest
+    third, _ = cached_read_upload(cache, uploads[1], upload_hashes)
+    assert third is not first
+
+
+def test_uploads_evicted_from_the_cache_keep_their_digest(uploads):
+    cache = LRUCache(max_bytes=1)
+    first, digest = cached_read_upload(cache, uploads[0])
+    second, second_digest = cached_read_upload(cache, uploads[0])
+    assert second is not first
+    assert second_digest == digest
+    pd.testing.assert_frame_equal(second, first)
+
+
+def test_upload_digests_are_reused_by_file_id(uploads):
+    def upload(path):
+        file = io.BytesIO(path.read_bytes())
+        file.name = path.name
+        file.file_id = "file-1"
+        return file
+
+    upload_hashes = {}
+    digest = upload_digest(upload(uploads[0]), upload_hashes)
+    assert upload_hashes == {"file-1": digest}
+    assert digest == upload_digest(uploads[0])
+    # The bytes of an upload with a known file id are not hashed again
+    assert upload_digest(upload(uploads[1]), upload_hashes) == digest
@@ -0,0 +1,62 @@
+"""Check that background matching jobs report their progress, finish, fail and can be cancelled"""
+
+import threading
+
+import pandas as pd
+import pytest
+
+from utils.data_jobs import MatchJob
+from utils.data_match import calc_match_scores
+from utils.gen_data import generate_fake_data
+
+COL_INFO = [{"name1": "name", "name2": "name", "ExactCompare": False, "method": "jarowinkler"}]
+
+
+def test_job_runs_a_matching_run_in_the_background():
+    df1 = generate_fake_data(100, seed=1)
+    df2 = generate_fake_data(100, seed=2)
+    job = MatchJob(lambda progress: calc_match_scores(df1, df2, COL_INFO, progress=progress))
+    assert job.status == "pending"
+    assert job.progress == 0.0
+    assert job.start().wait(timeout=60) == "done"
+    pd.testing.assert_frame_equal(job.result, calc_match_scores(df1, df2, COL_INFO))
+    assert job.pairs_done == job.total_pairs == len(df1) * len(df2)
+    assert job.progress == 1.0
+    assert job.error is None
+    assert job.elapsed_s > 0
+
+
+def test_job_stops_at_the_next_progress_report_once_cancelled():
+    reported = threading.Event()
+    resume = threading.Event()
+
+    def run(progress):
+        for pairs_done in range(100, 1_000, 100):
+            progress(pairs_done, 1_000)
+            reported.set()
+            resume.wait(timeout=10)
+        return "finished"
+
+    job = MatchJob(run).start()
+    assert reported.wait(timeout=10)
+    assert job.status == "running"
+    assert job.progress == pytest.approx(0.1)
+    job.cancel()
+    resume.set()
+    assert job.wait(timeout=10) == "cancelled"
+    assert job.result is None
+    assert job.error is None
+    assert job.pairs_done == 100
+
+
+def test_job_keeps_the_error_of_a_failed_run():
+    def run(progress):
+        progress(10)
+        raise ValueError("The column 'name' is not in the DataFrame.")
+
+    job = MatchJob(run, total_pairs=100).start()
+    assert job.wait(timeout=10) == "failed"
+    assert isinstance(job.error, ValueError)
+    assert job.result is None
+    assert job.pairs_done == 10
+    assert job.elapsed_s >= 0
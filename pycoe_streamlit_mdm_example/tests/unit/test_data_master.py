@@ -0,0 +1,121 @@
+"""Check that a master store matches batches incrementally and keeps its golden records on disk"""
+
+import os
+
+import pandas as pd
+import pytest
+
+from utils import data_master
+from utils.data_master import MasterStore
+from utils.gen_data import generate_fake_data, introduce_spelling_errors
+
+COL_INFO = [
+    {
+        "name1": "name",
+        "name2": "name",
+        "ExactCompare": False,
+        "method": "jarowinkler",
+        "normalise": "name",
+    },
+    {"name1": "email", "name2": "email", "ExactCompare": True, "method": "exact"},
+]
+
+INDEXES = [
+    {"method": "block", "keys": [{"name1": "name", "name2": "name", "key": "surname_prefix"}]},
+    {"method": "qgram", "keys": [{"name1": "name", "name2": "name"}], "min_similarity": 0.3},
+]
+
+
+@pytest.fixture(scope="module")
+def records():
+    """A master with parsed dates, and a batch of misspelt known people and of strangers"""
+    people = generate_fake_data(300, seed=1)
+    master = people.iloc[:200].copy()
+    master["date"] = pd.to_datetime(master["date"], format="mixed")
+    known = people.iloc[:50].copy()
+    known["name"] = introduce_spelling_errors(known, error_rate=0.03, seed=2)["name"]
+    batch = pd.concat([known, people.iloc[250:]])
+    return master, batch
+
+
+@pytest.mark.parametrize("index_info", INDEXES, ids=lambda info: info["method"])
+def test_batches_round_trip_through_the_store(tmp_path, records, index_info):
+    master, batch = records
+    path = str(tmp_path / "master")
+    store = MasterStore.create(path, master, COL_INFO, index_info)
+    assert store.num_records == len(master)
+    assert len(store.golden_records()) == len(master)
+
+    result = store.match_batch(batch, [0.5, 0.5], 0.6)
+    assert result.index.equals(batch.index)
+    assert sorted(result["record_id"]) == list(range(200, 200 + len(batch)))
+    known = result.loc[batch.index[:50]]
+    assert known["matched_record_id"].notna().mean() > 0.8
+    matched = known.dropna(subset=["matched_record_id"])
+    assert (matched["entity_id"] == matched["matched_record_id"]).mean() > 0.9
+    assert result.loc[batch.index[50:], "matched_record_id"].isna().all()
+    assert (result.loc[batch.index[50:], "entity_id"] >= len(master)).all()
+
+    reopened = MasterStore(path)
+    assert reopened.num_records == len(master) + len(batch)
+    stored = reopened.records()
+    assert pd.api.types.is_datetime64_any_dtype(stored["date"].dtype)
+    assert stored["date"].notna().all()
+
+    golden = reopened.golden_records()
+    assert pd.api.types.is_datetime64_any_dtype(golden["date"].dtype)
+    assert golden.index.is_unique
+    assert golden["num_records"].sum() == reopened.num_records
+    assert len(golden) == len(master) + len(batch) - len(matched)
+
+    second = reopened.match_batch(batch.iloc[:10], [0.5, 0.5], 0.6)
+    assert second["matched_record_id"].notna().all()
+    assert MasterStore(path).golden_records()["num_records"].sum() == reopened.num_records
+
+
+def test_store_refuses_indexes_that_cannot_be_persisted(tmp_path, records):
+    master, _ = records
+    with pytest.raises(ValueError, match="cannot be used by a master store"):
+        MasterStore.create(str(tmp_path / "master"), master, COL_INFO, {"method": "full"})
+
+
+@pytest.mark.parametrize("index_info", INDEXES, ids=lambda info: info["method"])
+def test_batches_without_blocking_keys_start_new_entities(tmp_path, records, index_info):
+    master, batch = records
+    store = MasterStore.create(str(tmp_path / "master"), master, COL_INFO, index_info)
+    nameless = batch.iloc[:5].assign(name=None)
+    result = store.match_batch(nameless, [0.5, 0.5], 0.6)
+    assert result["matched_record_id"].isna().all()
+    assert result["entity_id"].tolist() == list(range(len(master), len(master) + 5))
+    assert store.num_records == len(master) + 5
+
+
+@pytest.mark.parametrize("index_info", INDEXES, ids=lambda info: info["method"])
+def test_compacted_indexes_find_the_same_matches(tmp_path, monkeypatch, records, index_info):
+    master, batch = records
+    stores = {}
+    for compact_parts in [2, 100]:
+        monkeypatch.setattr(data_master, "MASTER_COMPACT_PARTS", compact_parts)
+        path = str(tmp_path / f"master{compact_parts}")
+        store = MasterStore.create(path, master, COL_INFO, index_info)
+        results = [store.match_batch(part, [0.5, 0.5], 0.6) for part in [batch.iloc[:30]] * 3]
+        stores[compact_parts] = (store, results)
+
+    store, results = stores[2]
+    for directory in ["records", "index", "golden"]:
+        assert store.meta["parts"][directory] == [[0, 2], [3, 3]]
+        files = [name for name in os.listdir(os.path.join(store.path, directory)) if "part" in name]
+        assert len(files) == 2
+    for result, expected in zip(results, stores[100][1]):
+        pd.testing.assert_frame_equal(result, expected)
+    uncompacted = stores[100][0]
+    pd.testing.assert_frame_equal(store.records(), uncompacted.records())
+    pd.testing.assert_frame_equal(store.golden_records(), uncompacted.golden_records())
+
+    if index_info["method"] == "qgram":
+        # The index appended to batch by batch is the index loaded from the files at once
+        _, inverted = store._qgram_index()
+        data_master._master_indexes.clear()
+        _, loaded = MasterStore(store.path)._qgram_index()
+        assert inverted.shape == loaded.shape == (loaded.shape[0], store.num_records)
+        assert (inverted != loaded).nnz == 0
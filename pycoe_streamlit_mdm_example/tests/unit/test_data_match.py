@@ -0,0 +1,94 @@
+"""Check that every way of running the matching gives the same scores and top matches"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.data_match import (
+    _top_n_positions,
+    calc_match_scores,
+    cascade_match_scores,
+    get_top_matches,
+    stream_top_matches,
+)
+
+COL_INFO = [
+    {"name1": "name", "name2": "name", "ExactCompare": False, "method": "jarowinkler"},
+    {"name1": "address", "name2": "address", "ExactCompare": False, "method": "levenshtein"},
+    {"name1": "email", "name2": "email", "ExactCompare": True, "method": None},
+]
+
+WEIGHTS = [0.4, 0.3, 0.3]
+
+BLOCKING = {
+    "method": "block",
+    "keys": [{"name1": "name", "name2": "name", "key": "surname_prefix", "n_chars": 2}],
+}
+
+
+@pytest.fixture(scope="module")
+def scores(frames):
+    """The scores of the blocked pairs, scored at once in the calling process"""
+    df1, df2 = frames
+    return calc_match_scores(df1, df2, COL_INFO, BLOCKING)
+
+
+def test_parallel_scores_are_identical(frames, scores):
+    df1, df2 = frames
+    parallel = calc_match_scores(df1, df2, COL_INFO, BLOCKING, n_jobs=2)
+    pd.testing.assert_frame_equal(parallel, scores)
+
+
+def test_chunked_scores_with_progress_are_identical(frames, scores):
+    df1, df2 = frames
+    reports = []
+    chunked = calc_match_scores(
+        df1, df2, COL_INFO, BLOCKING, progress=lambda done, total: reports.append((done, total))
+    )
+    pd.testing.assert_frame_equal(chunked, scores)
+    assert reports[-1] == (len(scores), len(scores))
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_no_candidate_pairs_give_empty_scores(frames, scores, n_jobs):
+    df1, df2 = frames
+    # The records of df2 are renamed, so no block is shared by both DataFrames
+    df2 = df2.assign(name="Zz " + df2["name"] + " Qq")
+    empty = calc_match_scores(df1, df2, COL_INFO, BLOCKING, n_jobs=n_jobs)
+    assert len(empty) == 0
+    assert list(empty.columns) == list(scores.columns)
+    top_matches = stream_top_matches(
+        df1, df2, COL_INFO, WEIGHTS, index_info=BLOCKING, n_jobs=n_jobs
+    )
+    assert len(top_matches) == 0
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_streamed_top_matches_are_identical(frames, scores, n_jobs):
+    df1, df2 = frames
+    expected = get_top_matches(scores, df1, df2, WEIGHTS, 0.5, 2)
+    streamed = stream_top_matches(
+        df1, df2, COL_INFO, WEIGHTS, 0.5, 2, BLOCKING, chunk_size=1_000, n_jobs=n_jobs
+    )
+    pd.testing.assert_frame_equal(streamed, expected)
+
+
+def test_cascade_keeps_the_top_matches(frames, scores):
+    df1, df2 = frames
+    pruned, report = cascade_match_scores(df1, df2, COL_INFO, WEIGHTS, 0.5, BLOCKING)
+    assert len(pruned) < len(scores)
+    assert report["pairs_pruned"].sum() == len(scores) - len(pruned)
+    expected = get_top_matches(scores, df1, df2, WEIGHTS, 0.5, 2)
+    top_matches = get_top_matches(pruned, df1, df2, WEIGHTS, 0.5, 2)
+    pd.testing.assert_frame_equal(
+        top_matches.reset_index(drop=True), expected.reset_index(drop=True)
+    )
+
+
+def test_top_n_selection_keeps_the_best_pairs_of_every_record():
+    level_0 = np.array([2, 1, 2, 1, 2, 2, 3])
+    similarity = np.array([0.5, 0.9, 0.7, 0.9, 0.7, 0.2, 0.1])
+    # Record 1 keeps both tied pairs in their order, record 2 its two best, ties in order
+    assert _top_n_positions(level_0, similarity, 2).tolist() == [1, 3, 2, 4, 6]
+    assert _top_n_positions(level_0, similarity, 1).tolist() == [1, 2, 6]
+    assert len(_top_n_positions(level_0[:0], similarity[:0], 3)) == 0
@@ -0,0 +1,125 @@
+"""Check the pairing of matched records into entities and the survivorship rules"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.data_merge import merge_golden_records, pair_entities
+from utils.data_match import calc_match_scores, get_top_matches
+from utils.gen_data import generate_fake_data, introduce_spelling_errors
+
+
+@pytest.fixture(scope="module")
+def frames():
+    """Two small DataFrames of the same people, the second one updated more recently"""
+    df1 = pd.DataFrame(
+        {
+            "name": ["Ann Lee", "Bob Ray", "Cy Young"],
+            "phone": ["555-0001", None, "555-0003"],
+            "updated": ["2020-01-01", "2023-05-01", "2021-01-01"],
+        },
+        index=[10, 11, 12],
+    )
+    df2 = pd.DataFrame(
+        {
+            "name": ["Ann M. Lee", "Bob Ray", "Dee Dee"],
+            "phone": ["555-1001", "555-1002", None],
+            "updated": ["2022-01-01", "2021-01-01", None],
+        },
+        index=[20, 21, 22],
+    )
+    return df1, df2
+
+
+def test_pairs_keep_the_most_similar_pair_of_every_record(frames):
+    df1, df2 = frames
+    top_matches = pd.DataFrame(
+        {
+            "level_0": [10, 10, 11, 12],
+            "level_1": [20, 21, 21, 21],
+            "overall_similarity": [0.9, 0.6, 0.95, 0.7],
+        }
+    )
+    entity1, entity2 = pair_entities(top_matches, df1, df2)
+    assert entity1.tolist() == [0, 1, 2]
+    # 12 loses 21 to the more similar pair of 11, and 22 has no pair
+    assert entity2.tolist() == [0, 1, 3]
+
+
+def test_pairs_refuse_unknown_records(frames):
+    df1, df2 = frames
+    top_matches = pd.DataFrame({"level_0": [10], "level_1": [99], "overall_similarity": [0.9]})
+    with pytest.raises(ValueError, match="not in the DataFrames"):
+        pair_entities(top_matches, df1, df2)
+
+
+@pytest.mark.parametrize(
+    "rule, source_priority, expected",
+    [
+        ("most_complete", (1, 2), ["Ann M. Lee", "Bob Ray", "Cy Young", "Dee Dee"]),
+        ("most_recent", (1, 2), ["Ann M. Lee", "Bob Ray", "Cy Young", "Dee Dee"]),
+        ("source_priority", (1, 2), ["Ann Lee", "Bob Ray", "Cy Young", "Dee Dee"]),
+        ("source_priority", (2, 1), ["Ann M. Lee", "Bob Ray", "Cy Young", "Dee Dee"]),
+    ],
+)
+def test_rules_choose_the_surviving_values(frames, rule, source_priority, expected):
+    df1, df2 = frames
+    merge_info = [{"name": "name", "name1": "name", "name2": "name", "rule": rule}]
+    recency = {"name1": "updated", "name2": "updated"}
+    golden = merge_golden_records(
+        df1, df2, np.array([0, 1, 2]), np.array([0, 1, 3]), merge_info, recency, source_priority
+    )
+    assert golden.index.tolist() == [0, 1, 2, 3]
+    assert golden["num_records"].tolist() == [2, 2, 1, 1]
+    assert golden["name"].tolist() == expected
+
+
+def test_missing_values_only_survive_without_any_value(frames):
+    df1, df2 = frames
+    merge_info = [
+        {"name": "phone", "name1": "phone", "name2": "phone", "rule": "source_priority"},
+        {"name": "source1", "name1": "name", "name2": None, "rule": "most_complete"},
+    ]
+    golden = merge_golden_records(
+        df1, df2, np.array([0, 1, 2]), np.array([0, 1, 3]), merge_info
+    )
+    assert golden["phone"].iloc[:3].tolist() == ["555-0001", "555-1002", "555-0003"]
+    assert golden["source1"].iloc[:3].tolist() == ["Ann Lee", "Bob Ray", "Cy Young"]
+    assert golden[["phone", "source1"]].iloc[3].isna().all()
+
+
+def test_most_frequent_counts_the_values_of_each_entity():
+    df1 = pd.DataFrame({"city": ["Rome", "Oslo", "Rome"]})
+    df2 = pd.DataFrame({"city": ["Oslo", "Oslo", "Rome"]})
+    merge_info = [{"name": "city", "name1": "city", "name2": "city", "rule": "most_frequent"}]
+    golden = merge_golden_records(
+        df1, df2, np.array([0, 0, 0]), np.array([0, 0, 1]), merge_info
+    )
+    assert golden["city"].tolist() == ["Oslo", "Rome"]
+
+
+def test_rules_are_validated(frames):
+    df1, df2 = frames
+    entities = np.array([0, 1, 2])
+    with pytest.raises(ValueError, match="not known"):
+        merge_golden_records(
+            df1, df2, entities, entities, [{"name": "x", "name1": "name", "rule": "longest"}]
+        )
+    with pytest.raises(ValueError, match="recency"):
+        merge_golden_records(
+            df1, df2, entities, entities, [{"name": "x", "name1": "name", "rule": "most_recent"}]
+        )
+
+
+def test_matched_records_merge_into_one_golden_record_each():
+    df1 = generate_fake_data(100, seed=1)
+    df2 = introduce_spelling_errors(df1, error_rate=0.1, seed=2)
+    col_info = [{"name1": "email", "name2": "email", "ExactCompare": True, "method": "exact"}]
+    index_info = {"method": "block", "keys": [{"name1": "email", "name2": "email"}]}
+    scores = calc_match_scores(df1, df2, col_info, index_info)
+    top_matches = get_top_matches(scores, df1, df2, [1.0], 0.5, top_n=1).reset_index()
+    entity1, entity2 = pair_entities(top_matches, df1, df2)
+    merge_info = [{"name": "name", "name1": "name", "name2": "name", "rule": "most_complete"}]
+    golden = merge_golden_records(df1, df2, entity1, entity2, merge_info)
+    assert golden["num_records"].sum() == len(df1) + len(df2)
+    assert len(golden) == len(df1) + len(df2) - len(top_matches)
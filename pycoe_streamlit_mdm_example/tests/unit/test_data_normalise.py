@@ -0,0 +1,87 @@
+"""Check the normalisation steps and the normalisation of the compared columns"""
+
+import pandas as pd
+import pytest
+
+from utils.data_cache import LRUCache
+from utils.data_normalise import (
+    find_normalisation_conflicts,
+    normalise_column,
+    normalise_frames,
+    normalise_series,
+    parse_dates,
+    resolve_normalisation,
+)
+
+
+def test_presets_resolve_in_the_order_of_the_steps():
+    assert resolve_normalisation("name") == ["remove_titles", "casefold", "strip_punctuation"]
+    assert resolve_normalisation(["casefold", "remove_titles"]) == ["remove_titles", "casefold"]
+    assert resolve_normalisation(None) == []
+    with pytest.raises(ValueError):
+        resolve_normalisation("unknown")
+    with pytest.raises(ValueError):
+        resolve_normalisation(["casefold", "unknown"])
+
+
+@pytest.mark.parametrize(
+    "normalise, values, expected",
+    [
+        (
+            "name",
+            ["Dr. Jane  O'Neil", "MR JOHN SMITH", None, "..."],
+            ["jane oneil", "john smith", None, None],
+        ),
+        (
+            "address",
+            ["1 Main St., Springfield", "2 Oak Ave"],
+            ["1 main street springfield", "2 oak avenue"],
+        ),
+        ("phone", ["+1 (555) 123-4567 x89", "555.987.6543"], ["5551234567", "5559876543"]),
+        ("date", ["2024-01-31", "not a date"], ["2024-01-31", "not a date"]),
+    ],
+)
+def test_normalise_series(normalise, values, expected):
+    assert normalise_series(pd.Series(values), normalise).tolist() == expected
+
+
+def test_parse_dates_falls_back_to_mixed_formats():
+    parsed = parse_dates(pd.Series(["2024-01-31", "March 5, 2021", "nonsense", None]))
+    assert parsed.dt.strftime("%Y-%m-%d").tolist()[:2] == ["2024-01-31", "2021-03-05"]
+    assert parsed.iloc[2:].isna().all()
+
+
+def test_normalise_column_reuses_the_cached_values():
+    df = pd.DataFrame({"name": ["Mr. A", "b"]})
+    cache = LRUCache()
+    first = normalise_column(df, "name", "name", cache)
+    assert normalise_column(df.copy(), "name", "name", cache) is first
+    assert len(cache) == 1
+    assert normalise_column(df, "name", "none", cache) is not first
+
+
+def test_normalise_frames_only_replaces_the_normalised_columns():
+    df1 = pd.DataFrame({"name": ["Mr. A"], "date": pd.to_datetime(["2020-01-02"]), "x": [1]})
+    df2 = pd.DataFrame({"surname": ["B."], "day": ["2020-01-02"], "x": [2]})
+    col_info = [
+        {"name1": "name", "name2": "surname", "normalise": "name"},
+        {"name1": "date", "name2": "day", "normalise": None},
+    ]
+    normalised1, normalised2 = normalise_frames(df1, df2, col_info, LRUCache())
+    assert normalised1["name"].tolist() == ["a"]
+    assert normalised1["date"].tolist() == ["2020-01-02"]
+    assert normalised2["surname"].tolist() == ["b"]
+    assert normalised2["day"].tolist() == ["2020-01-02"]
+    assert df1["name"].tolist() == ["Mr. A"]
+
+
+def test_conflicting_normalisations_are_found_before_normalising():
+    df = pd.DataFrame({"name": ["Mr. A"], "alias": ["a"]})
+    col_info = [
+        {"name1": "name", "name2": "name", "normalise": "name"},
+        {"name1": "name", "name2": "alias", "normalise": "text"},
+    ]
+    assert find_normalisation_conflicts(col_info) == ["name"]
+    assert find_normalisation_conflicts(col_info[:1]) == []
+    with pytest.raises(ValueError, match="different normalisations"):
+        normalise_frames(df, df, col_info, LRUCache())
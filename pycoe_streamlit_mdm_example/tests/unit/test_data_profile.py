@@ -0,0 +1,72 @@
+"""Check that the profiler times, counts and traces the memory of nested stages"""
+
+import json
+import tracemalloc
+
+import pytest
+
+from utils.data_profile import MatchProfiler, profile_stage
+
+MB = 1024**2
+
+
+def test_stages_sum_their_calls_and_only_outermost_stages_add_up():
+    profiler = MatchProfiler(trace_memory=False)
+    with profiler.stage("indexing") as record:
+        record["pairs"] = 100
+    for pairs in [10, 20]:
+        with profiler.stage("scoring", pairs):
+            with profile_stage(profiler, "compare name (jaro)", pairs):
+                pass
+    profile = profiler.to_dict()
+    stages = {stage["stage"]: stage for stage in profile["stages"]}
+    assert list(stages) == ["indexing", "scoring", "compare name (jaro)"]
+    assert [stage["depth"] for stage in stages.values()] == [0, 0, 1]
+    assert stages["scoring"]["calls"] == 2
+    assert stages["scoring"]["pairs"] == stages["compare name (jaro)"]["pairs"] == 30
+    assert stages["indexing"]["pairs"] == 100
+    assert profile["total_wall_s"] == pytest.approx(
+        stages["indexing"]["wall_s"] + stages["scoring"]["wall_s"]
+    )
+    assert stages["compare name (jaro)"]["wall_s"] <= stages["scoring"]["wall_s"]
+    assert profile["peak_alloc_mb"] is None
+    assert json.loads(profiler.to_json()) == json.loads(json.dumps(profile))
+    assert list(profiler.to_frame().index) == list(stages)
+
+
+def test_profile_stage_without_a_profiler_yields_the_pairs():
+    with profile_stage(None, "scoring", 5) as record:
+        assert record == {"pairs": 5}
+
+
+def test_peaks_of_nested_stages_are_seen_by_the_enclosing_stage():
+    profiler = MatchProfiler()
+    with profiler.stage("scoring"):
+        with profiler.stage("compare name (jaro)"):
+            block = bytearray(8 * MB)
+        del block
+    assert not tracemalloc.is_tracing()
+    stages = {stage["stage"]: stage for stage in profiler.to_dict()["stages"]}
+    assert stages["compare name (jaro)"]["peak_alloc_mb"] >= 8
+    assert stages["scoring"]["peak_alloc_mb"] >= stages["compare name (jaro)"]["peak_alloc_mb"]
+    assert profiler.to_dict()["peak_alloc_mb"] == stages["scoring"]["peak_alloc_mb"]
+
+
+def test_memory_is_traced_for_one_run_at_a_time():
+    first = MatchProfiler()
+    second = MatchProfiler()
+    with first.stage("scoring"):
+        # The second run starts and ends while the first one is tracing
+        with second.stage("scoring"):
+            block = bytearray(8 * MB)
+        assert tracemalloc.is_tracing()
+        del block
+    assert not tracemalloc.is_tracing()
+    assert second.to_dict()["peak_alloc_mb"] is None
+    assert first.to_dict()["peak_alloc_mb"] >= 8
+
+    # Once the first run is done, the next one traces its memory again
+    with second.stage("selection"):
+        block = bytearray(8 * MB)
+    del block
+    assert second.to_frame().loc["selection", "peak_alloc_mb"] >= 8
@@ -0,0 +1,137 @@
+"""Check the generation of fake data and the errors and inconsistencies introduced in it"""
+
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import gen_data
+from utils.gen_data import (
+    generate_fake_data,
+    introduce_address_inconsistencies,
+    introduce_date_inconsistencies,
+    introduce_name_inconsistencies,
+    introduce_spelling_errors,
+    introduce_timestamp_inconsistencies,
+)
+
+COLUMNS = ["name", "address", "phone", "date", "timestamp", "email", "job"]
+
+END_DATE = date(2024, 6, 30)
+
+
+@pytest.fixture(scope="module")
+def fake_data():
+    """A DataFrame of fake records generated up to a fixed date"""
+    return generate_fake_data(2_000, seed=1, end_date=END_DATE)
+
+
+def test_the_same_seed_generates_the_same_data():
+    df = generate_fake_data(200, seed=1, end_date=END_DATE)
+    pd.testing.assert_frame_equal(df, generate_fake_data(200, seed=1, end_date=END_DATE))
+    assert not df.equals(generate_fake_data(200, seed=2, end_date=END_DATE))
+
+
+def test_the_data_does_not_depend_on_the_number_of_processes(monkeypatch):
+    monkeypatch.setattr(gen_data, "SHARD_SIZE", 40)
+    df = generate_fake_data(100, seed=3, end_date=END_DATE)
+    pd.testing.assert_frame_equal(df, generate_fake_data(100, seed=3, n_jobs=2, end_date=END_DATE))
+    assert df.index.equals(pd.RangeIndex(100))
+
+
+@pytest.mark.parametrize("num_records", [0, 1, 150])
+def test_the_columns_are_those_of_faker_records(num_records):
+    df = generate_fake_data(num_records, seed=4, end_date=END_DATE)
+    assert list(df.columns) == COLUMNS
+    assert len(df) == num_records
+    assert (df.dtypes == object).all()
+    if num_records:
+        assert df.map(lambda value: isinstance(value, str)).all().all()
+        dates = pd.to_datetime(df["date"], format="%Y-%m-%d")
+        assert dates.max() <= pd.Timestamp(END_DATE)
+        assert dates.min() >= pd.Timestamp(END_DATE) - pd.Timedelta(days=3_653)
+        pd.to_datetime(df["timestamp"], format="%Y-%m-%d %H:%M:%S")
+        assert df["email"].str.contains("@", regex=False).all()
+
+
+@pytest.mark.parametrize("error_rate", [0.0, 0.05, 0.3])
+def test_spelling_errors_replace_characters_at_the_error_rate(fake_data, error_rate):
+    original = fake_data.copy()
+    df = introduce_spelling_errors(fake_data, error_rate=error_rate, seed=5)
+    pd.testing.assert_frame_equal(fake_data, original)
+    assert df is not fake_data
+    pd.testing.assert_frame_equal(df[["date", "timestamp"]], original[["date", "timestamp"]])
+
+    characters = changed = 0
+    for col in ["name", "address", "phone", "email", "job"]:
+        assert (df[col].str.len() == original[col].str.len()).all()
+        before = np.array(list("".join(original[col])))
+        after = np.array(list("".join(df[col])))
+        characters += len(before)
+        changed += int((before != after).sum())
+    # A letter is sometimes replaced by itself, one time in 52
+    expected = error_rate * 51 / 52
+    assert changed / characters == pytest.approx(expected, abs=0.005)
+
+
+def test_spelling_errors_leave_values_that_are_not_strings():
+    df = pd.DataFrame({"name": ["Ann Lee", None, 3]}, dtype=object)
+    errors = introduce_spelling_errors(df, error_rate=1.0, seed=6)
+    assert errors["name"].iloc[0] != "Ann Lee"
+    assert errors["name"].iloc[1:].tolist() == [None, 3]
+
+
+def test_dates_with_a_slash_are_formatted_before_dates_with_a_dash():
+    df = pd.DataFrame({"date": ["2024/01/02", "2024-01-03", "01/04/2024", "not a date", None]})
+    result = introduce_date_inconsistencies(df, inconsistency_rate=1.0, seed=7)
+    assert result["date"].tolist() == ["2024-01-02", "2024.01.03", "2024-01-04", "not a date", None]
+    assert df["date"].iloc[0] == "2024/01/02"
+    unchanged = introduce_date_inconsistencies(df, inconsistency_rate=0.0, seed=7)
+    pd.testing.assert_frame_equal(unchanged, df)
+
+
+@pytest.mark.parametrize(
+    "rates, expected",
+    [
+        ((1.0, 0.0, 0.0), ["1 main street, leeds", "2 high st. leeds", "3 OAK ROAD, YORK"]),
+        ((0.0, 1.0, 0.0), ["1 Main Street Leeds", "2 High St. Leeds,", "3 oak road york"]),
+        ((0.0, 0.0, 1.0), ["1 Main St., Leeds", "2 High Street Leeds", "3 oak road, york"]),
+        # Every rule is applied to the original address and the abbreviations are drawn last
+        ((1.0, 1.0, 1.0), ["1 Main St., Leeds", "2 High Street Leeds", "3 oak road, york"]),
+    ],
+)
+def test_address_rules_are_applied_to_the_original_address(rates, expected):
+    df = pd.DataFrame({"address": ["1 Main Street, Leeds", "2 High St. Leeds", "3 oak road, york"]})
+    capitalization_rate, comma_rate, abbreviation_rate = rates
+    result = introduce_address_inconsistencies(
+        df,
+        capitalization_rate=capitalization_rate,
+        comma_rate=comma_rate,
+        abbreviation_rate=abbreviation_rate,
+        seed=8,
+    )
+    assert result["address"].tolist() == expected
+
+
+def test_titles_replace_the_abbreviation_of_a_name():
+    df = pd.DataFrame({"name": ["Ann Marie Lee", "Cher"]})
+    abbreviated = introduce_name_inconsistencies(df, abbreviation_rate=1.0, title_rate=0.0, seed=9)
+    assert abbreviated["name"].tolist() == ["A. Lee", "Cher"]
+    titled = introduce_name_inconsistencies(df, abbreviation_rate=1.0, title_rate=1.0, seed=9)
+    titles, names = zip(*(name.split(" ", 1) for name in titled["name"]))
+    assert set(titles) <= {"Mr.", "Mrs.", "Dr.", "Prof."}
+    assert list(names) == ["Ann Marie Lee", "Cher"]
+
+
+def test_timestamps_are_moved_by_up_to_a_year_in_the_same_format(fake_data):
+    df = fake_data[["timestamp"]].copy()
+    df.loc[0, "timestamp"] = "not a timestamp"
+    result = introduce_timestamp_inconsistencies(df, inconsistency_rate=1.0, seed=10)
+    assert result.loc[0, "timestamp"] == "not a timestamp"
+    before = pd.to_datetime(df["timestamp"].iloc[1:], format="%Y-%m-%d %H:%M:%S")
+    after = pd.to_datetime(result["timestamp"].iloc[1:], format="%Y-%m-%d %H:%M:%S")
+    offsets = after - before
+    assert (offsets.abs() <= pd.Timedelta(days=365)).all()
+    assert (offsets % pd.Timedelta(days=1) == pd.Timedelta(0)).all()
+    assert (offsets != pd.Timedelta(0)).mean() > 0.99
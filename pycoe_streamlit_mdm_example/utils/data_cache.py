@@ -0,0 +1,149 @@
+from collections import OrderedDict
+import hashlib
+import json
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Default memory budget of the matching result cache of a session
+MATCH_CACHE_BYTES = 512 * 1024**2
+
+
+def hash_frame(df) -> str:
+    """
+    Compute a content hash of a DataFrame.
+
+    Args:
+        df (pandas.DataFrame): The DataFrame to hash.
+
+    Returns:
+        str: A hex digest that only depends on the column names, dtypes, index and values.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps([str(col) for col in df.columns]).encode())
+    digest.update(json.dumps([str(dtype) for dtype in df.dtypes]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    return digest.hexdigest()
+
+
+def hash_config(config) -> str:
+    """
+    Compute a hash of a JSON-like configuration, such as `col_info` or `index_info`.
+
+    Args:
+        config (object): The configuration, made of dictionaries, lists and scalars.
+
+    Returns:
+        str: A hex digest that does not depend on the order of dictionary keys.
+    """
+    encoded = json.dumps(config, sort_keys=True, default=str).encode()
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+
+def match_cache_key(df1, df2, col_info, index_info=None) -> tuple:
+    """
+    Build the cache key of the similarity scores of a matching run.
+
+    Args:
+        df1 (pandas.DataFrame): The first DataFrame.
+        df2 (pandas.DataFrame): The second DataFrame.
+        col_info (list): The column information of the run, see `utils.data_match.calc_match_scores`.
+        index_info (dict, optional): The indexing strategy of the run.
+
+    Returns:
+        tuple: A key identifying the inputs that determine the similarity scores.
+    """
+    return (hash_frame(df1), hash_frame(df2), hash_config(col_info), hash_config(index_info))
+
+
+def sizeof(value) -> int:
+    """Estimate the memory used by a cached value, in bytes."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, pd.Index):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(sizeof(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(item) for item in value.values())
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """
+    A least recently used cache with a memory budget.
+
+    Args:
+        max_bytes (int, optional): The memory budget of the cache. When adding a value takes the
+            cache over budget, the least recently used values are evicted. Values larger than the
+            whole budget are not cached. Default is `MATCH_CACHE_BYTES`.
+
+    Every operation holds a lock, as the caches shared by a session or the process are used
+    by the script thread of every rerun and by the thread of a background matching run.
+    Callers should look a value up with a single `get` rather than checking `in` first, as
+    another thread can evict the value in between.
+    """
+
+    def __init__(self, max_bytes=MATCH_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key, default=None):
+        """Return the value cached under `key` and mark it as most recently used."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, nbytes=None) -> None:
+        """Cache `value` under `key`, evicting the least recently used values if needed."""
+        if nbytes is None:
+            nbytes = sizeof(value)
+        with self._lock:
+            self._pop(key)
+            if nbytes > self.max_bytes:
+                return None
+
+            self._entries[key] = (value, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted_nbytes) = self._entries.popitem(last=False)
+                self.nbytes -= evicted_nbytes
+        return None
+
+    def pop(self, key, default=None):
+        """Remove the value cached under `key` and return it."""
+        with self._lock:
+            return self._pop(key, default)
+
+    def _pop(self, key, default=None):
+        """Remove the value cached under `key` and return it, the lock being held."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return default
+        self.nbytes -= entry[1]
+        return entry[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+        return None
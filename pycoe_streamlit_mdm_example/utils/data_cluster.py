@@ -0,0 +1,169 @@
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components, minimum_spanning_tree
+
+
+def _node_dtype(num_nodes):
+    """Return the smallest integer dtype numbering `num_nodes` nodes."""
+    return np.int32 if num_nodes < 2**31 else np.int64
+
+
+def _component_labels(num_nodes, left, right) -> np.ndarray:
+    """Label the connected components of an undirected graph, numbered from 0."""
+    graph = coo_matrix(
+        (np.ones(len(left), dtype=np.int8), (left, right)), shape=(num_nodes, num_nodes)
+    ).tocsr()
+    _, labels = connected_components(graph, directed=False)
+    return labels.astype(_node_dtype(num_nodes), copy=False)
+
+
+def _maximum_spanning_forest(num_nodes, left, right, weights) -> tuple:
+    """Return the edges of a spanning forest keeping the strongest edges of the graph."""
+    # minimum_spanning_tree ignores edges of weight 0, so the weights are mapped to positive costs
+    costs = weights.max() - weights + 1.0
+    forest = minimum_spanning_tree(
+        coo_matrix((costs, (left, right)), shape=(num_nodes, num_nodes)).tocsr()
+    ).tocoo()
+    dtype = _node_dtype(num_nodes)
+    return (
+        forest.row.astype(dtype),
+        forest.col.astype(dtype),
+        weights.max() + 1.0 - forest.data,
+    )
+
+
+def _renumber(num_nodes, left, right) -> tuple:
+    """Number the nodes having an edge from 0, returning them with the renumbered edges."""
+    has_edge = np.zeros(num_nodes, dtype=bool)
+    has_edge[left] = True
+    has_edge[right] = True
+    dtype = _node_dtype(num_nodes)
+    numbers = np.cumsum(has_edge, dtype=dtype) - 1
+    return np.flatnonzero(has_edge), numbers[left], numbers[right]
+
+
+def _unique_edges(left, right, weights) -> tuple:
+    """Drop repeated edges, keeping the strongest weight of each, as sparse matrices sum them."""
+    order = np.argsort(-weights, kind="stable")
+    left, right, weights = left[order], right[order], weights[order]
+    low = np.minimum(left, right).astype(np.int64)
+    high = np.maximum(left, right).astype(np.int64)
+    _, first = np.unique(low * (high.max() + 1) + high, return_index=True)
+    return left[first], right[first], weights[first]
+
+
+def cluster_pairs(num_nodes, left, right, weights=None, max_cluster_size=None) -> np.ndarray:
+    """
+    Cluster the nodes of a graph of matched pairs into entities.
+
+    Args:
+        num_nodes (int): The number of nodes, numbered from 0.
+        left (numpy.ndarray): The first node of every edge.
+        right (numpy.ndarray): The second node of every edge.
+        weights (numpy.ndarray, optional): The similarity of every edge. Default is None (all 1).
+        max_cluster_size (int, optional): The largest number of nodes in a cluster. Clusters over
+            this size are split by dropping their weakest edges. Default is None (no limit).
+
+    Returns:
+        numpy.ndarray: The cluster of every node, numbered from 0, so that two nodes joined by a
+        path of edges share a cluster.
+
+    The clusters are the connected components of the sparse graph of the pairs, found in time
+    linear in the number of edges. An over-large cluster is reduced to its maximum spanning
+    forest, the strongest edges joining its nodes, and the weakest edges of the forest are
+    dropped in rounds: a cluster of `size` nodes loses `ceil(size / max_cluster_size) - 1`
+    edges per round, until every cluster fits. This is single-linkage clustering cut at the
+    weakest links. Every round only works on the edges and nodes of the clusters still too
+    large, so the rounds get cheaper as the clusters are split.
+    """
+    dtype = _node_dtype(num_nodes)
+    left = np.asarray(left, dtype=dtype)
+    right = np.asarray(right, dtype=dtype)
+    if weights is None:
+        weights = np.ones(len(left), dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+
+    labels = _component_labels(num_nodes, left, right)
+    if max_cluster_size is None or len(left) == 0:
+        return labels
+    if max_cluster_size < 1:
+        raise ValueError("The maximum cluster size must be at least 1.")
+    sizes = np.bincount(labels)
+    oversized = sizes[labels[left]] > max_cluster_size
+    if not oversized.any():
+        return labels
+
+    kept_left = [left[~oversized]]
+    kept_right = [right[~oversized]]
+    # The nodes of the over-large clusters are renumbered so every round works on them only
+    nodes, work_left, work_right = _renumber(num_nodes, left[oversized], right[oversized])
+    work_left, work_right, work_weights = _unique_edges(
+        work_left, work_right, weights[oversized]
+    )
+    work_left, work_right, work_weights = _maximum_spanning_forest(
+        len(nodes), work_left, work_right, work_weights
+    )
+    # The edges are kept from the weakest to the strongest from here on
+    order = np.argsort(work_weights, kind="stable")
+    work_left, work_right = work_left[order], work_right[order]
+
+    while len(work_left):
+        work_labels = _component_labels(len(nodes), work_left, work_right)
+        sizes = np.bincount(work_labels)
+        edge_labels = work_labels[work_left]
+        fits = sizes[edge_labels] <= max_cluster_size
+        kept_left.append(nodes[work_left[fits]])
+        kept_right.append(nodes[work_right[fits]])
+        work_left, work_right, edge_labels = (
+            work_left[~fits],
+            work_right[~fits],
+            edge_labels[~fits],
+        )
+
+        # Rank the edges of every cluster from the weakest, and drop enough of them to split it
+        order = np.argsort(edge_labels, kind="stable")
+        sorted_labels = edge_labels[order]
+        starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+        ranks = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+        num_dropped = -(-sizes[sorted_labels] // max_cluster_size) - 1
+        keep = np.ones(len(order), dtype=bool)
+        keep[order[ranks < num_dropped]] = False
+
+        # Renumber the nodes still joined by an edge, so later rounds shrink with the edges
+        used, work_left, work_right = _renumber(len(nodes), work_left[keep], work_right[keep])
+        nodes = nodes[used]
+
+    return _component_labels(num_nodes, np.concatenate(kept_left), np.concatenate(kept_right))
+
+
+def cluster_entities(top_matches, df1, df2, max_cluster_size=None) -> tuple:
+    """
+    Assign every record of both DataFrames to an entity, resolving the matched pairs transitively.
+
+    Args:
+        top_matches (pandas.DataFrame): The matched pairs, see `utils.data_match.get_top_matches`,
+            with the 'level_0' and 'level_1' index labels and the 'overall_similarity' of each pair.
+        df1 (pandas.DataFrame): The first DataFrame of the matching.
+        df2 (pandas.DataFrame): The second DataFrame of the matching.
+        max_cluster_size (int, optional): The largest number of records in an entity, see
+            `cluster_pairs`. Default is None (no limit).
+
+    Returns:
+        tuple: Two int64 arrays holding the entity of every row of `df1` and of every row of
+        `df2`, in the format of `utils.data_merge.pair_entities`. Records linked by a chain of
+        pairs share an entity, so an entity can hold several records of each DataFrame.
+    """
+    pos1 = df1.index.get_indexer(top_matches["level_0"])
+    pos2 = df2.index.get_indexer(top_matches["level_1"])
+    if (pos1 < 0).any() or (pos2 < 0).any():
+        raise ValueError("The matched pairs refer to records that are not in the DataFrames.")
+
+    # The records of df2 are the nodes following the records of df1
+    labels = cluster_pairs(
+        len(df1) + len(df2),
+        pos1,
+        pos2 + len(df1),
+        top_matches["overall_similarity"].to_numpy(),
+        max_cluster_size,
+    ).astype(np.int64)
+    return labels[: len(df1)], labels[len(df1) :]
@@ -0,0 +1,208 @@
+import sys
+
+import numpy as np
+import pandas as pd
+from recordlinkage.compare import String
+
+try:
+    from rapidfuzz import distance
+    from rapidfuzz.process import cpdist
+except ImportError:  # rapidfuzz is optional, recordlinkage computes the same similarities
+    distance = None
+    cpdist = None
+
+COMPARATOR_BACKENDS = ["auto", "rapidfuzz", "recordlinkage"]
+
+# The rapidfuzz metrics computing the same similarities as the recordlinkage string methods,
+# with the similarity recordlinkage gives to two empty strings. The other methods (qgram,
+# cosine, smith_waterman, lcs) are always computed by recordlinkage.
+RAPIDFUZZ_METHODS = {
+    "jaro": ("Jaro", 0.0),
+    "jarowinkler": ("JaroWinkler", 0.0),
+    "jaro_winkler": ("JaroWinkler", 0.0),
+    "jw": ("JaroWinkler", 0.0),
+    "levenshtein": ("Levenshtein", np.nan),
+    "damerau_levenshtein": ("DamerauLevenshtein", np.nan),
+    "dameraulevenshtein": ("DamerauLevenshtein", np.nan),
+    "dl": ("DamerauLevenshtein", np.nan),
+}
+
+# Default memory budget of the cache of string similarity scores of a session
+SCORE_CACHE_BYTES = 128 * 1024**2
+
+# Rough memory cost of a cached score, besides its two strings: the key tuple, the score
+# and the entry in the cache
+BYTES_PER_CACHED_SCORE = 200
+
+
+# Relative cost of scoring a pair with each comparison method, used to score cheap columns first
+COMPARATOR_COSTS = {
+    "exact": 0,
+    "jaro": 1,
+    "jarowinkler": 1,
+    "levenshtein": 2,
+    "damerau_levenshtein": 3,
+    "qgram": 4,
+    "cosine": 4,
+    "lcs": 5,
+    "smith_waterman": 6,
+}
+
+
+def comparator_cost(col_dict) -> int:
+    """Return the relative cost of scoring a pair for an entry of the column information."""
+    if col_dict["ExactCompare"]:
+        return COMPARATOR_COSTS["exact"]
+    return COMPARATOR_COSTS.get(col_dict["method"], max(COMPARATOR_COSTS.values()))
+
+
+def resolve_backend(backend, method) -> str:
+    """
+    Resolve the backend computing a string similarity method.
+
+    Args:
+        backend (str): One of `COMPARATOR_BACKENDS`. 'auto' uses rapidfuzz when it is installed,
+            'rapidfuzz' requires it, and 'recordlinkage' never uses it.
+        method (str): The string comparison method.
+
+    Returns:
+        str: 'rapidfuzz' or 'recordlinkage'. Methods that rapidfuzz does not compute always fall
+        back to 'recordlinkage'.
+    """
+    if backend not in COMPARATOR_BACKENDS:
+        raise ValueError(f"The comparator backend '{backend}' is not known.")
+    if backend == "rapidfuzz" and cpdist is None:
+        raise ImportError("The rapidfuzz comparator backend requires rapidfuzz.")
+    if backend == "recordlinkage" or cpdist is None or method not in RAPIDFUZZ_METHODS:
+        return "recordlinkage"
+    return "rapidfuzz"
+
+
+def rapidfuzz_similarity(s1, s2, method, workers=-1) -> np.ndarray:
+    """
+    Compute a recordlinkage string similarity with rapidfuzz.
+
+    Args:
+        s1 (pandas.Series): The first values of the pairs.
+        s2 (pandas.Series): The second values of the pairs.
+        method (str): A string comparison method of `RAPIDFUZZ_METHODS`.
+        workers (int, optional): The number of threads scoring the pairs. -1 uses all cores.
+            Default is -1.
+
+    Returns:
+        numpy.ndarray: The similarity of every pair, normalised to [0, 1] as recordlinkage does
+        (e.g. 1 - distance / longest length for levenshtein). Pairs with a missing value are NaN.
+
+    The pairs are scored in compiled code, in batches spread over `workers` threads.
+    """
+    metric, empty_score = RAPIDFUZZ_METHODS[method]
+    missing = (s1.isna() | s2.isna()).to_numpy()
+    left = s1.where(~missing, "")
+    right = s2.where(~missing, "")
+    scores = cpdist(
+        left.tolist(),
+        right.tolist(),
+        scorer=getattr(distance, metric).normalized_similarity,
+        dtype=np.float64,
+        workers=workers,
+    )
+    both_empty = (left.str.len() == 0).to_numpy() & (right.str.len() == 0).to_numpy()
+    scores[both_empty] = empty_score
+    scores[missing] = np.nan
+    return scores
+
+
+class MemoisedString(String):
+    """
+    A string comparison that only scores each distinct pair of values once.
+
+    Args:
+        left_on (str): The name of the column in the left DataFrame.
+        right_on (str): The name of the column in the right DataFrame.
+        method (str, optional): The string comparison method, see `recordlinkage.compare.String`.
+            Default is 'levenshtein'.
+        threshold (float, optional): See `recordlinkage.compare.String`. Default is None.
+        missing_value (float, optional): The score of a comparison with a missing value. Default is 0.
+        label (str, optional): The label of the feature.
+        cache (utils.data_cache.LRUCache, optional): A cache of the scores of value pairs, kept
+            across comparisons (e.g. in the session). Default is None (no cache).
+        backend (str, optional): The backend computing the similarities, see `resolve_backend`.
+            Default is 'auto'.
+        workers (int, optional): The number of threads of the rapidfuzz backend, see
+            `rapidfuzz_similarity`. Default is -1 (all cores).
+
+    The values of both columns are factorised to integer codes, the distinct code pairs of the
+    candidate pairs are scored with the recordlinkage algorithm, and the scores are broadcast
+    back to all candidate pairs. The scores are identical to `recordlinkage.compare.String`,
+    as the algorithms score every pair independently, but columns with repeated values (jobs,
+    surnames, street names) are scored far fewer times. The rapidfuzz backend computes the
+    same similarities as recordlinkage, up to floating point rounding.
+    """
+
+    def __init__(
+        self,
+        left_on,
+        right_on,
+        method="levenshtein",
+        threshold=None,
+        missing_value=0.0,
+        label=None,
+        cache=None,
+        backend="auto",
+        workers=-1,
+    ):
+        super().__init__(left_on, right_on, method, threshold, missing_value, label)
+        self.cache = cache
+        self.backend = resolve_backend(backend, method)
+        self.workers = workers
+
+    def _compute_vectorized(self, s_left, s_right):
+        codes, uniques = pd.factorize(
+            pd.concat([s_left, s_right], ignore_index=True), use_na_sentinel=True
+        )
+        # Code 0 stands for a missing value, the others for the distinct values
+        values = np.concatenate([[None], np.asarray(uniques, dtype=object)])
+        codes = codes.astype(np.int64) + 1
+        pair_codes = codes[: len(s_left)] * len(values) + codes[len(s_left) :]
+        unique_pair_codes, inverse = np.unique(pair_codes, return_inverse=True)
+        left_values = values[unique_pair_codes // len(values)]
+        right_values = values[unique_pair_codes % len(values)]
+
+        if self.cache is None:
+            scores = self._score_values(left_values, right_values)
+        else:
+            scores = self._cached_scores(left_values, right_values)
+        return scores[inverse.reshape(-1)]
+
+    def _score_values(self, left_values, right_values) -> np.ndarray:
+        """Score pairs of values with the backend, applying the threshold and missing value."""
+        if len(left_values) == 0:
+            return np.empty(0, dtype=float)
+        left_values = pd.Series(left_values, dtype=object)
+        right_values = pd.Series(right_values, dtype=object)
+        if self.backend == "recordlinkage":
+            scores = super()._compute_vectorized(left_values, right_values)
+            return np.asarray(scores, dtype=float)
+
+        scores = rapidfuzz_similarity(left_values, right_values, self.method, self.workers)
+        missing = np.isnan(scores)
+        if self.threshold is not None:
+            scores = (scores >= self.threshold).astype(float)
+        scores[missing] = self.missing_value
+        return scores
+
+    def _cached_scores(self, left_values, right_values) -> np.ndarray:
+        """Score pairs of values, reusing and filling the scores held by the cache."""
+        keys = [
+            (self.backend, self.method, self.threshold, self.missing_value, left, right)
+            for left, right in zip(left_values, right_values)
+        ]
+        scores = np.array([self.cache.get(key, np.nan) for key in keys], dtype=float)
+        missed = np.flatnonzero(np.isnan(scores))
+
+        scores[missed] = self._score_values(left_values[missed], right_values[missed])
+        for i in missed:
+            key = keys[i]
+            nbytes = BYTES_PER_CACHED_SCORE + sys.getsizeof(key[4]) + sys.getsizeof(key[5])
+            self.cache.put(key, scores[i], nbytes=nbytes)
+        return scores
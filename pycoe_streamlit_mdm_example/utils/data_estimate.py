@@ -0,0 +1,336 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.data_cache import LRUCache, hash_config, hash_frame, match_cache_key
+from utils.data_index import (
+    SIMILARITY_INDEX_METHODS,
+    build_candidate_index,
+    build_exact_join_index,
+    count_candidate_pairs,
+)
+from utils.data_match import (
+    BYTES_PER_PAIR,
+    BYTES_PER_PAIR_AND_COLUMN,
+    score_candidates,
+    uses_exact_join,
+)
+from utils.data_normalise import normalise_frames
+
+# Number of records of df1 the candidate pairs are counted for, the count of the other records
+# being extrapolated from them
+ESTIMATE_SAMPLE_ROWS = 5_000
+
+# Number of pairs of values every comparator is timed on. Fewer pairs mostly time the fixed
+# cost of a call, and underestimate the throughput of large runs
+CALIBRATION_PAIRS = 10_000
+
+# Rough throughputs of the stages that are not calibrated, in pairs per second, measured by the
+# benchmark suite of `tests/benchmark`
+INDEX_PAIRS_PER_SEC = 2_000_000
+SELECTION_PAIRS_PER_SEC = 1_000_000
+
+# The limits a matching run is checked against before it starts: above the 'warn' limits the
+# page warns, above the 'max' limits it refuses to run
+DEFAULT_RUN_LIMITS = {
+    "warn_runtime_s": 60,
+    "max_runtime_s": 3_600,
+    "warn_memory_mb": 2_048,
+    "max_memory_mb": 16_384,
+}
+
+# Default memory budget of the cached calibrations and estimates, shared by all sessions
+ESTIMATE_CACHE_BYTES = 4 * 1024**2
+
+_estimate_cache = LRUCache(ESTIMATE_CACHE_BYTES)
+
+
+def calibrate_comparator(df1, df2, col_dict, num_pairs=CALIBRATION_PAIRS, seed=0) -> float:
+    """
+    Measure the throughput of the comparator of a column on a sample of its values.
+
+    Args:
+        df1 (pandas.DataFrame): The first DataFrame, with its compared columns normalised.
+        df2 (pandas.DataFrame): The second DataFrame, with its compared columns normalised.
+        col_dict (dict): The column information of the compared column, see
+            `utils.data_match.calc_match_scores`.
+        num_pairs (int, optional): The number of pairs of values timed. Default is `CALIBRATION_PAIRS`.
+        seed (int, optional): The seed of the sample. Default is 0.
+
+    Returns:
+        float: The number of pairs scored per second.
+
+    The values are paired at random, so nearly every pair is distinct and none of them benefits
+    from the memoisation of `utils.data_compare.MemoisedString`: the throughput is the lowest a
+    run can reach. The throughput is cached under a hash of the values and the comparator.
+    """
+    rng = np.random.default_rng(seed)
+    sample1 = df1[[col_dict["name1"]]].iloc[rng.integers(0, max(len(df1), 1), num_pairs)]
+    sample2 = df2[[col_dict["name2"]]].iloc[rng.integers(0, max(len(df2), 1), num_pairs)]
+    sample1 = sample1.reset_index(drop=True)
+    sample2 = sample2.reset_index(drop=True)
+    key = ("calibration", hash_frame(sample1), hash_frame(sample2), hash_config(col_dict))
+    calibration = _estimate_cache.get(key)
+    if calibration is not None:
+        return calibration
+
+    candidates = pd.MultiIndex.from_arrays([sample1.index, sample2.index])
+    # Warm up on a few pairs, so the timed run does not pay for imports and first calls
+    score_candidates(candidates[: min(num_pairs, 100)], sample1, sample2, [col_dict])
+    _, wall_time = _timed(score_candidates, candidates, sample1, sample2, [col_dict])
+    pairs_per_sec = num_pairs / max(wall_time, 1e-6)
+    _estimate_cache.put(key, pairs_per_sec)
+    return pairs_per_sec
+
+
+def _timed(function, *args) -> tuple:
+    """Return the result of a function and its wall time."""
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def _sample_rows(df, sample_rows, seed=0) -> pd.DataFrame:
+    """Return a sample of the rows of a DataFrame in their order, or all of them if it is small."""
+    if len(df) <= sample_rows:
+        return df
+    return df.iloc[np.sort(np.random.default_rng(seed).choice(len(df), sample_rows, False))]
+
+
+def estimate_candidate_pairs(
+    df1, df2, index_info=None, sample_rows=ESTIMATE_SAMPLE_ROWS, seed=0
+) -> dict:
+    """
+    Estimate the number of candidate pairs of an indexing strategy, and the time to build them.
+
+    Args:
+        df1 (pandas.DataFrame): The first DataFrame, with its compared columns normalised.
+        df2 (pandas.DataFrame): The second DataFrame, with its compared columns normalised.
+        index_info (dict, optional): The indexing strategy, see
+            `utils.data_index.build_candidate_index`. If None, the full index is used.
+        sample_rows (int, optional): The number of records of df1 the pairs are counted for.
+            Default is `ESTIMATE_SAMPLE_ROWS`.
+        seed (int, optional): The seed of the sample. Default is 0.
+
+    Returns:
+        dict: The estimated number of 'pairs', whether it is 'exact' (counted for every record
+        of df1) and the estimated 'index_s' seconds to build them.
+
+    The pairs of a sample of the records of df1 are counted against all the records of df2,
+    and the count is scaled to all the records of df1. For blocking, this samples the sizes of
+    the blocks of df2 the records of df1 fall in, so large blocks are weighted by how many
+    records of df1 they pair. The similarity indexes cache the index of df2 they look records up
+    in, so the sample is looked up twice: the first lookup times the index of df2, built once
+    per run, and the second the lookup itself, which grows with the records of df1.
+    """
+    if index_info is None:
+        index_info = {"method": "full"}
+    num_pairs_full = len(df1) * len(df2)
+    if index_info["method"] == "full":
+        return {
+            "pairs": num_pairs_full,
+            "exact": True,
+            "index_s": num_pairs_full / INDEX_PAIRS_PER_SEC,
+        }
+
+    sample = _sample_rows(df1, sample_rows, seed)
+    scale = len(df1) / max(len(sample), 1)
+
+    if index_info["method"] in SIMILARITY_INDEX_METHODS:
+        candidates, first_s = _timed(build_candidate_index, sample, df2, index_info)
+        _, lookup_s = _timed(build_candidate_index, sample, df2, index_info)
+        num_pairs = len(candidates) * scale
+        index_s = max(first_s - lookup_s, 0.0) + lookup_s * scale
+    else:
+        num_pairs, count_s = _timed(count_candidate_pairs, sample, df2, index_info)
+        num_pairs *= scale
+        # The keys are derived in time linear in the number of records
+        records_scale = (len(df1) + len(df2)) / max(len(sample) + len(df2), 1)
+        index_s = count_s * records_scale + num_pairs / INDEX_PAIRS_PER_SEC
+    return {
+        "pairs": int(round(min(num_pairs, num_pairs_full))),
+        "exact": len(sample) == len(df1),
+        "index_s": index_s,
+    }
+
+
+def estimate_match_cost(
+    df1,
+    df2,
+    col_info,
+    index_info=None,
+    chunk_size=None,
+    n_jobs=1,
+    sample_rows=ESTIMATE_SAMPLE_ROWS,
+) -> dict:
+    """
+    Estimate the number of candidate pairs, runtime and peak memory of a matching run.
+
+    Args:
+        df1 (pandas.DataFrame): The first DataFrame.
+        df2 (pandas.DataFrame): The second DataFrame.
+        col_info (list): The column information, see `utils.data_match.calc_match_scores`.
+        index_info (dict, optional): The indexing strategy, see `utils.data_match.calc_match_scores`.
+        chunk_size (int, optional): The number of pairs scored at once by a streamed run, see
+            `utils.data_match.stream_top_matches`. Default is None (all pairs at once).
+        n_jobs (int, optional): The number of worker processes scoring the pairs. Default is 1.
+        sample_rows (int, optional): The number of records of df1 the pairs are counted for,
+            see `estimate_candidate_pairs`. Default is `ESTIMATE_SAMPLE_ROWS`.
+
+    Returns:
+        dict: The estimated 'candidate_pairs', whether the count is 'exact', the 'runtime_s' in
+        seconds and the 'peak_memory_mb' of the scores, with the seconds of every stage under
+        'stages' and the calibrated throughput of every comparator in 'pairs_per_sec'.
+
+    The runtime adds up the time to build the candidate pairs, to score them with every
+    comparator at the throughput measured by `calibrate_comparator`, and to select the top
+    matches. The memory is the memory per pair the streamed runs budget their chunks with, for
+    every pair held at once. Both are rough: they are meant to tell a run of minutes from a
+    run of hours, not to time it. The estimate is cached under a hash of the inputs, and the
+    cached dictionary must not be modified.
+    """
+    key = ("estimate",) + match_cache_key(df1, df2, col_info, index_info)
+    key += (chunk_size, n_jobs, sample_rows)
+    estimate = _estimate_cache.get(key)
+    if estimate is not None:
+        return estimate
+
+    df1, df2 = normalise_frames(df1, df2, col_info)
+    if uses_exact_join(col_info, index_info):
+        # Only the pairs equal on a column are scored, see `utils.data_match.uses_exact_join`
+        sample = _sample_rows(df1, sample_rows)
+        columns = [(col_dict["name1"], col_dict["name2"]) for col_dict in col_info]
+        join, index_s = _timed(build_exact_join_index, sample, df2, columns)
+        scale = len(df1) / max(len(sample), 1)
+        pairs = {
+            "pairs": int(round(len(join) * scale)),
+            "exact": len(sample) == len(df1),
+            "index_s": index_s * scale,
+        }
+    else:
+        pairs = estimate_candidate_pairs(df1, df2, index_info, sample_rows)
+    num_pairs = pairs["pairs"]
+
+    pairs_per_sec = {}
+    scoring_s = 0.0
+    for col_dict in col_info:
+        label = col_dict["name1"] + ", " + col_dict["name2"]
+        pairs_per_sec[label] = calibrate_comparator(df1, df2, col_dict)
+        scoring_s += num_pairs / pairs_per_sec[label]
+    scoring_s /= max(n_jobs, 1)
+    stages = {
+        "indexing": pairs["index_s"],
+        "scoring": scoring_s,
+        "selection": num_pairs / SELECTION_PAIRS_PER_SEC,
+    }
+
+    pairs_held = num_pairs
+    if chunk_size is not None:
+        # A streamed run holds up to two chunks per worker process
+        pairs_held = min(num_pairs, chunk_size * 2 * max(n_jobs, 1))
+    bytes_per_pair = BYTES_PER_PAIR + BYTES_PER_PAIR_AND_COLUMN * len(col_info)
+    estimate = {
+        "candidate_pairs": num_pairs,
+        "exact": pairs["exact"],
+        "runtime_s": sum(stages.values()),
+        "peak_memory_mb": pairs_held * bytes_per_pair / 1024**2,
+        "stages": stages,
+        "pairs_per_sec": pairs_per_sec,
+    }
+    _estimate_cache.put(key, estimate)
+    return estimate
+
+
+def check_run_limits(estimate, limits=None) -> tuple:
+    """
+    Check the estimated cost of a matching run against limits.
+
+    Args:
+        estimate (dict): The estimate of `estimate_match_cost`.
+        limits (dict, optional): The limits, with the keys of `DEFAULT_RUN_LIMITS`, missing keys
+            taking their default. Default is None (`DEFAULT_RUN_LIMITS`).
+
+    Returns:
+        tuple: 'ok', 'warn' or 'refuse', and a list of messages explaining the limits exceeded.
+    """
+    limits = {**DEFAULT_RUN_LIMITS, **(limits or {})}
+    status = "ok"
+    messages = []
+    for value, unit, warn_key, max_key, name in [
+        (estimate["runtime_s"], "s", "warn_runtime_s", "max_runtime_s", "runtime"),
+        (estimate["peak_memory_mb"], "MB", "warn_memory_mb", "max_memory_mb", "peak memory"),
+    ]:
+        if value > limits[max_key]:
+            status = "refuse"
+            messages.append(
+                f"The estimated {name} of {value:,.0f} {unit} is over the limit of "
+                f"{limits[max_key]:,.0f} {unit}."
+            )
+        elif value > limits[warn_key]:
+            if status == "ok":
+                status = "warn"
+            messages.append(
+                f"The estimated {name} of {value:,.0f} {unit} is over "
+                f"{limits[warn_key]:,.0f} {unit}."
+            )
+    return status, messages
+
+
+def cheaper_indexers(col_info, index_info=None) -> list:
+    """
+    List indexing strategies that produce fewer candidate pairs than most configurations.
+
+    Args:
+        col_info (list): The column information, see `utils.data_match.calc_match_scores`.
+        index_info (dict, optional): The current indexing strategy, whose blocking keys are
+            reused. Without keys, the first compared column is the key.
+
+    Returns:
+        list: The indexing strategies: a sorted neighbourhood of the normalised first key with
+        the smallest window, and a q-gram index keeping the 10 most similar records, as well as
+        blocking on the keys when the current strategy compares all pairs.
+    """
+    keys = (index_info or {}).get("keys") or [
+        {"name1": col_info[0]["name1"], "name2": col_info[0]["name2"]}
+    ]
+    first_key = {"name1": keys[0]["name1"], "name2": keys[0]["name2"]}
+    indexers = [
+        {
+            "method": "sortedneighbourhood",
+            "keys": [{**first_key, "key": "normalised"}],
+            "window": 3,
+        },
+        {"method": "qgram", "keys": keys, "min_similarity": 0.5, "top_k": 10},
+    ]
+    if index_info is None or index_info["method"] == "full":
+        indexers.insert(0, {"method": "block", "keys": keys})
+    return [indexer for indexer in indexers if indexer != index_info]
+
+
+def suggest_cheaper_indexer(df1, df2, col_info, index_info=None, estimate=None, **kwargs):
+    """
+    Suggest the cheapest of the `cheaper_indexers`, if it is cheaper than the current strategy.
+
+    Args:
+        df1 (pandas.DataFrame): The first DataFrame.
+        df2 (pandas.DataFrame): The second DataFrame.
+        col_info (list): The column information, see `utils.data_match.calc_match_scores`.
+        index_info (dict, optional): The current indexing strategy.
+        estimate (dict, optional): The estimate of the current strategy. Default is None
+            (estimated with `estimate_match_cost`).
+        **kwargs: The options of `estimate_match_cost`.
+
+    Returns:
+        dict or None: The suggested 'index_info' and its 'estimate', or None if no strategy is
+        estimated to run faster.
+    """
+    if estimate is None:
+        estimate = estimate_match_cost(df1, df2, col_info, index_info, **kwargs)
+    suggestion = None
+    for indexer in cheaper_indexers(col_info, index_info):
+        indexer_estimate = estimate_match_cost(df1, df2, col_info, indexer, **kwargs)
+        best = estimate if suggestion is None else suggestion["estimate"]
+        if indexer_estimate["runtime_s"] < best["runtime_s"]:
+            suggestion = {"index_info": indexer, "estimate": indexer_estimate}
+    return suggestion
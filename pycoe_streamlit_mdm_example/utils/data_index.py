@@ -0,0 +1,750 @@
+import recordlinkage as rl
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+
+from utils.data_cache import LRUCache, hash_config, hash_frame
+
+
+BLOCKING_KEY_TYPES = [
+    "value",
+    "normalised",
+    "prefix",
+    "surname_prefix",
+    "phone_last4",
+    "postcode",
+]
+
+NAME_SUFFIXES = {"jr", "sr", "ii", "iii", "iv", "md", "dds", "dvm", "phd"}
+
+# US ZIP codes (optionally ZIP+4) or UK postcodes at the end of the address
+POSTCODE_PATTERN = (
+    r"(\d{5}(?:-\d{4})?|[A-Za-z]{1,2}\d[A-Za-z\d]?\s*\d[A-Za-z]{2})\s*,?\s*$"
+)
+
+# Index methods pairing records by the similarity of their joined key texts
+SIMILARITY_INDEX_METHODS = ["qgram", "minhash"]
+
+# Number of records of df1 looked up in the q-gram index at once
+QGRAM_ROWS_PER_SLICE = 1_000
+
+# Number of records of df1 bucketed against df2 at once by the MinHash index
+MINHASH_ROWS_PER_SLICE = 10_000
+
+# Modulus of the MinHash permutations, a Mersenne prime
+MINHASH_PRIME = (1 << 31) - 1
+
+# Default memory budget of the cache of similarity indexes and their pair counts, shared by all sessions
+INDEX_CACHE_BYTES = 256 * 1024**2
+
+_index_cache = LRUCache(INDEX_CACHE_BYTES)
+
+
+def _surname(series) -> pd.Series:
+    """Return the last name token of each value, ignoring suffixes like 'Jr.' or 'MD'."""
+    tokens = series.str.casefold().str.replace(r"[^\w\s]", "", regex=True).str.split()
+    return tokens.map(
+        lambda parts: next(
+            (part for part in reversed(parts) if part not in NAME_SUFFIXES), None
+        )
+        if isinstance(parts, list)
+        else None
+    )
+
+
+def derive_blocking_key(series, key_type="value", n_chars=3) -> pd.Series:
+    """
+    Derive a blocking key from a column of a DataFrame.
+
+    Args:
+        series (pandas.Series): The column to derive the key from.
+        key_type (str, optional): The type of key to derive. One of:
+            'value' (the raw value), 'normalised' (the value case folded, with everything
+            but letters and digits removed), 'prefix' (the first `n_chars` characters),
+            'surname_prefix' (the first `n_chars` letters of the last name),
+            'phone_last4' (the last four digits of a phone number, ignoring extensions)
+            or 'postcode' (the ZIP code or postcode at the end of an address).
+            Default is 'value'.
+        n_chars (int, optional): The number of characters used by the prefix keys. Default is 3.
+
+    Returns:
+        pandas.Series: The derived key, aligned with `series`. Values for which no key can be
+        derived (e.g. an address without a postcode) are NaN and are never blocked together.
+    """
+    if key_type == "value":
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # Two uploads have different categories, which pandas cannot compare or sort together
+            return series.astype(series.dtype.categories.dtype)
+        return series
+
+    values = series.astype("string")
+    if key_type == "normalised":
+        key = values.str.casefold().str.replace(r"[\W_]+", "", regex=True)
+    elif key_type == "prefix":
+        key = values.str.strip().str.casefold().str[:n_chars]
+    elif key_type == "surname_prefix":
+        key = _surname(values).astype("string").str[:n_chars]
+    elif key_type == "phone_last4":
+        digits = values.str.casefold().str.split("x").str[0].str.replace(
+            r"\D", "", regex=True
+        )
+        key = digits.where(digits.str.len() >= 4).str[-4:]
+    elif key_type == "postcode":
+        key = values.str.extract(POSTCODE_PATTERN, expand=False)
+        key = key.str.upper().str.replace(" ", "", regex=False)
+    else:
+        raise ValueError(f"The blocking key type '{key_type}' is not known.")
+
+    key = key.where(key.str.len() > 0)
+    return key.astype(object).where(key.notna(), None)
+
+
+def build_blocking_keys(df1, df2, keys) -> tuple:
+    """
+    Build DataFrames holding the derived blocking keys of both DataFrames.
+
+    Args:
+        df1 (pandas.DataFrame): The first DataFrame.
+        df2 (pandas.DataFrame): The second DataFrame.
+        keys (list): A list of dictionaries describing the blocking keys.
+            Each dictionary should have the following keys:
+                'name1' (str): The name of the column in df1.
+                'name2' (str): The name of the column in df2.
+                'key' (str, optional): The key type, see `derive_blocking_key`. Default is 'value'.
+                'n_chars' (int, optional): The prefix length for the prefix key types. Default is 3.
+
+    Returns:
+        tuple: Two DataFrames (one per input DataFrame) with one column per blocking key,
+        indexed like the input DataFrames.
+    """
+    return blocking_key_columns(df1, keys, "name1"), blocking_key_columns(df2, keys, "name2")
+
+
+def blocking_key_columns(df, keys, name_key) -> pd.DataFrame:
+    """
+    Build a DataFrame holding the derived blocking keys of one side of the blocking keys.
+
+    Args:
+        df (pandas.DataFrame): The DataFrame.
+        keys (list): The blocking keys, see `build_blocking_keys`.
+        name_key (str): 'name1' if `df` is the first DataFrame of `keys`, 'name2' otherwise.
+
+    Returns:
+        pandas.DataFrame: One column per blocking key, named 'key_0', 'key_1'..., indexed like `df`.
+    """
+    key_columns = pd.DataFrame(index=df.index)
+    for i, key_dict in enumerate(keys):
+        key_columns[f"key_{i}"] = derive_blocking_key(
+            df[key_dict[name_key]], key_dict.get("key", "value"), key_dict.get("n_chars", 3)
+        )
+    return key_columns
+
+
+def build_candidate_index(df1, df2, index_info=None) -> pd.MultiIndex:
+    """
+    Build the candidate record pairs to compare between two DataFrames.
+
+    Args:
+        df1 (pandas.DataFrame): The first DataFrame.
+        df2 (pandas.DataFrame): The second DataFrame.
+        index_info (dict, optional): The indexing strategy. The 'method' key selects it:
+            'full' compares every record of df1 with every record of df2, 'block'
+            only compares records that agree on all of the derived keys listed under
+            'keys' (see `build_blocking_keys`), and 'sortedneighbourhood' sorts both
+            DataFrames on the first key and compares records whose key values are
+            within a sliding window of 'window' (an odd number, default 3) distinct
+            values of each other. Any further keys of a sorted neighbourhood index are
+            used as additional blocking keys. 'qgram' joins the derived keys of each record
+            into one text and pairs the records whose TF-IDF weighted character q-grams
+            have a cosine similarity of at least 'min_similarity' (default 0.3), keeping
+            only the 'top_k' most similar records of df2 for every record of df1 if given,
+            see `qgram_index`. 'minhash' signs the q-grams of the joined keys with
+            'bands' * 'rows' MinHash permutations (default 25 bands of 4 rows) and pairs
+            the records that share the signature of any band, see `minhash_buckets`.
+            If None, the full index is used.
+
+    Returns:
+        pandas.MultiIndex: The candidate record pairs, as (df1 index, df2 index) labels.
+    """
+    if index_info is None:
+        index_info = {"method": "full"}
+
+    if index_info["method"] == "full":
+        indexer = rl.Index()
+        indexer.full()  # Consider all possible pairs
+        return indexer.index(df1, df2)
+    elif index_info["method"] in SIMILARITY_INDEX_METHODS:
+        rows, cols = [np.empty(0, dtype=int)], [np.empty(0, dtype=int)]
+        for slice_rows, slice_cols in _iter_similarity_pairs(df1, df2, index_info):
+            rows.append(slice_rows)
+            cols.append(slice_cols)
+        return pd.MultiIndex.from_arrays(
+            [df1.index[np.concatenate(rows)], df2.index[np.concatenate(cols)]]
+        )
+    else:
+        keys1, keys2 = build_blocking_keys(df1, df2, index_info["keys"])
+        return _index_keys(keys1, keys2, index_info)
+
+
+def exact_join_pairs(df1, df2, columns) -> tuple:
+    """
+    Find the record pairs that are equal on at least one pair of columns, with hash joins.
+
+    Args:
+        df1 (pandas.DataFrame): The first DataFrame.
+        df2 (pandas.DataFrame): The second DataFrame.
+        columns (list): The (column of df1, column of df2) pairs to join on.
+
+    Returns:
+        tuple: The positions of the pairs in df1 and in df2, ordered by df1 and then df2 like
+        the full index. Missing values are never equal, as in an exact comparison.
+
+    Each pair of columns is joined on its values, so the cost is linear in the number of
+    records and in the number of equal pairs, instead of the product of the numbers of records.
+    """
+    codes = [np.empty(0, dtype=np.int64)]
+    for name1, name2 in columns:
+        present1 = df1[name1].notna().to_numpy()
+        present2 = df2[name2].notna().to_numpy()
+        pairs = pd.DataFrame(
+            {
+                "value": df1[name1].to_numpy(dtype=object)[present1],
+                "pos1": np.flatnonzero(present1),
+            }
+        ).merge(
+            pd.DataFrame(
+                {
+                    "value": df2[name2].to_numpy(dtype=object)[present2],
+                    "pos2": np.flatnonzero(present2),
+                }
+            ),
+            on="value",
+        )
+        codes.append(
+            pairs["pos1"].to_numpy(dtype=np.int64) * len(df2)
+            + pairs["pos2"].to_numpy(dtype=np.int64)
+        )
+    codes = np.unique(np.concatenate(codes))
+    return codes // max(len(df2), 1), codes % max(len(df2), 1)
+
+
+def build_exact_join_index(df1, df2, columns) -> pd.MultiIndex:
+    """
+    Build the candidate record pairs that are equal on at least one pair of columns.
+
+    Args:
+        df1 (pandas.DataFrame): The first DataFrame.
+        df2 (pandas.DataFrame): The second DataFrame.
+        columns (list): The (column of df1, column of df2) pairs to join on.
+
+    Returns:
+        pandas.MultiIndex: The pairs of the full index with at least one equal pair of
+        columns, in the order of the full index, see `exact_join_pairs`.
+    """
+    rows, cols = exact_join_pairs(df1, df2, columns)
+    return pd.MultiIndex.from_arrays([df1.index[rows], df2.index[cols]])
+
+
+def _iter_similarity_pairs(df1, df2, index_info):
+    """Yield the positions of the record pairs of a similarity index, a slice of df1 at a time."""
+    if index_info["method"] == "qgram":
+        yield from _iter_qgram_pairs(df1, df2, index_info)
+    elif index_info["method"] == "minhash":
+        yield from _iter_minhash_pairs(df1, df2, index_info)
+    else:
+        raise ValueError(f"The indexing method '{index_info['method']}' is not known.")
+
+
+def join_keys(keys) -> pd.Series:
+    """Join the derived keys of every record into one text, skipping missing keys."""
+    texts = keys.astype("string").fillna("")
+    joined = texts.iloc[:, 0]
+    for col in texts.columns[1:]:
+        joined = joined + " " + texts[col]
+    return joined.str.strip().astype(object)
+
+
+def qgram_index(texts2, q=3, max_df=0.05) -> tuple:
+    """
+    Build the inverted TF-IDF q-gram index of the records of df2, or reuse an earlier one.
+
+    Args:
+        texts2 (pandas.Series): The joined key text of every record of df2.
+        q (int, optional): The length of the character q-grams. Default is 3.
+        max_df (float, optional): The q-grams found in more than this fraction of the records
+            (and in more than 100 records) are left out of the index, as they pair too many
+            records while saying little about them. Default is 0.05.
+
+    Returns:
+        tuple: The fitted vectorizer, and the index as a sparse matrix with one row per q-gram
+        holding its TF-IDF weight in every record of df2 (the posting list of the q-gram).
+        The index is None if the records have no q-grams.
+
+    The index only depends on the contents of df2 and the parameters, so it is cached under a
+    hash of both and shared by all matching runs against the same frame.
+    """
+    key = (hash_frame(texts2.to_frame()), q, max_df)
+    index = _index_cache.get(key)
+    if index is not None:
+        return index
+
+    vectorizer = TfidfVectorizer(
+        analyzer="char_wb",
+        ngram_range=(q, q),
+        max_df=max(int(max_df * len(texts2)), 100),
+        dtype=np.float32,
+    )
+    try:
+        inverted = vectorizer.fit_transform(texts2).T.tocsr()
+    except ValueError:  # No q-grams left in the records
+        vectorizer, inverted = None, None
+
+    nbytes = 0
+    if inverted is not None:
+        nbytes = inverted.data.nbytes + inverted.indices.nbytes + inverted.indptr.nbytes
+        nbytes += 100 * len(vectorizer.vocabulary_)
+    _index_cache.put(key, (vectorizer, inverted), nbytes=nbytes)
+    return vectorizer, inverted
+
+
+def _iter_qgram_pairs(df1, df2, index_info):
+    """
+    Look up the records of df1 in the q-gram index of df2, a slice of records at a time.
+
+    Yields the positions of the paired records in df1 and df2, ordered by df1 and then df2.
+    """
+    keys1, keys2 = build_blocking_keys(df1, df2, index_info["keys"])
+    texts1, texts2 = join_keys(keys1), join_keys(keys2)
+    vectorizer, inverted = qgram_index(
+        texts2, index_info.get("q", 3), index_info.get("max_df", 0.05)
+    )
+    if inverted is None:
+        return
+    yield from iter_qgram_lookup(
+        texts1,
+        vectorizer,
+        inverted,
+        index_info.get("min_similarity", 0.3),
+        index_info.get("top_k"),
+    )
+
+
+def iter_qgram_lookup(texts1, vectorizer, inverted, min_similarity=0.3, top_k=None):
+    """
+    Look up texts in a q-gram index, a slice of texts at a time.
+
+    Args:
+        texts1 (pandas.Series): The texts to look up.
+        vectorizer (sklearn.feature_extraction.text.TfidfVectorizer): The vectorizer of the index,
+            see `qgram_index`.
+        inverted (scipy.sparse.csr_matrix): The inverted index, one row per q-gram.
+        min_similarity (float, optional): The lowest cosine similarity of a pair. Default is 0.3.
+        top_k (int, optional): The largest number of indexed records paired with every text,
+            keeping the most similar. Default is None (no limit).
+
+    Yields the positions of the paired texts and indexed records, ordered by text and then record.
+    """
+    for start in range(0, len(texts1), QGRAM_ROWS_PER_SLICE):
+        similarities = (
+            vectorizer.transform(texts1.iloc[start : start + QGRAM_ROWS_PER_SLICE])
+            @ inverted
+        ).tocsr()
+        similarities.data[similarities.data < min_similarity] = 0
+        similarities.eliminate_zeros()
+        similarities.sort_indices()
+        rows = np.repeat(np.arange(similarities.shape[0]), np.diff(similarities.indptr))
+        cols = similarities.indices
+        if top_k is not None:
+            # Rank the pairs of every record by descending similarity, keeping df2 order on ties
+            order = np.lexsort((-similarities.data, rows))
+            rank = np.arange(len(order)) - similarities.indptr[rows[order]]
+            kept = np.sort(order[rank < top_k])
+            rows, cols = rows[kept], cols[kept]
+        yield start + rows, cols
+
+
+def _shingles(texts, q=3):
+    """Return the hashed character q-grams of every text, as a binary sparse matrix."""
+    vectorizer = HashingVectorizer(
+        analyzer="char_wb",
+        ngram_range=(q, q),
+        n_features=2**20,
+        binary=True,
+        norm=None,
+        alternate_sign=False,
+    )
+    return vectorizer.transform(texts).tocsr()
+
+
+def minhash_signatures(shingles, num_perm, seed=0) -> np.ndarray:
+    """
+    Compute the MinHash signatures of sets of shingles.
+
+    Args:
+        shingles (scipy.sparse.csr_matrix): The binary shingle matrix, with one row per record.
+        num_perm (int): The number of hash permutations, i.e. the length of the signatures.
+        seed (int, optional): The seed of the permutations. Default is 0.
+
+    Returns:
+        numpy.ndarray: One signature per row. The signature of a record without shingles is
+        made of `MINHASH_PRIME` values, which no hashed shingle reaches.
+
+    Each permutation is a random linear hash modulo `MINHASH_PRIME`, applied to all shingles
+    of all records at once, and its minimum over the shingles of every record is one value
+    of the signatures. Two records have the same value with a probability equal to the
+    Jaccard similarity of their shingle sets.
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, MINHASH_PRIME, num_perm)
+    b = rng.integers(0, MINHASH_PRIME, num_perm)
+    indices = shingles.indices.astype(np.int64)
+    nonempty = np.diff(shingles.indptr) > 0
+    starts = shingles.indptr[:-1][nonempty]
+
+    signatures = np.full((shingles.shape[0], num_perm), MINHASH_PRIME, dtype=np.int64)
+    if len(indices):
+        for perm in range(num_perm):
+            hashed = (a[perm] * indices + b[perm]) % MINHASH_PRIME
+            signatures[nonempty, perm] = np.minimum.reduceat(hashed, starts)
+    return signatures
+
+
+def minhash_buckets(texts, q=3, bands=25, rows=4, seed=0) -> tuple:
+    """
+    Bucket records by the bands of the MinHash signatures of their q-grams, or reuse earlier buckets.
+
+    Args:
+        texts (pandas.Series): The joined key text of every record.
+        q (int, optional): The length of the character q-grams. Default is 3.
+        bands (int, optional): The number of bands. More bands find more candidate pairs. Default is 25.
+        rows (int, optional): The number of signature values per band. More rows make a band
+            more selective, so fewer and more similar pairs share a bucket. Default is 4.
+        seed (int, optional): The seed of the MinHash permutations. Default is 0.
+
+    Returns:
+        tuple: The bucket of every record in every band, as an array of one row per record
+        and one column per band, and a boolean array marking the records with q-grams (the
+        others are never paired).
+
+    Two records with a Jaccard similarity s of their q-gram sets share a bucket in at least
+    one band with a probability of 1 - (1 - s ** rows) ** bands. The buckets only depend on
+    the texts and the parameters, so they are cached under a hash of both.
+    """
+    key = ("minhash", hash_frame(texts.to_frame()), q, bands, rows, seed)
+    cached = _index_cache.get(key)
+    if cached is not None:
+        return cached
+
+    shingles = _shingles(texts, q)
+    signatures = minhash_signatures(shingles, bands * rows, seed)
+    buckets = np.empty((len(texts), bands), dtype=np.uint64)
+    for band in range(bands):
+        buckets[:, band] = pd.util.hash_pandas_object(
+            pd.DataFrame(signatures[:, band * rows : (band + 1) * rows]), index=False
+        ).to_numpy()
+    nonempty = np.diff(shingles.indptr) > 0
+    _index_cache.put(key, (buckets, nonempty))
+    return buckets, nonempty
+
+
+def _minhash_params(index_info) -> tuple:
+    return (
+        index_info.get("q", 3),
+        index_info.get("bands", 25),
+        index_info.get("rows", 4),
+        index_info.get("seed", 0),
+    )
+
+
+def _minhash_pairs(buckets1, positions1, buckets2, positions2, num_records2) -> tuple:
+    """Join records of df1 and df2 sharing a bucket in any band, returning sorted unique positions."""
+    codes = [np.empty(0, dtype=np.int64)]
+    for band in range(buckets1.shape[1]):
+        pairs = pd.DataFrame(
+            {"bucket": buckets1[positions1, band], "pos1": positions1}
+        ).merge(
+            pd.DataFrame({"bucket": buckets2[positions2, band], "pos2": positions2}),
+            on="bucket",
+        )
+        codes.append(
+            pairs["pos1"].to_numpy(dtype=np.int64) * num_records2
+            + pairs["pos2"].to_numpy(dtype=np.int64)
+        )
+    codes = np.unique(np.concatenate(codes))
+    return codes // num_records2, codes % num_records2
+
+
+def _iter_minhash_pairs(df1, df2, index_info):
+    """
+    Pair the records of df1 with the records of df2 sharing a MinHash bucket, a slice at a time.
+
+    Yields the positions of the paired records in df1 and df2, ordered by df1 and then df2.
+    """
+    keys1, keys2 = build_blocking_keys(df1, df2, index_info["keys"])
+    texts1, texts2 = join_keys(keys1), join_keys(keys2)
+    params = _minhash_params(index_info)
+    buckets1, nonempty1 = minhash_buckets(texts1, *params)
+    buckets2, nonempty2 = minhash_buckets(texts2, *params)
+    positions2 = np.flatnonzero(nonempty2)
+    for start in range(0, len(texts1), MINHASH_ROWS_PER_SLICE):
+        positions1 = start + np.flatnonzero(
+            nonempty1[start : start + MINHASH_ROWS_PER_SLICE]
+        )
+        yield _minhash_pairs(buckets1, positions1, buckets2, positions2, len(texts2))
+
+
+def estimate_minhash_recall(
+    df1, df2, index_info, min_similarity=0.5, sample_size=200, seed=0
+) -> dict:
+    """
+    Estimate the recall of a MinHash index against the full index.
+
+    Args:
+        df1 (pandas.DataFrame): The first DataFrame.
+        df2 (pandas.DataFrame): The second DataFrame.
+        index_info (dict): The MinHash indexing strategy, see `build_candidate_index`.
+        min_similarity (float, optional): The Jaccard similarity of the q-gram sets from which
+            a pair of the full index counts as a pair that should be found. Default is 0.5.
+        sample_size (int, optional): The number of records of df1 sampled. Default is 200.
+        seed (int, optional): The seed of the sample. Default is 0.
+
+    Returns:
+        dict: The estimated recall ('recall'), the number of pairs of the sampled records
+        reaching `min_similarity` it is measured on ('reference_pairs'), and the recall
+        expected at exactly `min_similarity` from the bands and rows ('expected_recall').
+        The recall is None if no sampled pair reaches `min_similarity`.
+
+    The sampled records of df1 are compared with every record of df2, as the full index
+    would, by computing the exact Jaccard similarity of their q-gram sets with one sparse
+    product. The recall is the fraction of the pairs reaching `min_similarity` that share
+    a MinHash bucket. Estimates are cached, like the pair counts.
+    """
+    q, bands, rows, minhash_seed = _minhash_params(index_info)
+    keys1, keys2 = build_blocking_keys(df1, df2, index_info["keys"])
+    texts1, texts2 = join_keys(keys1), join_keys(keys2)
+    key = (
+        "recall",
+        hash_frame(texts1.to_frame()),
+        hash_frame(texts2.to_frame()),
+        q,
+        bands,
+        rows,
+        minhash_seed,
+        min_similarity,
+        sample_size,
+        seed,
+    )
+    estimate = _index_cache.get(key)
+    if estimate is not None:
+        return estimate
+
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(len(texts1), min(sample_size, len(texts1)), replace=False))
+
+    shingles1 = _shingles(texts1.iloc[sample], q)
+    shingles2 = _shingles(texts2, q)
+    intersections = (shingles1 @ shingles2.T).tocoo()
+    sizes1 = np.diff(shingles1.indptr)[intersections.row]
+    sizes2 = np.diff(shingles2.indptr)[intersections.col]
+    jaccard = intersections.data / (sizes1 + sizes2 - intersections.data)
+    reached = jaccard >= min_similarity
+    reference = sample[intersections.row[reached]].astype(np.int64) * len(texts2)
+    reference += intersections.col[reached]
+
+    buckets1, nonempty1 = minhash_buckets(texts1, q, bands, rows, minhash_seed)
+    buckets2, nonempty2 = minhash_buckets(texts2, q, bands, rows, minhash_seed)
+    found1, found2 = _minhash_pairs(
+        buckets1,
+        sample[nonempty1[sample]],
+        buckets2,
+        np.flatnonzero(nonempty2),
+        len(texts2),
+    )
+    found = found1 * len(texts2) + found2
+
+    estimate = {
+        "recall": float(np.isin(reference, found).mean()) if len(reference) else None,
+        "reference_pairs": int(len(reference)),
+        "expected_recall": 1 - (1 - min_similarity**rows) ** bands,
+    }
+    _index_cache.put(key, estimate)
+    return estimate
+
+
+def _sorting_key_values(keys1, keys2) -> np.ndarray:
+    """Return the sorted distinct sorting key values of both DataFrames."""
+    keys1 = keys1.dropna()
+    keys2 = keys2.dropna()
+    return np.unique(np.concatenate([keys1["key_0"].values, keys2["key_0"].values]))
+
+
+def _window(index_info) -> int:
+    """Return the window of a sorted neighbourhood index, checking that it is a positive odd integer."""
+    window = index_info.get("window", 3)
+    is_integer = isinstance(window, (int, np.integer)) and not isinstance(window, bool)
+    if not is_integer or window < 1 or window % 2 == 0:
+        raise ValueError(
+            f"The window of a sorted neighbourhood index must be a positive odd integer, not {window!r}."
+        )
+    return int(window)
+
+
+def _index_keys(keys1, keys2, index_info, sorting_key_values=None) -> pd.MultiIndex:
+    """Build the candidate record pairs of a blocking based index from the derived keys."""
+    indexer = rl.Index()
+    if index_info["method"] == "block":
+        indexer.block(left_on=list(keys1.columns), right_on=list(keys2.columns))
+    elif index_info["method"] == "sortedneighbourhood":
+        indexer.sortedneighbourhood(
+            left_on=keys1.columns[0],
+            right_on=keys2.columns[0],
+            window=_window(index_info),
+            sorting_key_values=sorting_key_values,
+            block_left_on=list(keys1.columns[1:]),
+            block_right_on=list(keys2.columns[1:]),
+        )
+    else:
+        raise ValueError(f"The indexing method '{index_info['method']}' is not known.")
+    return indexer.index(keys1, keys2)
+
+
+def _count_record_pairs(keys1, keys2, index_info, sorting_key_values=None) -> np.ndarray:
+    """Count the candidate pairs of every record of df1 of a blocking based index."""
+    columns = list(keys1.columns)
+    present = keys1.notna().all(axis=1).to_numpy()
+    counts = np.zeros(len(keys1), dtype=np.int64)
+    left = keys1[present]
+    right = keys2.dropna()
+    if index_info["method"] == "sortedneighbourhood":
+        left = left.assign(key_0=np.searchsorted(sorting_key_values, left["key_0"].values))
+        right = right.assign(key_0=np.searchsorted(sorting_key_values, right["key_0"].values))
+        offsets = range(-((_window(index_info) - 1) // 2), (_window(index_info) - 1) // 2 + 1)
+    elif index_info["method"] == "block":
+        offsets = [0]
+    else:
+        raise ValueError(f"The indexing method '{index_info['method']}' is not known.")
+    sizes2 = right.value_counts().rename("size2").reset_index()
+    for offset in offsets:
+        lagged = sizes2.assign(key_0=sizes2["key_0"] + offset) if offset else sizes2
+        # A left join keeps the order of the records of df1
+        sizes = left.merge(lagged, on=columns, how="left")["size2"]
+        counts[present] += sizes.fillna(0).to_numpy(dtype=np.int64)
+    return counts
+
+
+def iter_candidate_chunks(df1, df2, index_info=None, chunk_size=100_000):
+    """
+    Generate the candidate record pairs of an indexing strategy in chunks.
+
+    Args:
+        df1 (pandas.DataFrame): The first DataFrame.
+        df2 (pandas.DataFrame): The second DataFrame.
+        index_info (dict, optional): The indexing strategy, see `build_candidate_index`.
+        chunk_size (int, optional): The maximum number of record pairs per chunk. Default is 100,000.
+
+    Yields:
+        pandas.MultiIndex: Consecutive chunks of the candidate record pairs.
+
+    The records of df1 are indexed in slices holding at most `chunk_size` pairs, sized from
+    the number of pairs of every record, so a large block does not make its slice larger. All
+    pairs of a record of df1 are produced by the same slice, in the same order as
+    `build_candidate_index` produces them, so a record with more than `chunk_size` pairs (e.g.
+    in a block larger than `chunk_size` in df2) is indexed alone and its pairs are split before
+    they are yielded.
+    """
+    if index_info is None:
+        index_info = {"method": "full"}
+
+    if index_info["method"] == "full":
+        rows_per_chunk = max(1, chunk_size // max(len(df2), 1))
+        for start in range(0, len(df1), rows_per_chunk):
+            yield pd.MultiIndex.from_product(
+                [df1.index[start : start + rows_per_chunk], df2.index]
+            )
+        return
+    if index_info["method"] in SIMILARITY_INDEX_METHODS:
+        for rows, cols in _iter_similarity_pairs(df1, df2, index_info):
+            for pair_start in range(0, len(rows), chunk_size):
+                pair_stop = pair_start + chunk_size
+                yield pd.MultiIndex.from_arrays(
+                    [
+                        df1.index[rows[pair_start:pair_stop]],
+                        df2.index[cols[pair_start:pair_stop]],
+                    ]
+                )
+        return
+
+    keys1, keys2 = build_blocking_keys(df1, df2, index_info["keys"])
+    sorting_key_values = None
+    if index_info["method"] == "sortedneighbourhood":
+        sorting_key_values = _sorting_key_values(keys1, keys2)
+    pair_ends = np.cumsum(_count_record_pairs(keys1, keys2, index_info, sorting_key_values))
+    start = 0
+    while start < len(keys1):
+        # The slice ends at the last record keeping it within chunk_size, and holds at least one
+        pairs_before = pair_ends[start - 1] if start else 0
+        stop = max(start + 1, int(np.searchsorted(pair_ends, pairs_before + chunk_size, "right")))
+        candidates = _index_keys(keys1.iloc[start:stop], keys2, index_info, sorting_key_values)
+        for pair_start in range(0, len(candidates), chunk_size):
+            yield candidates[pair_start : pair_start + chunk_size]
+        start = stop
+
+
+def count_candidate_pairs(df1, df2, index_info=None) -> int:
+    """
+    Count the candidate record pairs an indexing strategy produces, without building them.
+
+    Args:
+        df1 (pandas.DataFrame): The first DataFrame.
+        df2 (pandas.DataFrame): The second DataFrame.
+        index_info (dict, optional): The indexing strategy, see `build_candidate_index`.
+
+    Returns:
+        int: The number of candidate record pairs.
+
+    For blocking, the count is the sum over all blocks of the block size in df1 multiplied by
+    the block size in df2, so it only needs the block sizes and never the pairs themselves.
+    For the sorted neighbourhood index, the blocks are the distinct sorting key values and
+    the block sizes of df1 are paired with those of df2 for every offset within the window.
+    The similarity indexes have to look the records up to count their pairs, so their counts
+    are cached.
+    """
+    if index_info is None or index_info["method"] == "full":
+        return len(df1) * len(df2)
+    if index_info["method"] in SIMILARITY_INDEX_METHODS:
+        key = ("count", hash_frame(df1), hash_frame(df2), hash_config(index_info))
+        num_pairs = _index_cache.get(key)
+        if num_pairs is None:
+            num_pairs = sum(
+                len(rows) for rows, _ in _iter_similarity_pairs(df1, df2, index_info)
+            )
+            _index_cache.put(key, num_pairs)
+        return num_pairs
+    keys1, keys2 = build_blocking_keys(df1, df2, index_info["keys"])
+    return _count_keys(keys1, keys2, index_info)
+
+
+def _count_keys(keys1, keys2, index_info) -> int:
+    """Count the candidate record pairs of a blocking based index from the derived keys."""
+    if index_info["method"] == "block":
+        sizes1 = keys1.value_counts(dropna=True).rename("size1")
+        sizes2 = keys2.value_counts(dropna=True).rename("size2")
+        sizes = pd.concat([sizes1, sizes2], axis=1, join="inner")
+        return int((sizes["size1"] * sizes["size2"]).sum())
+    elif index_info["method"] == "sortedneighbourhood":
+        sorting_key_values = _sorting_key_values(keys1, keys2)
+        keys1 = keys1.dropna()
+        keys2 = keys2.dropna()
+        keys1["key_0"] = np.searchsorted(sorting_key_values, keys1["key_0"].values)
+        keys2["key_0"] = np.searchsorted(sorting_key_values, keys2["key_0"].values)
+        sizes1 = keys1.value_counts().rename("size1").reset_index()
+        sizes2 = keys2.value_counts().rename("size2").reset_index()
+        half_window = (_window(index_info) - 1) // 2
+        num_pairs = 0
+        for offset in range(-half_window, half_window + 1):
+            lagged = sizes2.assign(key_0=sizes2["key_0"] + offset)
+            sizes = sizes1.merge(lagged, on=list(keys1.columns))
+            num_pairs += int((sizes["size1"] * sizes["size2"]).sum())
+        return num_pairs
+    else:
+        raise ValueError(f"The indexing method '{index_info['method']}' is not known.")
@@ -0,0 +1,268 @@
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.ipc
+import pyarrow.parquet
+
+UPLOAD_FORMATS = ["csv", "parquet", "feather"]
+
+# The dtype of text columns
+STRING_DTYPE = pd.StringDtype("pyarrow")
+
+# Number of rows read and compacted at a time, so that the uncompacted values of a large file
+# are never all held in memory at once
+INGEST_CHUNK_ROWS = 100_000
+
+# Text columns whose share of distinct values is at most this are stored as categoricals
+MAX_CATEGORY_RATIO = 0.5
+
+# Number of values of a text column tried as dates before parsing the whole column
+DATE_SAMPLE_ROWS = 1_000
+
+# Default memory budget of the cache of parsed uploads of a session
+UPLOAD_CACHE_BYTES = 1024**3
+
+
+def upload_format(file) -> str:
+    """Return the format of an uploaded file, one of `UPLOAD_FORMATS`, from its file name."""
+    extension = os.path.splitext(getattr(file, "name", str(file)))[1].lstrip(".").lower()
+    if extension not in UPLOAD_FORMATS:
+        raise ValueError(f"The file format '{extension}' is not supported.")
+    return extension
+
+
+def _compact_chunk(chunk) -> pd.DataFrame:
+    """Store the text columns of a chunk as strings and downcast its integer columns."""
+    for col in chunk.columns:
+        values = chunk[col]
+        if values.dtype == object or isinstance(values.dtype, pd.StringDtype):
+            chunk[col] = values.astype(STRING_DTYPE)
+        elif pd.api.types.is_integer_dtype(values.dtype):
+            chunk[col] = pd.to_numeric(values, downcast="integer")
+    return chunk
+
+
+def _parse_date_column(values):
+    """Parse a text column as ISO 8601 dates, or return None if any of its values is not one."""
+    present = values.dropna()
+    if len(present) == 0:
+        return None
+    sample = pd.to_datetime(present.iloc[:DATE_SAMPLE_ROWS], errors="coerce", format="ISO8601")
+    if sample.isna().any():
+        return None
+    parsed = pd.to_datetime(values, errors="coerce", format="ISO8601")
+    if parsed.isna().sum() != values.isna().sum():
+        return None
+    return parsed
+
+
+def compact_dtypes(df, max_category_ratio=MAX_CATEGORY_RATIO, parse_dates=True) -> pd.DataFrame:
+    """
+    Store the columns of a DataFrame with compact dtypes.
+
+    Args:
+        df (pandas.DataFrame): The DataFrame, modified in place.
+        max_category_ratio (float, optional): Text columns with at most this share of distinct
+            values are stored as categoricals. Default is `MAX_CATEGORY_RATIO`.
+        parse_dates (bool, optional): Whether to parse text columns that only hold ISO 8601
+            dates. Default is True.
+
+    Returns:
+        pandas.DataFrame: The DataFrame. Text columns are Arrow-backed strings, integer columns are
+        downcast to the smallest integer type holding them.
+
+    Only lossless conversions are made: a column is parsed as dates only if every one of its
+    values is a date, and floats are kept at full precision.
+    """
+    df = _compact_chunk(df)
+    for col in df.columns:
+        values = df[col]
+        if not isinstance(values.dtype, pd.StringDtype):
+            continue
+        if parse_dates:
+            parsed = _parse_date_column(values)
+            if parsed is not None:
+                df[col] = parsed
+                continue
+        if values.nunique() <= max_category_ratio * len(values):
+            df[col] = values.astype("category")
+    return df
+
+
+def _concat_chunks(chunks) -> pd.DataFrame:
+    """Concatenate compacted chunks, storing a column as strings if it is text in any chunk."""
+    if not chunks:
+        return pd.DataFrame()
+    text_columns = {
+        col
+        for chunk in chunks
+        for col in chunk.columns
+        if isinstance(chunk[col].dtype, pd.StringDtype)
+    }
+    for chunk in chunks:
+        for col in text_columns:
+            # e.g. a column only missing values in some chunks, read as floats there
+            if not isinstance(chunk[col].dtype, pd.StringDtype):
+                chunk[col] = chunk[col].astype(STRING_DTYPE)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def _iter_chunks(file, file_format, chunk_rows) -> iter:
+    """Yield the chunks of an uploaded file as DataFrames."""
+    if file_format == "csv":
+        yield from pd.read_csv(file, chunksize=chunk_rows)
+        return
+
+    if file_format == "parquet":
+        batches = pyarrow.parquet.ParquetFile(file).iter_batches(batch_size=chunk_rows)
+    else:
+        reader = pyarrow.ipc.open_file(file)
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    for batch in batches:
+        yield batch.to_pandas()
+
+
+def read_upload(file, chunk_rows=INGEST_CHUNK_ROWS, compact=True) -> pd.DataFrame:
+    """
+    Read an uploaded CSV, Parquet or Feather file in chunks.
+
+    Args:
+        file (str or file-like): The path of the file, or a file object with a `name` attribute
+            such as a Streamlit upload. The format is taken from the file extension.
+        chunk_rows (int, optional): The number of rows read at a time. Default is `INGEST_CHUNK_ROWS`.
+        compact (bool, optional): Whether to store the columns with compact dtypes, see
+            `compact_dtypes`. Default is True.
+
+    Returns:
+        pandas.DataFrame: The contents of the file.
+
+    Every chunk has its text stored as strings before the next one is read, so reading a file
+    never holds more than one chunk of Python string objects. Categoricals and dates are only
+    inferred once the whole file is read, as they depend on all the values of a column.
+    """
+    file_format = upload_format(file)
+    chunks = []
+    for chunk in _iter_chunks(file, file_format, chunk_rows):
+        chunks.append(_compact_chunk(chunk) if compact else chunk)
+    df = _concat_chunks(chunks)
+    if compact:
+        df = compact_dtypes(df)
+    return df
+
+
+def hash_upload(file) -> str:
+    """
+    Compute a content hash of an uploaded file.
+
+    Args:
+        file (str or file-like): The path of the file, or a file object such as a Streamlit upload.
+
+    Returns:
+        str: A hex digest of the file name extension and bytes, so the same bytes uploaded
+        under another name resolve to the same parsed frame as long as the format is the same.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(upload_format(file).encode())
+    if hasattr(file, "getvalue"):
+        digest.update(file.getbuffer() if hasattr(file, "getbuffer") else file.getvalue().encode())
+    else:
+        with open(file, "rb") as f:
+            for block in iter(lambda: f.read(1024**2), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def upload_digest(file, upload_hashes=None) -> str:
+    """
+    Return the content hash of an uploaded file, see `hash_upload`.
+
+    Args:
+        file (str or file-like): The uploaded file, see `read_upload`.
+        upload_hashes (dict, optional): The content hashes of earlier uploads by Streamlit file
+            id, filled by this function. A rerun of a page holding the same upload then finds
+            its hash without hashing the bytes again. Default is None.
+
+    Returns:
+        str: The content hash of the file.
+    """
+    file_id = getattr(file, "file_id", None)
+    if upload_hashes is not None and file_id in upload_hashes:
+        return upload_hashes[file_id]
+    digest = hash_upload(file)
+    if upload_hashes is not None and file_id is not None:
+        upload_hashes[file_id] = digest
+    return digest
+
+
+def cached_read_upload(cache, file, upload_hashes=None, **kwargs) -> tuple:
+    """
+    Read an uploaded file, reusing the frame parsed from the same bytes by an earlier call.
+
+    Args:
+        cache (utils.data_cache.LRUCache): The cache of parsed frames, keyed by `hash_upload`.
+        file (str or file-like): The uploaded file, see `read_upload`.
+        upload_hashes (dict, optional): The content hashes of earlier uploads, see
+            `upload_digest`. Default is None.
+        **kwargs: The options of `read_upload`.
+
+    Returns:
+        tuple: The DataFrame, shared with the cache so it must not be modified, and its content
+        hash. A frame evicted from the cache is parsed again into a new object, so callers
+        should compare uploads by hash rather than by identity.
+    """
+    digest = upload_digest(file, upload_hashes)
+    key = (digest, tuple(sorted(kwargs.items())))
+    df = cache.get(key)
+    if df is None:
+        if hasattr(file, "seek"):
+            file.seek(0)
+        df = read_upload(file, **kwargs)
+        cache.put(key, df)
+    return df, digest
+
+
+def memory_summary(df) -> pd.DataFrame:
+    """
+    Summarise the memory footprint of a DataFrame.
+
+    Args:
+        df (pandas.DataFrame): The DataFrame.
+
+    Returns:
+        pandas.DataFrame: One row per column with its dtype, its memory in MB, and the memory in
+        MB it would take with the default dtypes (Python objects for text and dates, 64 bits for
+        numbers), followed by a 'Total' row including the index.
+    """
+    summary = pd.DataFrame(
+        {
+            "dtype": [str(dtype) for dtype in df.dtypes],
+            "memory_mb": [
+                df[col].memory_usage(index=False, deep=True) / 1024**2 for col in df.columns
+            ],
+            "default_memory_mb": [
+                _default_memory(df[col]) / 1024**2 for col in df.columns
+            ],
+        },
+        index=pd.Index([str(col) for col in df.columns], name="column"),
+    )
+    index_mb = df.index.memory_usage(deep=True) / 1024**2
+    summary.loc["Total"] = [
+        "",
+        summary["memory_mb"].sum() + index_mb,
+        summary["default_memory_mb"].sum() + index_mb,
+    ]
+    return summary
+
+
+def _default_memory(values) -> int:
+    """Estimate the memory a column would take with the dtypes pandas infers by default."""
+    if pd.api.types.is_bool_dtype(values.dtype):
+        return len(values) * np.dtype(bool).itemsize
+    if pd.api.types.is_numeric_dtype(values.dtype) and not isinstance(
+        values.dtype, pd.CategoricalDtype
+    ):
+        return len(values) * np.dtype(np.float64).itemsize
+    # Text as read by default, dates included, is held by Python string objects
+    return int(values.astype("string").astype(object).memory_usage(index=False, deep=True))
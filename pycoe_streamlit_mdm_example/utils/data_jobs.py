@@ -0,0 +1,103 @@
+import threading
+import time
+
+
+class MatchCancelled(Exception):
+    """Raised by the progress callback of a cancelled `MatchJob` to stop its matching run."""
+
+
+class MatchJob:
+    """
+    Run a matching function in a background thread, tracking its progress and allowing it to be cancelled.
+
+    Args:
+        function (callable): The matching run, called with a `progress` keyword argument, the
+            callback that the functions of `utils.data_match` report the pairs scored to.
+        total_pairs (int, optional): The expected number of candidate pairs, used for the
+            progress until the run reports its own total. Default is None.
+
+    The job is meant to be kept in the session state of a page, so that the run keeps going
+    while the page reruns for every widget interaction, and its result is picked up by a later
+    rerun once it is done. The job never calls Streamlit itself. A cancelled run stops at its
+    next progress report, at the end of the chunk or partition being scored.
+    """
+
+    def __init__(self, function, total_pairs=None):
+        self.function = function
+        self.total_pairs = total_pairs
+        self.pairs_done = 0
+        self.result = None
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self._cancel_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> "MatchJob":
+        """Start the run in its thread, and return the job."""
+        self.started_at = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        try:
+            self.result = self.function(progress=self._report_progress)
+        except MatchCancelled:
+            pass
+        except Exception as error:
+            self.error = error
+        finally:
+            self.finished_at = time.perf_counter()
+        return None
+
+    def _report_progress(self, pairs_done, pairs_total=None) -> None:
+        """Record the progress of the run, stopping it if it was cancelled."""
+        if self._cancel_event.is_set():
+            raise MatchCancelled()
+        self.pairs_done = pairs_done
+        if pairs_total is not None:
+            self.total_pairs = pairs_total
+        return None
+
+    def cancel(self) -> None:
+        """Ask the run to stop at its next progress report."""
+        self._cancel_event.set()
+        return None
+
+    def wait(self, timeout=None) -> str:
+        """Wait for the run to finish, at most `timeout` seconds, and return its status."""
+        self._thread.join(timeout)
+        return self.status
+
+    @property
+    def status(self) -> str:
+        """'pending', 'running', 'done', 'failed' or 'cancelled'."""
+        if self.started_at is None:
+            return "pending"
+        if self._thread.is_alive():
+            return "running"
+        if self.error is not None:
+            return "failed"
+        if self._cancel_event.is_set() and self.result is None:
+            return "cancelled"
+        return "done"
+
+    @property
+    def progress(self) -> float:
+        """The share of the candidate pairs scored, between 0 and 1."""
+        if self.status == "pending":
+            return 0.0
+        if self.status != "running":
+            return 1.0
+        if not self.total_pairs:
+            return 0.0
+        # The total is an estimate for some runs, so the bar stops short of full until the end
+        return min(self.pairs_done / self.total_pairs, 0.99)
+
+    @property
+    def elapsed_s(self) -> float:
+        """The seconds the run has been running for, or ran for once finished."""
+        if self.started_at is None:
+            return 0.0
+        end = self.finished_at if self.finished_at is not None else time.perf_counter()
+        return end - self.started_at
@@ -0,0 +1,495 @@
+import json
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import hstack, load_npz, save_npz
+
+from utils.data_cache import LRUCache
+from utils.data_index import blocking_key_columns, iter_qgram_lookup, join_keys, qgram_index
+from utils.data_match import get_top_matches, score_candidates
+from utils.data_merge import merge_golden_records
+from utils.data_normalise import normalise_frame, parse_dates
+
+# The indexing methods a master store can look new records up with
+MASTER_INDEX_METHODS = ["block", "qgram"]
+
+# Number of rows per Parquet row group. Every part is sorted so that the row groups hold
+# ranges of record ids, entity ids or keys, and lookups only read the row groups they need.
+MASTER_ROW_GROUP_ROWS = 65_536
+
+# Columns added to the master records
+RECORD_ID = "_record_id"
+ENTITY_ID = "_entity_id"
+NORMALISED_PREFIX = "_normalised_"
+
+# Number of parts of a store directory, one per batch, past which they are compacted into one
+MASTER_COMPACT_PARTS = 16
+
+# Default memory budget of the q-gram indexes of master stores loaded by the process
+MASTER_INDEX_CACHE_BYTES = 256 * 1024**2
+
+_master_indexes = LRUCache(MASTER_INDEX_CACHE_BYTES)
+
+
+def _write_json(path, value) -> None:
+    """Write a JSON file atomically, so a store is never left with half a metadata file."""
+    with open(path + ".tmp", "w") as f:
+        json.dump(value, f, indent=2, default=str)
+    os.replace(path + ".tmp", path)
+    return None
+
+
+def _coerce_dtypes(records, dtypes) -> pd.DataFrame:
+    """
+    Store the columns of records with the dtypes of the master, e.g. a batch holding its dates
+    as text. The records of all parts are read together, so every part must share the dtypes.
+    Values that do not convert are missing.
+    """
+    for col, dtype in dtypes.items():
+        values = records[col]
+        if str(values.dtype) == dtype:
+            continue
+        dtype = pd.api.types.pandas_dtype(dtype)
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            if not pd.api.types.is_datetime64_any_dtype(values.dtype):
+                values = parse_dates(values.astype("string"))
+        elif pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_numeric_dtype(dtype):
+            values = pd.to_numeric(values, errors="coerce")
+            # Integers of numpy dtypes cannot hold the values that did not convert
+            if values.isna().any() and isinstance(dtype, np.dtype) and dtype.kind in "biu":
+                dtype = np.dtype(np.float64)
+        else:
+            text = values.astype("string")
+            values = text.astype(object).where(text.notna(), None)
+        records[col] = values.astype(dtype)
+    return records
+
+
+class MasterStore:
+    """
+    A master of golden records persisted on local disk, matched incrementally against new batches.
+
+    Args:
+        path (str): The directory of a store made by `MasterStore.create`.
+
+    The store directory holds:
+        'meta.json': The configuration of the store, its number of records and its parts.
+        'records/part-*.parquet': The master records with their record and entity ids and
+            their normalised compared columns.
+        'index/keys-part-*.parquet': The blocking keys of the records, sorted by key, for the
+            'block' method.
+        'index/qgram-vectorizer.pkl' and 'index/qgram-part-*.npz': The q-gram vectorizer fitted
+            on the initial master and the inverted q-gram index of the records, for 'qgram'.
+        'golden/part-*.parquet': The golden records written by the batches, the last version
+            of an entity replacing the earlier ones.
+
+    A batch is normalised, indexed and looked up in the stored indexes, only the master records
+    paired with it are read and scored, and only the golden records of the entities it touches
+    are merged again, so the cost of a batch grows with its size rather than with the master.
+    Every batch adds a part to each directory, named after the range of batches it holds. Past
+    `MASTER_COMPACT_PARTS` parts, the parts of a directory are compacted into one, so batches do
+    not read more and more files.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+
+    @classmethod
+    def create(
+        cls,
+        path,
+        master,
+        col_info,
+        index_info,
+        survivorship=None,
+        recency=None,
+        entity_ids=None,
+    ) -> "MasterStore":
+        """
+        Create a master store from a master DataFrame.
+
+        Args:
+            path (str): The directory of the store, which must not exist yet.
+            master (pandas.DataFrame): The master records.
+            col_info (list): The column information matching new batches against the master, see
+                `utils.data_match.calc_match_scores`, with the columns of the batches as 'name1'
+                and the columns of the master as 'name2'.
+            index_info (dict): The indexing strategy, see `utils.data_index.build_candidate_index`.
+                The method must be one of `MASTER_INDEX_METHODS`.
+            survivorship (dict, optional): The survivorship rule of every column of the master,
+                see `utils.data_merge.merge_golden_records`. Columns left out use 'most_complete'.
+            recency (str, optional): The column of the master holding when each record was last
+                updated, used by the 'most_recent' rule. Default is None.
+            entity_ids (array-like, optional): The entity of every master record, e.g. from
+                `utils.data_cluster.cluster_entities`. Default is None (one entity per record).
+
+        Returns:
+            MasterStore: The store.
+        """
+        if index_info["method"] not in MASTER_INDEX_METHODS:
+            raise ValueError(
+                f"The indexing method '{index_info['method']}' cannot be used by a master store."
+            )
+        os.makedirs(path)
+        for directory in ["records", "index", "golden"]:
+            os.makedirs(os.path.join(path, directory))
+        if entity_ids is None:
+            entity_ids = np.arange(len(master))
+
+        meta = {
+            "col_info": col_info,
+            "index_info": index_info,
+            "columns": [str(col) for col in master.columns],
+            "dtypes": {str(col): str(dtype) for col, dtype in master.dtypes.items()},
+            "survivorship": survivorship or {},
+            "recency": recency,
+            "num_records": 0,
+            "next_entity_id": 0,
+            "num_parts": 0,
+            "parts": {"records": [], "index": [], "golden": []},
+        }
+        _write_json(os.path.join(path, "meta.json"), meta)
+        store = cls(path)
+
+        entity_ids = np.asarray(entity_ids, dtype=np.int64)
+        if index_info["method"] == "qgram":
+            texts = store._index_texts(master)
+            vectorizer, _ = qgram_index(
+                texts, index_info.get("q", 3), index_info.get("max_df", 0.05)
+            )
+            with open(os.path.join(path, "index", "qgram-vectorizer.pkl"), "wb") as f:
+                pickle.dump(vectorizer, f)
+        store.meta["next_entity_id"] = int(entity_ids.max()) + 1 if len(entity_ids) else 0
+        store._append(master.reset_index(drop=True), entity_ids)
+        return store
+
+    @property
+    def num_records(self) -> int:
+        return self.meta["num_records"]
+
+    def _part_path(self, directory, part) -> str:
+        """Return the path of the part of a directory holding the batches `part[0]` to `part[1]`."""
+        prefix, extension = "part", "parquet"
+        if directory == "index":
+            prefix = "qgram-part" if self.meta["index_info"]["method"] == "qgram" else "keys-part"
+            extension = "npz" if prefix == "qgram-part" else "parquet"
+        name = f"{prefix}-{part[0]:05d}-{part[1]:05d}.{extension}"
+        return os.path.join(self.path, directory, name)
+
+    def _vectorizer(self):
+        """Load the q-gram vectorizer fitted on the initial master, None if it had no q-grams."""
+        with open(os.path.join(self.path, "index", "qgram-vectorizer.pkl"), "rb") as f:
+            return pickle.load(f)
+
+    def _index_texts(self, df) -> pd.Series:
+        """Join the blocking keys of the master columns of `df` into q-gram texts."""
+        normalised = normalise_frame(df, self.meta["col_info"], "name2")
+        keys = blocking_key_columns(normalised, self.meta["index_info"]["keys"], "name2")
+        return join_keys(keys)
+
+    def records(self, record_ids=None, entity_ids=None) -> pd.DataFrame:
+        """
+        Read master records, indexed by record id.
+
+        Args:
+            record_ids (array-like, optional): The records to read. Default is None (all).
+            entity_ids (array-like, optional): The entities whose records are read. Default is None.
+
+        Returns:
+            pandas.DataFrame: The records, with their entity ids and normalised compared columns.
+        """
+        filters = None
+        if record_ids is not None:
+            filters = [(RECORD_ID, "in", [int(i) for i in np.unique(record_ids)])]
+        elif entity_ids is not None:
+            filters = [(ENTITY_ID, "in", [int(i) for i in np.unique(entity_ids)])]
+        parts = [
+            pd.read_parquet(self._part_path("records", part), filters=filters)
+            for part in self.meta["parts"]["records"]
+        ]
+        return pd.concat(parts, ignore_index=True).set_index(RECORD_ID)
+
+    def golden_records(self) -> pd.DataFrame:
+        """Read the current golden record of every entity, indexed by 'entity_id'."""
+        parts = [
+            pd.read_parquet(self._part_path("golden", part))
+            for part in self.meta["parts"]["golden"]
+        ]
+        golden = pd.concat(parts)
+        return golden[~golden.index.duplicated(keep="last")].sort_index()
+
+    def _qgram_index(self) -> tuple:
+        """
+        Load the q-gram vectorizer and the inverted index of all parts. The index loaded by an
+        earlier call is kept, and only the parts added since are loaded and appended to it.
+        """
+        key = os.path.abspath(self.path)
+        num_parts = self.meta["num_parts"]
+        cached = _master_indexes.get(key)
+        if cached is not None and cached[0] == num_parts:
+            return cached[1], cached[2]
+
+        vectorizer = self._vectorizer() if cached is None else cached[1]
+        inverted = None
+        if vectorizer is not None:
+            index_parts = self.meta["parts"]["index"]
+            matrices = []
+            if cached is not None:
+                new_parts = [part for part in index_parts if part[1] >= cached[0]]
+                # A compaction may have merged the loaded parts with the new ones
+                if all(first >= cached[0] for first, _ in new_parts):
+                    matrices.append(cached[2])
+                    index_parts = new_parts
+            matrices += [load_npz(self._part_path("index", part)) for part in index_parts]
+            inverted = hstack(matrices).tocsr()
+        nbytes = 0
+        if inverted is not None:
+            nbytes = inverted.data.nbytes + inverted.indices.nbytes + inverted.indptr.nbytes
+        _master_indexes.put(key, (num_parts, vectorizer, inverted), nbytes=nbytes)
+        return vectorizer, inverted
+
+    def candidate_pairs(self, batch) -> pd.MultiIndex:
+        """
+        Look up the master records paired with the records of a normalised batch.
+
+        Args:
+            batch (pandas.DataFrame): The batch, with its compared columns normalised.
+
+        Returns:
+            pandas.MultiIndex: The candidate pairs, as (batch index, master record id) labels.
+        """
+        index_info = self.meta["index_info"]
+        keys = blocking_key_columns(batch, index_info["keys"], "name1")
+        if index_info["method"] == "qgram":
+            vectorizer, inverted = self._qgram_index()
+            rows, record_ids = [np.empty(0, dtype=int)], [np.empty(0, dtype=int)]
+            if inverted is not None:
+                for slice_rows, slice_cols in iter_qgram_lookup(
+                    join_keys(keys),
+                    vectorizer,
+                    inverted,
+                    index_info.get("min_similarity", 0.3),
+                    index_info.get("top_k"),
+                ):
+                    rows.append(slice_rows)
+                    record_ids.append(slice_cols)
+            return pd.MultiIndex.from_arrays(
+                [batch.index[np.concatenate(rows)], np.concatenate(record_ids)],
+                names=[None, None],
+            )
+
+        # Blocking keys are never equal when missing
+        keys = keys.dropna()
+        if keys.empty:
+            return pd.MultiIndex.from_arrays(
+                [batch.index[:0], np.empty(0, dtype=np.int64)], names=[None, None]
+            )
+        key_columns = list(keys.columns)
+        first_keys = keys[key_columns[0]].unique().tolist()
+        stored = pd.concat(
+            [
+                pd.read_parquet(
+                    self._part_path("index", part), filters=[(key_columns[0], "in", first_keys)]
+                )
+                for part in self.meta["parts"]["index"]
+            ],
+            ignore_index=True,
+        )
+        pairs = keys.rename_axis("_batch_label").reset_index().merge(stored, on=key_columns)
+        pairs = pairs.sort_values(["_batch_label", RECORD_ID], kind="stable")
+        return pd.MultiIndex.from_arrays(
+            [pairs["_batch_label"], pairs[RECORD_ID]], names=[None, None]
+        )
+
+    def match_batch(
+        self,
+        batch,
+        weights,
+        overall_similarity_threshold=0.45,
+        score_cache=None,
+    ) -> pd.DataFrame:
+        """
+        Match a batch of new records against the master, and add them to it.
+
+        Args:
+            batch (pandas.DataFrame): The new records, with the columns of 'name1' in the column
+                information of the store and, optionally, any other master column.
+            weights (list): The weights of the compared columns, see
+                `utils.data_match.get_top_matches`.
+            overall_similarity_threshold (float, optional): The minimum overall similarity of a
+                match. Default is 0.45.
+            score_cache (utils.data_cache.LRUCache, optional): A cache of string similarity
+                scores, see `utils.data_match.calc_match_scores`. Default is None.
+
+        Returns:
+            pandas.DataFrame: One row per record of the batch, indexed like the batch, with the
+            'entity_id' it joined, its 'record_id' in the master, and the 'matched_record_id'
+            and 'overall_similarity' of its best master match (missing for new entities).
+
+        Every record of the batch joins the entity of its most similar master record above the
+        threshold, or starts a new entity. The records of a batch are not matched with each
+        other. The golden records of the entities touched by the batch are merged again from all
+        of their records and appended to the store.
+        """
+        col_info = self.meta["col_info"]
+        normalised = normalise_frame(batch, col_info, "name1")
+        candidates = self.candidate_pairs(normalised)
+        candidate_records = self.records(record_ids=candidates.get_level_values(1))
+        for col in dict.fromkeys(col_dict["name2"] for col_dict in col_info):
+            candidate_records[col] = candidate_records[NORMALISED_PREFIX + col]
+
+        scores = score_candidates(
+            candidates, normalised, candidate_records, col_info, score_cache
+        )
+        best = get_top_matches(
+            scores,
+            normalised,
+            candidate_records,
+            weights,
+            overall_similarity_threshold,
+            top_n=1,
+            attach_records=False,
+        ).set_index("level_0")
+
+        result = pd.DataFrame(index=batch.index)
+        result["matched_record_id"] = best["level_1"].reindex(batch.index).astype("Int64")
+        result["overall_similarity"] = best["overall_similarity"].reindex(batch.index)
+        matched = result["matched_record_id"].notna().to_numpy()
+        entity_ids = np.empty(len(batch), dtype=np.int64)
+        entity_ids[matched] = candidate_records.loc[
+            result["matched_record_id"][matched].to_numpy(dtype=np.int64), ENTITY_ID
+        ].to_numpy()
+        first_new = self.meta["next_entity_id"]
+        entity_ids[~matched] = first_new + np.arange((~matched).sum())
+        self.meta["next_entity_id"] = first_new + int((~matched).sum())
+
+        # The batch is stored with the column names of the master
+        renamed = batch.rename(columns={d["name1"]: d["name2"] for d in col_info})
+        renamed = renamed.reindex(columns=self.meta["columns"]).reset_index(drop=True)
+        record_ids = self._append(renamed, entity_ids)
+        result["entity_id"] = entity_ids
+        result["record_id"] = record_ids
+        return result[["entity_id", "record_id", "matched_record_id", "overall_similarity"]]
+
+    def _append(self, records, entity_ids) -> np.ndarray:
+        """
+        Append records to the store with their entities, index them and update the golden
+        records of their entities. Returns the record ids given to the records.
+        """
+        col_info = self.meta["col_info"]
+        index_info = self.meta["index_info"]
+        # Sorted by entity, so that both the record and the entity ids of a part are ascending
+        order = np.argsort(entity_ids, kind="stable")
+        records = records.iloc[order].reset_index(drop=True)
+        records = _coerce_dtypes(records, self.meta["dtypes"])
+        first_id = self.meta["num_records"]
+        part = self.meta["num_parts"]
+        records[RECORD_ID] = np.arange(first_id, first_id + len(records), dtype=np.int64)
+        records[ENTITY_ID] = entity_ids[order]
+
+        # The normalised compared columns are stored, so candidates are never normalised again
+        normalised = normalise_frame(records, col_info, "name2")
+        for col in dict.fromkeys(col_dict["name2"] for col_dict in col_info):
+            records[NORMALISED_PREFIX + col] = normalised[col]
+        records.to_parquet(
+            self._part_path("records", [part, part]),
+            index=False,
+            row_group_size=MASTER_ROW_GROUP_ROWS,
+        )
+        self.meta["parts"]["records"].append([part, part])
+
+        if index_info["method"] == "qgram":
+            vectorizer = self._vectorizer()
+            if vectorizer is not None:
+                texts = join_keys(blocking_key_columns(normalised, index_info["keys"], "name2"))
+                save_npz(
+                    self._part_path("index", [part, part]), vectorizer.transform(texts).T.tocsr()
+                )
+                self.meta["parts"]["index"].append([part, part])
+        else:
+            keys = blocking_key_columns(normalised, index_info["keys"], "name2")
+            keys[RECORD_ID] = records[RECORD_ID].to_numpy()
+            keys = keys.dropna().sort_values(list(keys.columns), kind="stable")
+            keys.to_parquet(
+                self._part_path("index", [part, part]),
+                index=False,
+                row_group_size=MASTER_ROW_GROUP_ROWS,
+            )
+            self.meta["parts"]["index"].append([part, part])
+
+        self.meta["num_records"] = first_id + len(records)
+        self.meta["num_parts"] = part + 1
+        self._update_golden_records(np.unique(entity_ids), part)
+        _write_json(os.path.join(self.path, "meta.json"), self.meta)
+        self._compact_parts()
+        inverse = np.empty(len(order), dtype=np.int64)
+        inverse[order] = np.arange(len(order))
+        return records[RECORD_ID].to_numpy()[inverse]
+
+    def _compact_parts(self) -> None:
+        """
+        Merge the parts of every directory holding more than `MASTER_COMPACT_PARTS` parts into
+        one. The merged parts are written and recorded in the metadata before the parts they
+        replace are removed, so the store is never left without its records.
+        """
+        replaced = {}
+        for directory, parts in self.meta["parts"].items():
+            if len(parts) <= MASTER_COMPACT_PARTS:
+                continue
+            merged = [parts[0][0], parts[-1][1]]
+            path = self._part_path(directory, merged)
+            if directory == "golden":
+                self.golden_records().to_parquet(path)
+            elif directory == "index" and self.meta["index_info"]["method"] == "qgram":
+                save_npz(path, self._qgram_index()[1])
+            else:
+                merged_parts = pd.concat(
+                    [pd.read_parquet(self._part_path(directory, part)) for part in parts],
+                    ignore_index=True,
+                )
+                if directory == "index":
+                    merged_parts = merged_parts.sort_values(
+                        list(merged_parts.columns), kind="stable"
+                    )
+                merged_parts.to_parquet(path, index=False, row_group_size=MASTER_ROW_GROUP_ROWS)
+            replaced[directory] = parts
+            self.meta["parts"][directory] = [merged]
+        if not replaced:
+            return None
+
+        _write_json(os.path.join(self.path, "meta.json"), self.meta)
+        for directory, parts in replaced.items():
+            for part in parts:
+                os.remove(self._part_path(directory, part))
+        return None
+
+    def _update_golden_records(self, entity_ids, part) -> None:
+        """Merge the golden records of entities again from all of their records."""
+        records = self.records(entity_ids=entity_ids)
+        merge_info = [
+            {
+                "name": col,
+                "name1": col,
+                "name2": None,
+                "rule": self.meta["survivorship"].get(col, "most_complete"),
+            }
+            for col in self.meta["columns"]
+        ]
+        recency = None
+        if self.meta["recency"] is not None:
+            recency = {"name1": self.meta["recency"], "name2": None}
+        golden = merge_golden_records(
+            records,
+            records.iloc[:0],
+            records[ENTITY_ID].to_numpy(),
+            np.empty(0, dtype=np.int64),
+            merge_info,
+            recency=recency,
+        )
+        golden.to_parquet(self._part_path("golden", [part, part]))
+        self.meta["parts"]["golden"].append([part, part])
+        return None
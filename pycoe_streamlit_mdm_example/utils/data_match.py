@@ -1,8 +1,49 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import get_context
+import os
+
 import recordlinkage as rl
+import numpy as np
 import pandas as pd
 
+from utils.data_cache import match_cache_key
+from utils.data_compare import MemoisedString, comparator_cost
+from utils.data_index import (
+    build_candidate_index,
+    build_exact_join_index,
+    iter_candidate_chunks,
+)
+from utils.data_normalise import normalise_frames
+from utils.data_profile import profile_stage
+
+# Rough memory cost of scoring one candidate pair: the pair itself, plus the gathered
+# values, intermediate objects and similarity score of every compared column
+BYTES_PER_PAIR = 64
+BYTES_PER_PAIR_AND_COLUMN = 256
+
+# Number of candidate pairs scored between two progress reports of a run scoring all pairs at once
+PROGRESS_CHUNK_PAIRS = 100_000
+
+# Margin kept by the cascade when comparing score bounds to the threshold, so that floating
+# point rounding of the partial sums never prunes a pair that passes the threshold
+CASCADE_TOLERANCE = 1e-9
+
+# The DataFrames a worker process scores pairs against, set once by `_init_worker`
+_worker_frames = {}
 
-def calc_match_scores(df1, df2, col_info) -> pd.DataFrame:
+
+def calc_match_scores(
+    df1,
+    df2,
+    col_info,
+    index_info=None,
+    n_jobs=1,
+    score_cache=None,
+    profiler=None,
+    progress=None,
+) -> pd.DataFrame:
     """
     Calculate match scores between two DataFrames based on column information.
 
@@ -15,18 +56,330 @@ def calc_match_scores(df1, df2, col_info) -> pd.DataFrame:
                 'name2' (str): The name of the column in df2.
                 'ExactCompare' (bool): Whether to perform an exact string comparison.
                 'method' (str): The string comparison method to use if 'ExactCompare' is False.
+                'normalise' (str or list, optional): The normalisation applied to both columns before
+                    indexing and comparing, see `utils.data_normalise.normalise_series`.
+                'backend' (str, optional): The backend computing the string similarity, see
+                    `utils.data_compare.resolve_backend`. Default is 'auto'.
+        index_info (dict, optional): The indexing strategy used to select the candidate pairs,
+            see `utils.data_index.build_candidate_index`. If None, all possible pairs are compared.
+        n_jobs (int, optional): The number of worker processes scoring partitions of the candidate
+            pairs in parallel. -1 uses all cores. Default is 1 (score in the calling process).
+        score_cache (utils.data_cache.LRUCache, optional): A cache of string similarity scores of
+            value pairs, reused across runs, see `utils.data_compare.MemoisedString`. It is only
+            used when scoring in the calling process. Default is None.
+        profiler (utils.data_profile.MatchProfiler, optional): A profiler recording the
+            normalisation, indexing and scoring stages, and the scoring of every column when
+            scoring in the calling process. Default is None.
+        progress (callable, optional): Called with the number of candidate pairs scored so far
+            and the total number of candidate pairs, every `PROGRESS_CHUNK_PAIRS` pairs or every
+            partition of a worker process. An exception it raises stops the run, which is how a
+            run is cancelled, see `utils.data_jobs.MatchJob`. Default is None.
 
     Returns:
         pandas.DataFrame: A DataFrame containing potential matches and their similarity scores.
+        The result is identical for any value of `n_jobs`. When every column is compared
+        exactly with the full index, only the pairs with at least one equal column are
+        returned, see `uses_exact_join`; the other pairs score 0 on every column.
 
     This function uses the record linkage library (rl) to perform a fuzzy matching between
     the two DataFrames based on the provided column information. It calculates similarity
     scores between columns in df1 and df2 using either an exact string comparison or a
-    specified string comparison method (e.g., 'jarowinkler', 'levenshtein').
+    specified string comparison method (e.g., 'jarowinkler', 'levenshtein'). Each distinct
+    pair of values of a column is only scored once.
+    """
+    df1, df2, candidates = _normalise_and_index(df1, df2, col_info, index_info, profiler)
+    n_jobs = _resolve_n_jobs(n_jobs)
+    if len(candidates) == 0 or (n_jobs == 1 and progress is None):
+        return score_candidates(candidates, df1, df2, col_info, score_cache, profiler)
+    if n_jobs == 1:
+        scored_chunks = []
+        # An empty index is scored once, for the columns of the result
+        for start in range(0, max(len(candidates), 1), PROGRESS_CHUNK_PAIRS):
+            chunk = candidates[start : start + PROGRESS_CHUNK_PAIRS]
+            scored_chunks.append(
+                score_candidates(chunk, df1, df2, col_info, score_cache, profiler)
+            )
+            progress(start + len(chunk), len(candidates))
+        return pd.concat(scored_chunks)
+
+    partitions = np.array_split(np.arange(len(candidates)), n_jobs * 4)
+    with profile_stage(profiler, "scoring", len(candidates)), _worker_pool(
+        df1, df2, col_info, n_jobs
+    ) as pool:
+        scored_partitions = []
+        try:
+            for scored in pool.map(
+                partial(_score_partition, col_info),
+                [candidates[part] for part in partitions if len(part)],
+            ):
+                scored_partitions.append(scored)
+                if progress is not None:
+                    progress(sum(map(len, scored_partitions)), len(candidates))
+        except BaseException:
+            # Drop the partitions not started yet, such as when the run is cancelled
+            pool.shutdown(cancel_futures=True)
+            raise
+        potential_matches = pd.concat(scored_partitions)
+    return potential_matches
+
+
+def score_candidates(
+    candidates, df1, df2, col_info, score_cache=None, profiler=None, workers=-1
+) -> pd.DataFrame:
+    """
+    Score given candidate pairs of two DataFrames whose compared columns are already normalised.
+
+    Args:
+        candidates (pandas.MultiIndex): The candidate pairs, as (df1 index, df2 index) labels.
+        df1 (pandas.DataFrame): The first DataFrame.
+        df2 (pandas.DataFrame): The second DataFrame.
+        col_info (list): The column information, see `calc_match_scores`. The 'normalise' key is
+            not applied, as the columns are expected to be normalised, see
+            `utils.data_normalise.normalise_frames`.
+        score_cache (utils.data_cache.LRUCache, optional): See `calc_match_scores`. Default is None.
+        profiler (utils.data_profile.MatchProfiler, optional): A profiler recording the scoring,
+            and within it the scoring of every column. Default is None.
+        workers (int, optional): The number of threads of the rapidfuzz comparators, see
+            `utils.data_compare.rapidfuzz_similarity`. Default is -1 (all cores).
+
+    Returns:
+        pandas.DataFrame: The similarity scores of the candidate pairs, as `calc_match_scores`.
+
+    With a profiler, the columns are scored one at a time so that each comparator is timed on
+    its own. The scores are the same, as every column is scored independently of the others.
+    """
+    if profiler is None:
+        compare_cl = _build_comparator(col_info, score_cache, workers)
+        return compare_cl.compute(candidates, df1, df2)
+
+    with profiler.stage("scoring", len(candidates)):
+        features = []
+        for col_dict in col_info:
+            with profiler.stage(comparator_stage(col_dict), len(candidates)):
+                compare_cl = _build_comparator([col_dict], score_cache, workers)
+                features.append(compare_cl.compute(candidates, df1, df2))
+        return pd.concat(features, axis=1)
+
+
+def comparator_stage(col_dict) -> str:
+    """Return the name of the profiling stage scoring a column of `col_info`."""
+    method = "exact" if col_dict["ExactCompare"] else col_dict["method"]
+    return "compare " + col_dict["name1"] + ", " + col_dict["name2"] + " (" + method + ")"
+
+
+def _normalise_and_index(df1, df2, col_info, index_info=None, profiler=None) -> tuple:
+    """Normalise the compared columns of both DataFrames and build their candidate pairs."""
+    with profile_stage(profiler, "normalisation"):
+        df1, df2 = normalise_frames(df1, df2, col_info)
+    with profile_stage(profiler, "indexing") as stage:
+        if uses_exact_join(col_info, index_info):
+            candidates = build_exact_join_index(df1, df2, _exact_columns(col_info))
+        else:
+            candidates = build_candidate_index(df1, df2, index_info)
+        stage["pairs"] = len(candidates)
+    return df1, df2, candidates
+
+
+def uses_exact_join(col_info, index_info=None) -> bool:
+    """
+    Check whether the matching can resolve the candidate pairs with hash joins.
+
+    Args:
+        col_info (list): A list of dictionaries containing column information, see `calc_match_scores`.
+        index_info (dict, optional): The indexing strategy, see `calc_match_scores`.
+
+    Returns:
+        bool: True if every column is compared exactly and the full index is used.
+
+    In that case, a pair that is not equal on any column scores 0 on every column, so it can
+    never pass a non-negative threshold. Only the pairs found by joining both DataFrames on the
+    values of each column are scored, in O(n + m + matches) instead of O(n * m).
+    """
+    full_index = index_info is None or index_info["method"] == "full"
+    return full_index and all(col_dict["ExactCompare"] for col_dict in col_info)
+
+
+def _exact_columns(col_info) -> list:
+    return [(col_dict["name1"], col_dict["name2"]) for col_dict in col_info]
+
+
+def cached_match_scores(
+    cache,
+    df1,
+    df2,
+    col_info,
+    index_info=None,
+    n_jobs=1,
+    score_cache=None,
+    profiler=None,
+    progress=None,
+) -> tuple:
+    """
+    Calculate match scores, reusing the scores of an earlier run on the same inputs.
+
+    Args:
+        cache (utils.data_cache.LRUCache): The cache holding the scores of earlier runs.
+        df1 (pandas.DataFrame): The first DataFrame.
+        df2 (pandas.DataFrame): The second DataFrame.
+        col_info (list): A list of dictionaries containing column information, see `calc_match_scores`.
+        index_info (dict, optional): The indexing strategy, see `calc_match_scores`.
+        n_jobs (int, optional): The number of worker processes, see `calc_match_scores`.
+        score_cache (utils.data_cache.LRUCache, optional): A cache of string similarity scores,
+            see `calc_match_scores`.
+        profiler (utils.data_profile.MatchProfiler, optional): A profiler recording the cache
+            lookup and the stages of `calc_match_scores`. Default is None.
+        progress (callable, optional): A progress callback, see `calc_match_scores`. It is not
+            called when the scores are found in the cache. Default is None.
+
+    Returns:
+        tuple: The DataFrame of similarity scores returned by `calc_match_scores`, and whether it
+        was found in the cache.
+
+    The scores are cached under a hash of the contents of both DataFrames, `col_info` and
+    `index_info`, which are the only inputs they depend on. Weights, thresholds and the number
+    of top matches only affect `get_top_matches`, so changing them reuses the cached scores.
+    The cached DataFrame is shared between runs and must not be modified.
+    """
+    with profile_stage(profiler, "score cache lookup") as stage:
+        key = match_cache_key(df1, df2, col_info, index_info)
+        output_scores = cache.get(key)
+        if output_scores is not None:
+            stage["pairs"] = len(output_scores)
+    if output_scores is not None:
+        return output_scores, True
+
+    output_scores = calc_match_scores(
+        df1, df2, col_info, index_info, n_jobs, score_cache, profiler, progress
+    )
+    cache.put(key, output_scores)
+    return output_scores, False
+
+
+def cascade_match_scores(
+    df1,
+    df2,
+    col_info,
+    weights,
+    overall_similarity_threshold=0.45,
+    index_info=None,
+    score_cache=None,
+    profiler=None,
+    progress=None,
+) -> tuple:
+    """
+    Calculate match scores column by column, cheapest first, pruning pairs that cannot pass the threshold.
+
+    Args:
+        df1 (pandas.DataFrame): The first DataFrame.
+        df2 (pandas.DataFrame): The second DataFrame.
+        col_info (list): A list of dictionaries containing column information, see `calc_match_scores`.
+        weights (list): A list of weights to be applied to the similarity scores.
+        overall_similarity_threshold (float, optional): The minimum overall similarity score required for a row to be included. Default is 0.45.
+        index_info (dict, optional): The indexing strategy, see `calc_match_scores`.
+        score_cache (utils.data_cache.LRUCache, optional): A cache of string similarity scores,
+            see `calc_match_scores`.
+        profiler (utils.data_profile.MatchProfiler, optional): A profiler recording the stages
+            of `calc_match_scores`, each comparator being timed on the pairs it scores.
+            Default is None.
+        progress (callable, optional): A progress callback, see `calc_match_scores`, called
+            after every column with the number of pairs scored so far and the number of pairs
+            scored if none were pruned. Default is None.
+
+    Returns:
+        tuple: The similarity scores of the pairs that were not pruned, in the format of
+        `calc_match_scores`, and a DataFrame reporting, for every stage, the column scored, the
+        number of pairs scored and the number of pairs pruned after it.
+
+    Every similarity score is between 0 and 1, so after scoring some of the columns, the overall
+    similarity of a pair is at most its weighted sum so far plus the sum of the (positive) weights
+    of the columns left. The columns are scored from the cheapest comparison method (exact) to
+    the most expensive (smith_waterman), and after each of them the pairs whose bound does not
+    exceed `overall_similarity_threshold` are dropped, so the expensive comparators only score
+    the pairs that can still pass. The pruned pairs can never pass the threshold, so
+    `get_top_matches` returns the same top matches as for the output of `calc_match_scores`.
+    """
+    df1, df2, candidates = _normalise_and_index(df1, df2, col_info, index_info, profiler)
+
+    weights = np.asarray(weights, dtype=float)
+    labels = [feature.label for feature in _build_comparator(col_info).features]
+    remaining_bound = np.maximum(weights, 0).sum()
+    partial_similarity = np.zeros(len(candidates))
+    survivors = np.arange(len(candidates))
+    scored = {}
+    report = []
+    for i in sorted(range(len(col_info)), key=lambda i: comparator_cost(col_info[i])):
+        with profile_stage(profiler, comparator_stage(col_info[i]), len(survivors)):
+            feature = _build_comparator([col_info[i]], score_cache).compute(
+                candidates[survivors], df1, df2
+            )
+        scored[i] = (survivors, feature.iloc[:, 0])
+        weight = weights[i] if i < len(weights) else 0.0
+        partial_similarity[survivors] += weight * feature.iloc[:, 0].to_numpy()
+        remaining_bound -= max(weight, 0.0)
+
+        bound = partial_similarity[survivors] + remaining_bound
+        keep = bound + CASCADE_TOLERANCE > overall_similarity_threshold
+        report.append(
+            {
+                "column": labels[i],
+                "method": "exact" if col_info[i]["ExactCompare"] else col_info[i]["method"],
+                "pairs_scored": len(survivors),
+                "pairs_pruned": int((~keep).sum()),
+            }
+        )
+        survivors = survivors[keep]
+        if progress is not None:
+            pairs_scored = sum(stage["pairs_scored"] for stage in report)
+            progress(pairs_scored, len(candidates) * len(col_info))
+
+    potential_matches = pd.DataFrame(index=candidates[survivors])
+    for i, label in enumerate(labels):
+        positions, values = scored[i]
+        potential_matches[label] = values.to_numpy()[np.searchsorted(positions, survivors)]
+    return potential_matches, pd.DataFrame(report)
+
+
+def _resolve_n_jobs(n_jobs) -> int:
+    """Return the number of worker processes to use, where -1 means one per core."""
+    if n_jobs == -1:
+        return os.cpu_count() or 1
+    return max(1, int(n_jobs))
+
+
+def _worker_pool(df1, df2, col_info, n_jobs) -> ProcessPoolExecutor:
+    """Start a pool of worker processes holding the compared columns of both DataFrames."""
+    columns1 = list(dict.fromkeys(col_dict["name1"] for col_dict in col_info))
+    columns2 = list(dict.fromkeys(col_dict["name2"] for col_dict in col_info))
+    # The pools are started from the threads of background jobs, and a forked child can inherit
+    # a lock held by another thread of the parent, so the workers are spawned
+    return ProcessPoolExecutor(
+        max_workers=n_jobs,
+        mp_context=get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(df1[columns1], df2[columns2]),
+    )
+
+
+def _init_worker(df1, df2) -> None:
+    _worker_frames["df1"] = df1
+    _worker_frames["df2"] = df2
+    return None
+
+
+def _score_partition(col_info, candidates) -> pd.DataFrame:
+    """Score a partition of the candidate pairs in a worker process."""
+    # The worker processes already share the cores, so each one scores with a single thread
+    compare_cl = _build_comparator(col_info, workers=1)
+    return compare_cl.compute(candidates, _worker_frames["df1"], _worker_frames["df2"])
+
+
+def _build_comparator(col_info, score_cache=None, workers=-1) -> rl.Compare:
+    """
+    Build the record linkage comparator for the column information of `calc_match_scores`.
+
+    String comparisons score each distinct pair of values once, optionally reusing the scores
+    held by `score_cache`, see `utils.data_compare.MemoisedString`, with `workers` threads.
     """
-    indexer = rl.Index()
-    indexer.full()  # Consider all possible pairs
-    candidates = indexer.index(df1, df2)
     compare_cl = rl.Compare()
 
     for col_dict in col_info:
@@ -41,19 +394,30 @@ def calc_match_scores(df1, df2, col_info) -> pd.DataFrame:
                 + "_similarity",
             )
         else:
-            compare_cl.string(
-                col_dict["name1"],
-                col_dict["name2"],
-                method=col_dict["method"],
-                label=col_dict["name1"] + ", " + col_dict["name2"] + "_similarity",
+            compare_cl.add(
+                MemoisedString(
+                    col_dict["name1"],
+                    col_dict["name2"],
+                    method=col_dict["method"],
+                    label=col_dict["name1"] + ", " + col_dict["name2"] + "_similarity",
+                    cache=score_cache,
+                    backend=col_dict.get("backend", "auto"),
+                    workers=workers,
+                )
             )
 
-    potential_matches = compare_cl.compute(candidates, df1, df2)
-    return potential_matches
+    return compare_cl
 
 
 def get_top_matches(
-    output_scores, df1, df2, weights, overall_similarity_threshold=0.45, top_n=3
+    output_scores,
+    df1,
+    df2,
+    weights,
+    overall_similarity_threshold=0.45,
+    top_n=3,
+    attach_records=True,
+    profiler=None,
 ) -> pd.DataFrame:
     """
     Filter and select the top matching rows from a DataFrame of similarity scores.
@@ -65,30 +429,356 @@ def get_top_matches(
         weights (list): A list of weights to be applied to the similarity scores.
         overall_similarity_threshold (float, optional): The minimum overall similarity score required for a row to be included. Default is 0.45.
         top_n (int, optional): The number of top matches to select for each group. Default is 3.
+        attach_records (bool, optional): Whether to add the values of both records to the selected pairs.
+            If False, only the pair labels ('level_0', 'level_1'), similarity scores and overall similarity
+            are returned. Default is True.
+        profiler (utils.data_profile.MatchProfiler, optional): A profiler recording the weighting,
+            threshold filtering, top-n selection and merge of the records. Default is None.
 
     Returns:
         pandas.DataFrame: A DataFrame containing the top `top_n` matches for each group, sorted by the overall similarity score in descending order.
 
     This function calculates an overall similarity score for each row in the `output_scores` DataFrame by taking a weighted sum of the individual similarity scores. It then filters the rows to include only those with an overall similarity score above the specified `overall_similarity_threshold`. Finally, it groups the rows and selects the top `top_n` rows within each group based on the overall similarity score.
+
+    The selection works on NumPy arrays: only the pairs above the threshold are ranked within their group, and
+    the values of the records are only looked up for the selected pairs, so neither the scores nor the records
+    are copied or merged for the pairs that are not selected.
+    """
+    with profile_stage(profiler, "weighting", len(output_scores)):
+        overall_similarity = weighted_similarity(output_scores, weights)
+    with profile_stage(profiler, "threshold filtering", len(output_scores)):
+        passed = np.flatnonzero(overall_similarity > overall_similarity_threshold)
+    with profile_stage(profiler, "top-n selection", len(passed)):
+        selected = _top_n_positions(
+            output_scores.index.get_level_values(0)[passed],
+            overall_similarity[passed],
+            top_n,
+        )
+        winners = passed[selected]
+
+        top_matches = output_scores.iloc[winners].reset_index()
+        top_matches["overall_similarity"] = overall_similarity[winners]
+        # Number the pairs by their position among the pairs above the threshold
+        top_matches.index = selected
+
+    if not attach_records:
+        return top_matches
+    with profile_stage(profiler, "merge records", len(top_matches)):
+        return _attach_records(top_matches, df1, df2)
+
+
+def weighted_similarity(output_scores, weights) -> np.ndarray:
     """
-    output_scores_overall = output_scores.copy()
-    output_scores_overall["overall_similarity"] = output_scores.iloc[
-        :, : len(weights)
-    ].dot(weights)
-    scores_filtered_threshold = output_scores_overall[
-        output_scores_overall["overall_similarity"] > overall_similarity_threshold
+    Compute the overall similarity of every pair as the weighted sum of its similarity scores.
+
+    Args:
+        output_scores (pandas.DataFrame): A DataFrame containing similarity scores for each column.
+        weights (list): A list of weights to be applied to the first similarity scores.
+
+    Returns:
+        numpy.ndarray: The overall similarity of every pair.
+
+    The sum is accumulated column by column, so the overall similarity of a pair is rounded
+    the same way whichever other pairs are scored with it. A matrix product would round it
+    differently depending on the number of pairs, so chunked, pruned and full scoring could
+    disagree in the last digit.
+    """
+    overall_similarity = np.zeros(len(output_scores))
+    for i, weight in enumerate(weights):
+        overall_similarity += output_scores.iloc[:, i].to_numpy(dtype=float) * weight
+    return overall_similarity
+
+
+def _top_n_positions(level_0, overall_similarity, top_n) -> np.ndarray:
+    """
+    Find the `top_n` pairs with the highest overall similarity for every record of df1.
+
+    Returns the positions of the selected pairs, ordered by record and then by descending
+    overall similarity. Pairs with the same similarity keep their original order.
+
+    The pairs are grouped by record with a stable sort of the integer record codes, which is
+    close to linear as the indexes produce the pairs of a record together. The top pairs are
+    then selected with `top_n` passes of a per record maximum, so that only the selected pairs
+    are ordered by similarity, instead of sorting all the pairs by similarity.
+    """
+    record_codes = pd.factorize(np.asarray(level_0), sort=True)[0]
+    if len(record_codes) == 0:
+        return np.empty(0, dtype=np.intp)
+    group_order = np.argsort(record_codes, kind="stable")
+    sorted_codes = record_codes[group_order]
+    group_starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    group_sizes = np.diff(np.r_[group_starts, len(group_order)])
+    group_of_pair = np.repeat(np.arange(len(group_starts)), group_sizes)
+
+    remaining = np.asarray(overall_similarity, dtype=float)[group_order]
+    selected = []
+    for rank in range(min(top_n, group_sizes.max())):
+        best = np.maximum.reduceat(remaining, group_starts)
+        # The first remaining pair of every record holding its highest similarity
+        is_best = np.flatnonzero(remaining == best[group_of_pair])
+        groups, first = np.unique(group_of_pair[is_best], return_index=True)
+        positions = is_best[first[group_sizes[groups] > rank]]
+        remaining[positions] = -np.inf
+        selected.append(positions)
+
+    # Every pass selects at most one pair per record, so a stable sort by record keeps the ranks
+    selected = np.concatenate(selected)
+    return group_order[selected[np.argsort(group_of_pair[selected], kind="stable")]]
+
+
+def _select_top_n(scores, top_n) -> pd.DataFrame:
+    """Keep the `top_n` pairs with the highest overall similarity for every record of df1."""
+    return scores.iloc[
+        _top_n_positions(
+            scores["level_0"].to_numpy(), scores["overall_similarity"].to_numpy(), top_n
+        )
     ]
 
-    top_matches = scores_filtered_threshold.reset_index()
+
+def _attach_records(top_matches, df1, df2) -> pd.DataFrame:
+    """Add the values of both records to every scored pair."""
     top_matches = top_matches.merge(
         df1.reset_index(), left_on="level_0", right_index=True
     )
     top_matches = top_matches.merge(
         df2.reset_index(), left_on="level_1", right_index=True, suffixes=("_1", "_2")
     )
-    top_matches = top_matches.sort_values(
-        ["level_0", "overall_similarity"], ascending=[True, False]
+    return top_matches
+
+
+def pairs_per_memory_budget(memory_budget_mb, num_columns) -> int:
+    """
+    Convert a memory budget into the number of candidate pairs that can be scored at once.
+
+    Args:
+        memory_budget_mb (float): The memory budget for one chunk, in megabytes.
+        num_columns (int): The number of compared columns.
+
+    Returns:
+        int: The number of candidate pairs per chunk, at least 1,000.
+    """
+    bytes_per_pair = BYTES_PER_PAIR + BYTES_PER_PAIR_AND_COLUMN * num_columns
+    return max(1_000, int(memory_budget_mb * 1024**2 // bytes_per_pair))
+
+
+def _score_and_select(
+    candidates,
+    df1,
+    df2,
+    col_info,
+    weights,
+    overall_similarity_threshold,
+    top_n,
+    score_cache=None,
+    profiler=None,
+    workers=-1,
+) -> tuple:
+    """
+    Score a chunk of candidate pairs and keep the top matches of every record in it.
+
+    Returns the selected pairs, numbered by their position among the pairs of the chunk that
+    passed the threshold, and the number of pairs that passed the threshold.
+    """
+    output_scores = score_candidates(
+        candidates, df1, df2, col_info, score_cache, profiler, workers
+    )
+    with profile_stage(profiler, "weighting", len(output_scores)):
+        overall_similarity = weighted_similarity(output_scores, weights)
+    with profile_stage(profiler, "threshold filtering", len(output_scores)):
+        passed = overall_similarity > overall_similarity_threshold
+
+        scores = output_scores[passed].reset_index()
+        scores["overall_similarity"] = overall_similarity[passed]
+    with profile_stage(profiler, "top-n selection", len(scores)):
+        return _select_top_n(scores, top_n), len(scores)
+
+
+def _score_and_select_partition(
+    col_info, weights, overall_similarity_threshold, top_n, candidates
+) -> tuple:
+    """Score and select a chunk of candidate pairs in a worker process, with a single thread."""
+    return _score_and_select(
+        candidates,
+        _worker_frames["df1"],
+        _worker_frames["df2"],
+        col_info,
+        weights,
+        overall_similarity_threshold,
+        top_n,
+        workers=1,
     )
-    top_matches = top_matches.groupby("level_0").head(top_n)
 
-    return top_matches
+
+def stream_top_matches(
+    df1,
+    df2,
+    col_info,
+    weights,
+    overall_similarity_threshold=0.45,
+    top_n=3,
+    index_info=None,
+    chunk_size=100_000,
+    memory_budget_mb=None,
+    n_jobs=1,
+    score_cache=None,
+    profiler=None,
+    progress=None,
+) -> pd.DataFrame:
+    """
+    Score the candidate pairs chunk by chunk and keep only the top matches of every record.
+
+    Args:
+        df1 (pandas.DataFrame): The first DataFrame.
+        df2 (pandas.DataFrame): The second DataFrame.
+        col_info (list): A list of dictionaries containing column information, see `calc_match_scores`.
+        weights (list): A list of weights to be applied to the similarity scores.
+        overall_similarity_threshold (float, optional): The minimum overall similarity score required for a row to be included. Default is 0.45.
+        top_n (int, optional): The number of top matches to select for each group. Default is 3.
+        index_info (dict, optional): The indexing strategy, see `utils.data_index.build_candidate_index`.
+        chunk_size (int, optional): The number of candidate pairs scored at once. Default is 100,000.
+        memory_budget_mb (float, optional): A memory budget per chunk in megabytes. If given, it
+            replaces `chunk_size` with the number of pairs that fit in the budget.
+        n_jobs (int, optional): The number of worker processes scoring chunks in parallel. -1 uses
+            all cores. Default is 1 (score in the calling process).
+        score_cache (utils.data_cache.LRUCache, optional): A cache of string similarity scores,
+            see `calc_match_scores`.
+        profiler (utils.data_profile.MatchProfiler, optional): A profiler recording the stages
+            of `calc_match_scores` and `get_top_matches`, summed over the chunks, and the merge of
+            every chunk into the running top matches. With several worker processes, the time
+            spent waiting for the workers is recorded instead of the scoring. Default is None.
+        progress (callable, optional): A progress callback, see `calc_match_scores`, called after
+            every chunk. The chunks are generated as they are scored, so the total number of
+            candidate pairs is None, unless every column is compared exactly with the full index.
+            Default is None.
+
+    Returns:
+        pandas.DataFrame: The same top matches as `get_top_matches` returns for the output of
+        `calc_match_scores`. Only the sorted neighbourhood index can number the rows differently,
+        as it produces the pairs of a chunk in a different order.
+
+    This function is a drop-in alternative to calling `calc_match_scores` and `get_top_matches`.
+    Instead of building every candidate pair and the full similarity matrix up front, the candidate
+    pairs are generated in chunks. Each chunk is scored, filtered on the `overall_similarity_threshold`
+    and reduced to its top `top_n` per record, which is then merged into the running top matches,
+    so the peak memory depends on the chunk size and not on the total number of candidate pairs.
+    With several worker processes, at most two chunks per worker are in flight at any time.
+    The top matches show the values of the records before normalisation.
+    """
+    if memory_budget_mb is not None:
+        chunk_size = pairs_per_memory_budget(memory_budget_mb, len(col_info))
+
+    records1, records2 = df1, df2
+    with profile_stage(profiler, "normalisation"):
+        df1, df2 = normalise_frames(df1, df2, col_info)
+    top_matches = None
+    num_passed = 0
+    pairs_scored = 0
+    pairs_total = None
+
+    def merge_chunk(chunk_result, chunk_pairs):
+        nonlocal top_matches, num_passed, pairs_scored
+        scores, chunk_passed = chunk_result
+        with profile_stage(profiler, "merge chunks", len(scores)):
+            # Number the pairs as the threshold filtered output of calc_match_scores would be
+            scores.index = scores.index + num_passed
+            num_passed += chunk_passed
+            if top_matches is not None:
+                scores = pd.concat([top_matches, scores])
+            top_matches = _select_top_n(scores, top_n)
+        pairs_scored += chunk_pairs
+        if progress is not None:
+            progress(pairs_scored, pairs_total)
+
+    if uses_exact_join(col_info, index_info):
+        with profile_stage(profiler, "indexing") as stage:
+            equal_pairs = build_exact_join_index(df1, df2, _exact_columns(col_info))
+            stage["pairs"] = len(equal_pairs)
+        pairs_total = len(equal_pairs)
+        chunks = (
+            equal_pairs[start : start + chunk_size]
+            for start in range(0, len(equal_pairs), chunk_size)
+        )
+    else:
+        chunks = _profile_chunks(
+            iter_candidate_chunks(df1, df2, index_info, chunk_size), profiler
+        )
+    n_jobs = _resolve_n_jobs(n_jobs)
+    if n_jobs == 1:
+        for candidates in chunks:
+            merge_chunk(
+                _score_and_select(
+                    candidates,
+                    df1,
+                    df2,
+                    col_info,
+                    weights,
+                    overall_similarity_threshold,
+                    top_n,
+                    score_cache,
+                    profiler,
+                ),
+                len(candidates),
+            )
+    else:
+        score_chunk = partial(
+            _score_and_select_partition,
+            col_info,
+            weights,
+            overall_similarity_threshold,
+            top_n,
+        )
+        with _worker_pool(df1, df2, col_info, n_jobs) as pool:
+            pending = deque()
+            try:
+                for candidates in chunks:
+                    pending.append((pool.submit(score_chunk, candidates), len(candidates)))
+                    if len(pending) >= 2 * n_jobs:
+                        merge_chunk(*_wait_for_chunk(pending.popleft(), profiler))
+                while pending:
+                    merge_chunk(*_wait_for_chunk(pending.popleft(), profiler))
+            except BaseException:
+                # Drop the chunks not started yet, such as when the run is cancelled
+                pool.shutdown(cancel_futures=True)
+                raise
+
+    if top_matches is None:
+        top_matches = pd.DataFrame(
+            {
+                "level_0": pd.Series(dtype=df1.index.dtype),
+                "level_1": pd.Series(dtype=df2.index.dtype),
+                **{
+                    feature.label: pd.Series(dtype=float)
+                    for feature in _build_comparator(col_info).features
+                },
+                "overall_similarity": pd.Series(dtype=float),
+            }
+        )
+
+    with profile_stage(profiler, "merge records", len(top_matches)):
+        return _attach_records(top_matches, records1, records2)
+
+
+def _profile_chunks(chunks, profiler=None):
+    """Yield the chunks of candidate pairs, recording the time spent building them as indexing."""
+    if profiler is None:
+        yield from chunks
+        return
+    chunks = iter(chunks)
+    while True:
+        with profiler.stage("indexing") as stage:
+            candidates = next(chunks, None)
+            stage["pairs"] = 0 if candidates is None else len(candidates)
+        if candidates is None:
+            return
+        yield candidates
+
+
+def _wait_for_chunk(pending_chunk, profiler=None) -> tuple:
+    """
+    Wait for a chunk scored by a worker process, recording the time waited for it.
+
+    Returns the result of the chunk and its number of candidate pairs.
+    """
+    future, chunk_pairs = pending_chunk
+    with profile_stage(profiler, "waiting for workers"):
+        return future.result(), chunk_pairs
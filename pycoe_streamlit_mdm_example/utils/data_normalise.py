@@ -0,0 +1,259 @@
+import pandas as pd
+
+from utils.data_cache import LRUCache, hash_config, hash_frame
+
+# The normalisation steps, in the order they are applied
+NORMALISATION_STEPS = [
+    "remove_titles",
+    "expand_abbreviations",
+    "casefold",
+    "strip_punctuation",
+    "phone_digits",
+    "iso_date",
+]
+
+NORMALISATION_PRESETS = {
+    "none": [],
+    "text": ["casefold", "strip_punctuation"],
+    "name": ["remove_titles", "casefold", "strip_punctuation"],
+    "address": ["expand_abbreviations", "casefold", "strip_punctuation"],
+    "phone": ["phone_digits"],
+    "date": ["iso_date"],
+}
+
+TITLE_PATTERN = r"^\s*(?:mr|mrs|ms|miss|mx|dr|prof)\.?\s+"
+
+ABBREVIATIONS = {
+    "st": "Street",
+    "ave": "Avenue",
+    "rd": "Road",
+    "blvd": "Boulevard",
+    "dr": "Drive",
+    "ln": "Lane",
+    "ct": "Court",
+    "pl": "Place",
+    "sq": "Square",
+    "hwy": "Highway",
+    "pkwy": "Parkway",
+    "apt": "Apartment",
+    "ste": "Suite",
+}
+ABBREVIATION_PATTERN = r"\b(" + "|".join(ABBREVIATIONS) + r")\b\.?(?=[\s,]|$)"
+
+# Default memory budget of the cache of normalised columns, shared by all sessions
+NORMALISE_CACHE_BYTES = 256 * 1024**2
+
+_normalised_columns = LRUCache(NORMALISE_CACHE_BYTES)
+
+
+def resolve_normalisation(normalise) -> list:
+    """
+    Resolve the normalisation of a column into its list of steps.
+
+    Args:
+        normalise (str or list): The name of a preset of `NORMALISATION_PRESETS`, or a list of
+            steps of `NORMALISATION_STEPS`. None means no normalisation.
+
+    Returns:
+        list: The steps, in the order they are applied.
+    """
+    if normalise is None:
+        return []
+    if isinstance(normalise, str):
+        if normalise not in NORMALISATION_PRESETS:
+            raise ValueError(f"The normalisation preset '{normalise}' is not known.")
+        normalise = NORMALISATION_PRESETS[normalise]
+    unknown = set(normalise) - set(NORMALISATION_STEPS)
+    if unknown:
+        raise ValueError(f"The normalisation steps {sorted(unknown)} are not known.")
+    return [step for step in NORMALISATION_STEPS if step in normalise]
+
+
+def parse_dates(values) -> pd.Series:
+    """Parse a column of date strings in bulk, trying ISO 8601 first. Unparseable values are NaT."""
+    parsed = pd.to_datetime(values, errors="coerce", format="ISO8601")
+    unparsed = parsed.isna() & values.notna()
+    if unparsed.any():
+        parsed[unparsed] = pd.to_datetime(
+            values[unparsed], errors="coerce", format="mixed"
+        )
+    return parsed
+
+
+def find_normalisation_conflicts(col_info) -> list:
+    """
+    Find the columns that the column information compares with different normalisations.
+
+    Args:
+        col_info (list): The column information, see `utils.data_match.calc_match_scores`.
+
+    Returns:
+        list: The names of the conflicting columns of either DataFrame, in the order of
+        `col_info`. A column can only be normalised in one way, see `normalise_frames`.
+    """
+    conflicts = []
+    for name_key in ["name1", "name2"]:
+        steps_per_column = {}
+        for col_dict in col_info:
+            col = col_dict[name_key]
+            steps = resolve_normalisation(col_dict.get("normalise"))
+            if steps_per_column.setdefault(col, steps) != steps and col not in conflicts:
+                conflicts.append(col)
+    return conflicts
+
+
+def normalise_series(series, normalise) -> pd.Series:
+    """
+    Normalise the values of a column.
+
+    Args:
+        series (pandas.Series): The column to normalise.
+        normalise (str or list): The normalisation preset or steps, see `resolve_normalisation`.
+            The steps are:
+                'remove_titles': Remove a leading title such as 'Mr.' or 'Dr.'.
+                'expand_abbreviations': Expand street abbreviations, e.g. 'St.' to 'Street'.
+                'casefold': Fold the case of the values.
+                'strip_punctuation': Remove punctuation and collapse whitespace.
+                'phone_digits': Keep the ten last digits of a phone number, ignoring extensions.
+                'iso_date': Rewrite dates as YYYY-MM-DD. Values that are not dates are kept.
+
+    Returns:
+        pandas.Series: The normalised column, aligned with `series`. Missing values, and values
+        left empty by the normalisation, are None.
+
+    Every step works on the whole column at once, so the cost is paid once per record rather
+    than once per compared pair.
+    """
+    steps = resolve_normalisation(normalise)
+    if not steps:
+        return series
+
+    values = series.astype("string")
+    if "remove_titles" in steps:
+        values = values.str.replace(TITLE_PATTERN, "", case=False, regex=True)
+    if "expand_abbreviations" in steps:
+        values = values.str.replace(
+            ABBREVIATION_PATTERN,
+            lambda match: ABBREVIATIONS[match.group(1).casefold()],
+            case=False,
+            regex=True,
+        )
+    if "casefold" in steps:
+        values = values.str.casefold()
+    if "strip_punctuation" in steps:
+        values = values.str.replace(r"[^\w\s]", "", regex=True)
+        values = values.str.replace(r"\s+", " ", regex=True).str.strip()
+    if "phone_digits" in steps:
+        values = values.str.casefold().str.split("x").str[0]
+        values = values.str.replace(r"\D", "", regex=True).str[-10:]
+    if "iso_date" in steps:
+        parsed = parse_dates(values)
+        values = parsed.dt.strftime("%Y-%m-%d").astype("string").fillna(values)
+
+    values = values.where(values.str.len() > 0)
+    return values.astype(object).where(values.notna(), None)
+
+
+def _dates_as_text(series) -> pd.Series:
+    """Write a column of parsed dates as ISO 8601 text, as the string comparisons expect text."""
+    values = series.astype("string")
+    return values.astype(object).where(values.notna(), None)
+
+
+def _categories_as_values(series) -> pd.Series:
+    """Store a categorical column with the dtype of its categories, as uploads differ in them."""
+    return series.astype(series.dtype.categories.dtype)
+
+
+def normalise_column(df, col, normalise, cache=_normalised_columns) -> pd.Series:
+    """
+    Normalise a column of a DataFrame, reusing the result of an earlier call on the same values.
+
+    Args:
+        df (pandas.DataFrame): The DataFrame holding the column.
+        col (str): The name of the column.
+        normalise (str or list): The normalisation preset or steps, see `normalise_series`.
+        cache (utils.data_cache.LRUCache, optional): The cache of normalised columns, keyed by a
+            hash of the column contents and the steps. Default is a cache shared by all callers.
+
+    Returns:
+        pandas.Series: The normalised column. It is shared with the cache and must not be modified.
+    """
+    steps = resolve_normalisation(normalise)
+    if not steps:
+        return df[col]
+
+    key = (hash_frame(df[[col]]), hash_config(steps))
+    normalised = cache.get(key)
+    if normalised is None:
+        normalised = normalise_series(df[col], steps)
+        cache.put(key, normalised)
+    return normalised
+
+
+def normalise_frames(df1, df2, col_info, cache=_normalised_columns) -> tuple:
+    """
+    Normalise the compared columns of both DataFrames as configured in the column information.
+
+    Args:
+        df1 (pandas.DataFrame): The first DataFrame.
+        df2 (pandas.DataFrame): The second DataFrame.
+        col_info (list): A list of dictionaries containing column information, see
+            `utils.data_match.calc_match_scores`. The optional 'normalise' key of each dictionary
+            holds the normalisation of both of its columns, see `normalise_series`.
+        cache (utils.data_cache.LRUCache, optional): The cache of normalised columns, see `normalise_column`.
+
+    Returns:
+        tuple: Both DataFrames with their compared columns replaced by the normalised values. A
+        DataFrame without normalised columns is returned as is. Compared columns of parsed dates
+        (e.g. from `utils.data_ingest.read_upload`) are always written back as ISO 8601 text,
+        and compared categoricals as their values, as two uploads have different categories
+        that pandas refuses to compare.
+
+    A column can only be normalised in one way, so two entries of `col_info` comparing the same
+    column with different normalisations raise a ValueError, see
+    `find_normalisation_conflicts`.
+    """
+    return (
+        normalise_frame(df1, col_info, "name1", cache),
+        normalise_frame(df2, col_info, "name2", cache),
+    )
+
+
+def normalise_frame(df, col_info, name_key, cache=_normalised_columns) -> pd.DataFrame:
+    """
+    Normalise the compared columns of one side of the column information, see `normalise_frames`.
+
+    Args:
+        df (pandas.DataFrame): The DataFrame.
+        col_info (list): The column information, see `utils.data_match.calc_match_scores`.
+        name_key (str): 'name1' if `df` is the first DataFrame of `col_info`, 'name2' otherwise.
+        cache (utils.data_cache.LRUCache, optional): The cache of normalised columns, see `normalise_column`.
+
+    Returns:
+        pandas.DataFrame: The DataFrame with its compared columns replaced by the normalised values.
+    """
+    steps_per_column = {}
+    for col_dict in col_info:
+        steps = resolve_normalisation(col_dict.get("normalise"))
+        col = col_dict[name_key]
+        if steps_per_column.setdefault(col, steps) != steps:
+            raise ValueError(
+                f"The column '{col}' is compared with different normalisations."
+            )
+
+    normalised = df
+    for col, steps in steps_per_column.items():
+        is_date = pd.api.types.is_datetime64_any_dtype(df[col].dtype)
+        is_category = isinstance(df[col].dtype, pd.CategoricalDtype)
+        if not steps and not is_date and not is_category:
+            continue
+        if normalised is df:
+            normalised = df.copy(deep=False)
+        if steps:
+            normalised[col] = normalise_column(df, col, steps, cache)
+        elif is_date:
+            normalised[col] = _dates_as_text(df[col])
+        else:
+            normalised[col] = _categories_as_values(df[col])
+    return normalised
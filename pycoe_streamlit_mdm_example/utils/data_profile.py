@@ -0,0 +1,183 @@
+from contextlib import contextmanager
+import json
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+# tracemalloc traces the whole process, so only one run at a time traces its memory: the peak
+# of a run would otherwise include the allocations of the runs in other threads
+_tracing_lock = threading.Lock()
+
+
+class MatchProfiler:
+    """
+    Record the wall time, CPU time, pair counts and peak memory allocation of the stages of a run.
+
+    Args:
+        trace_memory (bool, optional): Whether to trace the memory allocated by every stage with
+            tracemalloc. Tracing slows down code allocating many Python objects, such as the
+            string comparators. Memory is traced for one run of the process at a time, and
+            while another profiler traces, the stages of this one record no peak allocation.
+            Default is True.
+
+    The matching functions of `utils.data_match` take a profiler and time their stages with
+    `profile_stage`. A stage run several times, such as the scoring of every chunk of a
+    streamed run, is recorded once with its times and pairs summed over the runs. Stages can
+    be nested, a comparator stage running inside the scoring, and only the outermost stages
+    add up to the total. Stages run by worker processes are not recorded.
+    """
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self._stages = {}
+        # The peak allocation seen by every open stage, from the outermost to the innermost
+        self._open_peaks = []
+        self._started_tracing = False
+        self._holds_tracing_lock = False
+
+    @contextmanager
+    def stage(self, name, pairs=None):
+        """
+        Record a stage of the run.
+
+        Args:
+            name (str): The name of the stage.
+            pairs (int, optional): The number of pairs the stage processes. It can also be set
+                once known, as the 'pairs' key of the dictionary yielded. Default is None.
+
+        Yields:
+            dict: The measurements of this run of the stage.
+        """
+        if self.trace_memory and not self._open_peaks:
+            self._holds_tracing_lock = _tracing_lock.acquire(blocking=False)
+            if self._holds_tracing_lock and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+        tracing = self._holds_tracing_lock and tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._open_peaks:
+                self._open_peaks[-1] = max(self._open_peaks[-1], peak)
+            tracemalloc.reset_peak()
+        else:
+            current = 0
+        self._open_peaks.append(current)
+
+        record = {"pairs": pairs}
+        stage = self._entry(name, len(self._open_peaks) - 1)
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            wall_s = time.perf_counter() - wall_start
+            cpu_s = time.process_time() - cpu_start
+            peak = self._open_peaks.pop()
+            if tracing:
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                # The enclosing stage saw the allocations of this one
+                if self._open_peaks:
+                    self._open_peaks[-1] = max(self._open_peaks[-1], peak)
+            peak_bytes = peak - current if tracing else None
+            self._add(stage, wall_s, cpu_s, record["pairs"], peak_bytes)
+            if self._started_tracing and not self._open_peaks:
+                tracemalloc.stop()
+                self._started_tracing = False
+            if self._holds_tracing_lock and not self._open_peaks:
+                _tracing_lock.release()
+                self._holds_tracing_lock = False
+
+    def _entry(self, name, depth) -> dict:
+        """Return the measurements of a stage, adding them when the stage first starts."""
+        return self._stages.setdefault(
+            name,
+            {
+                "stage": name,
+                "depth": depth,
+                "calls": 0,
+                "wall_s": 0.0,
+                "cpu_s": 0.0,
+                "pairs": None,
+                "peak_alloc_mb": None,
+            },
+        )
+
+    def _add(self, stage, wall_s, cpu_s, pairs, peak_bytes) -> None:
+        """Add a run of a stage to its measurements."""
+        stage["calls"] += 1
+        stage["wall_s"] += wall_s
+        stage["cpu_s"] += cpu_s
+        if pairs is not None:
+            stage["pairs"] = (stage["pairs"] or 0) + int(pairs)
+        if peak_bytes is not None:
+            stage["peak_alloc_mb"] = max(stage["peak_alloc_mb"] or 0.0, peak_bytes / 1024**2)
+        return None
+
+    def to_dict(self) -> dict:
+        """
+        Return the measurements as a dictionary of JSON types.
+
+        Returns:
+            dict: The 'stages', a list of dictionaries in the order the stages first started, with
+            the 'stage' name, its nesting 'depth', the number of 'calls', the total 'wall_s' and
+            'cpu_s' in seconds, the 'pairs' processed and 'pairs_per_sec' (None for stages
+            without pairs), and the 'peak_alloc_mb' allocated above the memory allocated when the
+            stage started (None without memory tracing). Followed by the 'total_wall_s',
+            'total_cpu_s' and 'peak_alloc_mb' of the outermost stages.
+        """
+        stages = []
+        for stage in self._stages.values():
+            stage = dict(stage)
+            stage["pairs_per_sec"] = None
+            if stage["pairs"] is not None and stage["wall_s"] > 0:
+                stage["pairs_per_sec"] = stage["pairs"] / stage["wall_s"]
+            stages.append(stage)
+        outermost = [stage for stage in stages if stage["depth"] == 0]
+        peaks = [
+            stage["peak_alloc_mb"] for stage in outermost if stage["peak_alloc_mb"] is not None
+        ]
+        return {
+            "stages": stages,
+            "total_wall_s": sum(stage["wall_s"] for stage in outermost),
+            "total_cpu_s": sum(stage["cpu_s"] for stage in outermost),
+            "peak_alloc_mb": max(peaks) if peaks else None,
+        }
+
+    def to_json(self, **kwargs) -> str:
+        """Return the measurements of `to_dict` as JSON, `kwargs` being passed to `json.dumps`."""
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def to_frame(self) -> pd.DataFrame:
+        """Return the measurements of the stages as a DataFrame indexed by stage."""
+        columns = [
+            "stage",
+            "depth",
+            "calls",
+            "wall_s",
+            "cpu_s",
+            "pairs",
+            "pairs_per_sec",
+            "peak_alloc_mb",
+        ]
+        return pd.DataFrame(self.to_dict()["stages"], columns=columns).set_index("stage")
+
+
+@contextmanager
+def profile_stage(profiler, name, pairs=None):
+    """
+    Record a stage of a run with a profiler, or do nothing without one.
+
+    Args:
+        profiler (MatchProfiler): The profiler, or None.
+        name (str): The name of the stage.
+        pairs (int, optional): The number of pairs the stage processes, see `MatchProfiler.stage`.
+
+    Yields:
+        dict: The measurements of the stage, whose 'pairs' can be set once known.
+    """
+    if profiler is None:
+        yield {"pairs": pairs}
+        return
+    with profiler.stage(name, pairs) as record:
+        yield record
@@ -1,10 +1,20 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from multiprocessing import get_context
 from faker import Faker as fkr
+import numpy as np
 import pandas as pd
-import random
 import string
-from datetime import datetime, timedelta
+from datetime import datetime
 import streamlit as st
 
+from utils.data_normalise import parse_dates
+
+# Number of values drawn from faker for every pool of values
+POOL_SIZE = 1_000
+# Number of records generated from a single seed
+SHARD_SIZE = 100_000
+
 
 def set_num_records() -> None:
     st.session_state["permpage1"]["num_records"] = st.session_state["num_records"]
@@ -16,73 +26,253 @@ def set_uploadcreate() -> None:
     return None
 
 
-def generate_fake_data(num_records) -> pd.DataFrame:
+def build_value_pools(seed=None, pool_size=POOL_SIZE) -> dict:
     """
-    Generate a pandas DataFrame with fake data for a specified number of records.
+    Build pools of realistic values to sample fake records from.
 
     Args:
-        num_records (int): The number of fake records to generate.
+        seed (int, optional): The seed for the `faker` generator. If None, the pools are random.
+        pool_size (int, optional): The number of values drawn for every pool. Default is 1,000.
 
     Returns:
-        pd.DataFrame: A DataFrame containing fake names, addresses, phone numbers,
-                      dates, timestamps, and other generic columns like email, job, etc.
-                      The columns are: 'name', 'address', 'phone', 'date', 'timestamp',
-                      'email', 'job', etc.
+        dict: A dictionary of NumPy arrays of values, keyed by the name of the pool.
 
-    The function uses the `faker` library to generate realistic fake data for names,
-    addresses, phone numbers, dates, emails, job titles, etc. The dates and timestamps
-    are randomly generated within the past 10 years from the current date. Phone numbers
-    and addresses may be outdated or invalid.
+    The pools are the only part of the data generation that calls `faker`, so the number of
+    `faker` calls depends on `pool_size` and not on the number of records generated.
     """
-
     fake = fkr()
+    fake.seed_instance(seed)
+
+    pools = {
+        "first_name": [fake.first_name() for _ in range(pool_size)],
+        "last_name": [fake.last_name() for _ in range(pool_size)],
+        "street_name": [fake.street_name() for _ in range(pool_size)],
+        "secondary_address": [fake.secondary_address() for _ in range(pool_size)],
+        "city": [fake.city() for _ in range(pool_size)],
+        "state": [fake.state_abbr() for _ in range(pool_size)],
+        "email_domain": [
+            fake.free_email_domain() if i % 2 else fake.domain_name()
+            for i in range(pool_size)
+        ],
+        "job": [fake.job() for _ in range(pool_size)],
+    }
+    pools = {key: np.array(values, dtype=object) for key, values in pools.items()}
+    pools["first_name_lower"] = np.array(
+        [value.lower() for value in pools["first_name"]], dtype=object
+    )
+    pools["first_initial_lower"] = np.array(
+        [value[0].lower() for value in pools["first_name"]], dtype=object
+    )
+    pools["last_name_lower"] = np.array(
+        [value.lower() for value in pools["last_name"]], dtype=object
+    )
+    return pools
+
+
+def _sample(rng, pool, size) -> np.ndarray:
+    return pool[rng.integers(0, len(pool), size)]
+
+
+@lru_cache(maxsize=None)
+def _number_strings(width, padded=True) -> np.ndarray:
+    """Return the strings of all numbers below 10**width, so numbers can be formatted by lookup."""
+    template = f"{{:0{width}d}}" if padded else "{:d}"
+    return np.array([template.format(i) for i in range(10**width)], dtype=object)
+
+
+def _choose_format(rng, formats, size) -> np.ndarray:
+    """Build every value with a randomly chosen format, only formatting the rows that use it."""
+    choice = rng.integers(0, len(formats), size)
+    values = np.empty(size, dtype=object)
+    for i, build in enumerate(formats):
+        rows = np.flatnonzero(choice == i)
+        values[rows] = build(rows)
+    return values
 
-    names = []
-    addresses = []
-    phone_numbers = []
-    dates = []
-    timestamps = []
-    emails = []
-    jobs = []
-
-    for _ in range(num_records):
-        names.append(fake.name())
-        addresses.append(fake.address())
-        phone_numbers.append(fake.phone_number())
-        dates.append(fake.date_between(start_date="-10y", end_date=datetime.today()))
-        timestamps.append(
-            fake.date_time_between(start_date="-10y", end_date=datetime.today())
-        )
-        emails.append(fake.email())
-        jobs.append(fake.job())
+
+def _fake_addresses(rng, pools, size) -> np.ndarray:
+    """Build US style addresses, like `faker`'s, from the value pools."""
+    street = (
+        _number_strings(5, padded=False)[rng.integers(1, 100_000, size)]
+        + " "
+        + _sample(rng, pools["street_name"], size)
+    )
+    with_secondary = np.flatnonzero(rng.random(size) < 0.3)
+    street[with_secondary] = (
+        street[with_secondary]
+        + " "
+        + _sample(rng, pools["secondary_address"], len(with_secondary))
+    )
+    return (
+        street
+        + "\n"
+        + _sample(rng, pools["city"], size)
+        + ", "
+        + _sample(rng, pools["state"], size)
+        + " "
+        + _number_strings(5)[rng.integers(0, 100_000, size)]
+    )
+
+
+def _fake_phone_numbers(rng, size) -> np.ndarray:
+    """Build US phone numbers in the formats `faker` uses."""
+    area = _number_strings(3)[rng.integers(200, 1_000, size)]
+    exchange = _number_strings(3)[rng.integers(200, 1_000, size)]
+    line = _number_strings(4)[rng.integers(0, 10_000, size)]
+    phones = _choose_format(
+        rng,
+        [
+            lambda rows: area[rows] + "-" + exchange[rows] + "-" + line[rows],
+            lambda rows: "(" + area[rows] + ")" + exchange[rows] + "-" + line[rows],
+            lambda rows: area[rows] + "." + exchange[rows] + "." + line[rows],
+            lambda rows: area[rows] + exchange[rows] + line[rows],
+            lambda rows: "+1-" + area[rows] + "-" + exchange[rows] + "-" + line[rows],
+            lambda rows: "001-" + area[rows] + "-" + exchange[rows] + "-" + line[rows],
+        ],
+        size,
+    )
+    with_extension = np.flatnonzero(rng.random(size) < 0.2)
+    phones[with_extension] = (
+        phones[with_extension]
+        + "x"
+        + _number_strings(5, padded=False)[
+            rng.integers(100, 100_000, len(with_extension))
+        ]
+    )
+    return phones
+
+
+def _fake_emails(rng, pools, first_idx, last_idx) -> np.ndarray:
+    """Build email addresses from the names of the records."""
+    size = len(first_idx)
+    first = pools["first_name_lower"][first_idx]
+    last = pools["last_name_lower"][last_idx]
+    initial = pools["first_initial_lower"][first_idx]
+    number = _number_strings(2)[rng.integers(0, 100, size)]
+    users = _choose_format(
+        rng,
+        [
+            lambda rows: first[rows] + last[rows],
+            lambda rows: initial[rows] + last[rows],
+            lambda rows: first[rows] + number[rows],
+            lambda rows: last[rows] + first[rows],
+        ],
+        size,
+    )
+    return users + "@" + _sample(rng, pools["email_domain"], size)
+
+
+def _generate_shard(pools, num_records, seed, end_date) -> pd.DataFrame:
+    """Generate `num_records` fake records from the value pools with a seeded generator."""
+    rng = np.random.default_rng(seed)
+
+    first_idx = rng.integers(0, len(pools["first_name"]), num_records)
+    last_idx = rng.integers(0, len(pools["last_name"]), num_records)
+    names = pools["first_name"][first_idx] + " " + pools["last_name"][last_idx]
+
+    # Dates and timestamps within the 10 years before the end date
+    end_day = np.datetime64(end_date, "D")
+    dates = end_day - rng.integers(0, 3_653, num_records).astype("timedelta64[D]")
+    timestamp_days = end_day - rng.integers(0, 3_653, num_records).astype(
+        "timedelta64[D]"
+    )
+    seconds = rng.integers(0, 86_400, num_records)
+    timestamps = (
+        np.datetime_as_string(timestamp_days, unit="D").astype(object)
+        + " "
+        + _number_strings(2)[seconds // 3_600]
+        + ":"
+        + _number_strings(2)[seconds // 60 % 60]
+        + ":"
+        + _number_strings(2)[seconds % 60]
+    )
 
     df = pd.DataFrame(
         {
             "name": names,
-            "address": addresses,
-            "phone": phone_numbers,
-            "date": dates,
+            "address": _fake_addresses(rng, pools, num_records),
+            "phone": _fake_phone_numbers(rng, num_records),
+            "date": np.datetime_as_string(dates, unit="D").astype(object),
             "timestamp": timestamps,
-            "email": emails,
-            "job": jobs,
+            "email": _fake_emails(rng, pools, first_idx, last_idx),
+            "job": _sample(rng, pools["job"], num_records),
         }
     )
 
-    df["date"] = df["date"].astype(str)
-    df["timestamp"] = df["timestamp"].astype(str)
-
     # Introduce outdated or invalid phone numbers and addresses
-    df["phone"] = df["phone"].apply(
-        lambda x: x.replace(x[-4:], "1234") if random.random() < 0.2 else x
-    )
-    df["address"] = df["address"].apply(
-        lambda x: fake.address() if random.random() < 0.1 else x
+    outdated_phone = rng.random(num_records) < 0.2
+    df.loc[outdated_phone, "phone"] = df.loc[outdated_phone, "phone"].str[:-4] + "1234"
+    outdated_address = rng.random(num_records) < 0.1
+    df.loc[outdated_address, "address"] = _fake_addresses(
+        rng, pools, int(outdated_address.sum())
     )
 
     return df
 
 
-def introduce_spelling_errors(df, error_rate=0.05, columns=None) -> pd.DataFrame:
+def _generate_shard_star(args) -> pd.DataFrame:
+    return _generate_shard(*args)
+
+
+def generate_fake_data(
+    num_records, seed=None, n_jobs=1, pool_size=POOL_SIZE, end_date=None
+) -> pd.DataFrame:
+    """
+    Generate a pandas DataFrame with fake data for a specified number of records.
+
+    Args:
+        num_records (int): The number of fake records to generate.
+        seed (int, optional): The seed of the generation. The same seed, `pool_size` and
+            `end_date` always generate the same DataFrame. If None, the data is random.
+        n_jobs (int, optional): The number of processes generating shards of the records in
+            parallel. The generated data does not depend on it. Default is 1.
+        pool_size (int, optional): The number of values in each pool of names, streets, cities,
+            jobs, etc. the records are sampled from. Default is 1,000.
+        end_date (datetime.date, optional): The latest date and timestamp generated. Default is today.
+
+    Returns:
+        pd.DataFrame: A DataFrame containing fake names, addresses, phone numbers,
+                      dates, timestamps, and other generic columns like email, job, etc.
+                      The columns are: 'name', 'address', 'phone', 'date', 'timestamp',
+                      'email', 'job', etc.
+
+    The function uses the `faker` library once to build pools of realistic values for names,
+    addresses, emails, job titles, etc. (see `build_value_pools`), and then samples every
+    record from those pools with vectorized NumPy draws. The dates and timestamps
+    are randomly generated within the past 10 years from the end date. Phone numbers
+    and addresses may be outdated or invalid.
+
+    The records are generated in shards of `SHARD_SIZE` records, each with its own seed
+    spawned from `seed`, so the shards can be generated by separate processes.
+    """
+    if end_date is None:
+        end_date = datetime.today().date()
+
+    pools = build_value_pools(seed, pool_size)
+    shard_sizes = [
+        min(SHARD_SIZE, num_records - start) for start in range(0, num_records, SHARD_SIZE)
+    ]
+    shard_seeds = np.random.SeedSequence(seed).spawn(len(shard_sizes))
+    shards = [
+        (pools, shard_size, shard_seed, end_date)
+        for shard_size, shard_seed in zip(shard_sizes, shard_seeds)
+    ]
+
+    if n_jobs > 1 and len(shards) > 1:
+        # Spawned rather than forked, as a forked child can inherit a lock held by another thread
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=get_context("spawn")) as pool:
+            dfs = list(pool.map(_generate_shard_star, shards))
+    else:
+        dfs = [_generate_shard(*shard) for shard in shards]
+
+    if not dfs:
+        return _generate_shard(pools, 0, seed, end_date)
+    return pd.concat(dfs, ignore_index=True)
+
+
+def introduce_spelling_errors(
+    df, error_rate=0.05, columns=None, seed=None
+) -> pd.DataFrame:
     """
     Introduce random spelling errors in the specified columns of a pandas DataFrame.
 
@@ -92,34 +282,50 @@ def introduce_spelling_errors(df, error_rate=0.05, columns=None) -> pd.DataFrame
             Default is 0.05 (5% of characters).
         columns (list, optional): The list of column names to introduce errors in. If None, all
             object (string) columns in the DataFrame will be used.
+        seed (int or numpy.random.Generator, optional): The seed or generator for the random draws.
+            If None, the errors are random.
 
     Returns:
         pd.DataFrame: A new DataFrame with spelling errors introduced in the specified columns.
-
-    The function iterates over the specified columns and randomly replaces a fraction of characters (based on
-    the provided error rate) in each string value with a random alphabet character. If no columns are specified,
-    it will introduce errors in all object (string) columns of the input DataFrame.
+            The input DataFrame is not modified.
+
+    Every character of the specified columns is independently replaced, with probability `error_rate`,
+    by a random alphabet character. If no columns are specified, it will introduce errors in all
+    object (string) columns of the input DataFrame. Instead of looping over the values, the strings
+    of a column are joined into one flat buffer of character codes, the replaced characters and their
+    replacements are drawn in bulk, and the strings are cut back out of the buffer in a single pass.
+    Values that are not strings are left as they are.
     """
+    rng = np.random.default_rng(seed)
+    letters = np.frombuffer(string.ascii_letters.encode("utf-32-le"), dtype=np.uint32)
+    df = df.copy()
+
     if columns is None:
         columns = df.select_dtypes(include="object").columns
         columns = columns.drop(["date", "timestamp"], errors="ignore")
 
     for col in columns:
-        for i in range(len(df)):
-            original_value = df.loc[i, col]
-            new_value = ""
-            for char in original_value:
-                if random.random() < error_rate:
-                    new_value += random.choice(string.ascii_letters)
-                else:
-                    new_value += char
-            df.loc[i, col] = new_value
+        values = df[col].to_numpy(dtype=object)
+        is_string = np.array([isinstance(value, str) for value in values], dtype=bool)
+        strings = values[is_string]
+        if not len(strings):
+            continue
+
+        buffer = np.frombuffer("".join(strings).encode("utf-32-le"), dtype=np.uint32).copy()
+        replaced = np.flatnonzero(rng.random(len(buffer)) < error_rate)
+        buffer[replaced] = letters[rng.integers(0, len(letters), len(replaced))]
+        joined = buffer.tobytes().decode("utf-32-le")
+
+        ends = np.cumsum([len(value) for value in strings])
+        starts = ends - np.array([len(value) for value in strings])
+        values[is_string] = [joined[start:end] for start, end in zip(starts, ends)]
+        df[col] = values
 
     return df
 
 
 def introduce_date_inconsistencies(
-    df, col="date", inconsistency_rate=0.2
+    df, col="date", inconsistency_rate=0.2, seed=None
 ) -> pd.DataFrame:
     """
     Introduce format inconsistencies in the 'date' column of the DataFrame.
@@ -129,27 +335,27 @@ def introduce_date_inconsistencies(
         col (str, optional): The name of the date column. Default is 'date'.
         inconsistency_rate (float, optional): The probability of introducing an inconsistency in a date value.
             Default is 0.2 (20% chance).
+        seed (int or numpy.random.Generator, optional): The seed or generator for the random draws.
 
     Returns:
         pd.DataFrame: A new DataFrame with format inconsistencies introduced in the date column.
     """
-    for i in range(len(df)):
-        if random.random() < inconsistency_rate:
-            date_str = df.loc[i, col]
-            try:
-                date_dt = pd.to_datetime(date_str)
-                if "/" in date_str:
-                    df.loc[i, col] = date_dt.strftime("%Y-%m-%d")
-                elif "-" in date_str:
-                    df.loc[i, col] = date_dt.strftime("%Y.%m.%d")
-            except pd.errors.ParserError:
-                # Skip the row if parsing fails
-                continue
+    rng = np.random.default_rng(seed)
+    df = df.copy()
+    selected = rng.random(len(df)) < inconsistency_rate
+    values = df.loc[selected, col]
+    # Skip the rows where parsing fails
+    parsed = parse_dates(values)
+    has_slash = values.str.contains("/", regex=False, na=False) & parsed.notna()
+    has_dash = values.str.contains("-", regex=False, na=False) & parsed.notna()
+    has_dash &= ~has_slash
+    df.loc[has_slash[has_slash].index, col] = parsed[has_slash].dt.strftime("%Y-%m-%d")
+    df.loc[has_dash[has_dash].index, col] = parsed[has_dash].dt.strftime("%Y.%m.%d")
     return df
 
 
 def introduce_phone_inconsistencies(
-    df, col="phone", inconsistency_rate=0.3, variation_rate=0.4
+    df, col="phone", inconsistency_rate=0.3, variation_rate=0.4, seed=None
 ) -> pd.DataFrame:
     """
     Introduce format inconsistencies in the 'phone' column of the DataFrame.
@@ -161,23 +367,37 @@ def introduce_phone_inconsistencies(
             Default is 0.3 (30% chance).
         variation_rate (float, optional): The probability of adding variations (e.g., spaces) to the phone value.
             Default is 0.4 (40% chance).
+        seed (int or numpy.random.Generator, optional): The seed or generator for the random draws.
 
     Returns:
         pd.DataFrame: A new DataFrame with format inconsistencies introduced in the phone column.
     """
-    for i in range(len(df)):
-        if random.random() < inconsistency_rate:
-            phone_str = df.loc[i, col]
-            if random.random() < variation_rate:  # Add variations
-                phone_str = phone_str[:3] + " " + phone_str[3:]
-            else:  # Remove variations
-                phone_str = phone_str.replace(" ", "").replace("-", "")
-            df.loc[i, col] = phone_str
+    rng = np.random.default_rng(seed)
+    df = df.copy()
+    selected = rng.random(len(df)) < inconsistency_rate
+    add_variation = rng.random(len(df)) < variation_rate
+
+    # Add variations
+    rows = selected & add_variation
+    phones = df.loc[rows, col]
+    df.loc[rows, col] = phones.str[:3] + " " + phones.str[3:]
+
+    # Remove variations
+    rows = selected & ~add_variation
+    phones = df.loc[rows, col]
+    df.loc[rows, col] = phones.str.replace(" ", "", regex=False).str.replace(
+        "-", "", regex=False
+    )
     return df
 
 
 def introduce_address_inconsistencies(
-    df, col="address", capitalization_rate=0.15, comma_rate=0.15, abbreviation_rate=0.15
+    df,
+    col="address",
+    capitalization_rate=0.15,
+    comma_rate=0.15,
+    abbreviation_rate=0.15,
+    seed=None,
 ) -> pd.DataFrame:
     """
     Introduce format inconsistencies in the 'address' column of the DataFrame.
@@ -191,39 +411,46 @@ def introduce_address_inconsistencies(
             Default is 0.15 (15% chance).
         abbreviation_rate (float, optional): The probability of abbreviating or unabbreviating street names.
             Default is 0.15 (15% chance).
+        seed (int or numpy.random.Generator, optional): The seed or generator for the random draws.
 
     Returns:
         pd.DataFrame: A new DataFrame with format inconsistencies introduced in the address column.
-    """
-    for i in range(len(df)):
-        address_str = df.loc[i, col]
 
-        # Change capitalization
-        if random.random() < capitalization_rate:
-            df.loc[i, col] = (
-                address_str.upper() if address_str.islower() else address_str.lower()
-            )
+    Each inconsistency is applied to the original address, so when several are drawn for
+    the same row, the last one (capitalization, then commas, then abbreviations) is kept.
+    """
+    rng = np.random.default_rng(seed)
+    df = df.copy()
+    addresses = df[col].copy()
+    change_capitalization = rng.random(len(df)) < capitalization_rate
+    change_commas = rng.random(len(df)) < comma_rate
+    change_abbreviations = rng.random(len(df)) < abbreviation_rate
+
+    # Change capitalization
+    values = addresses[change_capitalization]
+    df.loc[change_capitalization, col] = values.str.upper().where(
+        values.str.islower(), values.str.lower()
+    )
 
-        # Add/remove commas
-        if random.random() < comma_rate:
-            df.loc[i, col] = (
-                address_str.replace(",", "")
-                if "," in address_str
-                else address_str + ","
-            )
+    # Add/remove commas
+    values = addresses[change_commas]
+    df.loc[change_commas, col] = values.str.replace(",", "", regex=False).where(
+        values.str.contains(",", regex=False), values + ","
+    )
 
-        # Abbreviation variations
-        if random.random() < abbreviation_rate:
-            df.loc[i, col] = (
-                address_str.replace("Street", "St.")
-                if "Street" in address_str
-                else address_str.replace("St.", "Street")
-            )
+    # Abbreviation variations
+    values = addresses[change_abbreviations]
+    df.loc[change_abbreviations, col] = values.str.replace(
+        "Street", "St.", regex=False
+    ).where(
+        values.str.contains("Street", regex=False),
+        values.str.replace("St.", "Street", regex=False),
+    )
     return df
 
 
 def introduce_name_inconsistencies(
-    df, col="name", abbreviation_rate=0.2, title_rate=0.3
+    df, col="name", abbreviation_rate=0.2, title_rate=0.3, seed=None
 ) -> pd.DataFrame:
     """
     Introduce format inconsistencies in the 'name' column of the DataFrame.
@@ -235,26 +462,39 @@ def introduce_name_inconsistencies(
             Default is 0.2 (20% chance).
         title_rate (float, optional): The probability of adding a title to the name.
             Default is 0.3 (30% chance).
+        seed (int or numpy.random.Generator, optional): The seed or generator for the random draws.
 
     Returns:
         pd.DataFrame: A new DataFrame with format inconsistencies introduced in the name column.
+
+    Both inconsistencies are applied to the original name, so a title replaces an abbreviation.
     """
-    for i in range(len(df)):
-        name = df.loc[i, col]
-        # Abbreviate names
-        if random.random() < abbreviation_rate and len(name.split()) > 1:
-            first_initial = name.split()[0][0] + "."
-            df.loc[i, col] = first_initial + " " + name.split()[-1]
-
-        # Add titles
-        if random.random() < title_rate:
-            titles = ["Mr.", "Mrs.", "Dr.", "Prof."]
-            df.loc[i, col] = random.choice(titles) + " " + name
+    rng = np.random.default_rng(seed)
+    titles = np.array(["Mr.", "Mrs.", "Dr.", "Prof."], dtype=object)
+    df = df.copy()
+    names = df[col].copy()
+    parts = names.str.split()
+    abbreviate = (rng.random(len(df)) < abbreviation_rate) & (
+        parts.str.len() > 1
+    ).to_numpy()
+    add_title = rng.random(len(df)) < title_rate
+
+    # Abbreviate names
+    df.loc[abbreviate, col] = (
+        parts[abbreviate].str[0].str[0] + ". " + parts[abbreviate].str[-1]
+    )
+
+    # Add titles
+    df.loc[add_title, col] = (
+        titles[rng.integers(0, len(titles), int(add_title.sum()))]
+        + " "
+        + names[add_title]
+    )
     return df
 
 
 def introduce_timestamp_inconsistencies(
-    df, col="timestamp", inconsistency_rate=0.1
+    df, col="timestamp", inconsistency_rate=0.1, seed=None
 ) -> pd.DataFrame:
     """
     Introduce inconsistencies in the 'timestamp' column of the DataFrame.
@@ -264,23 +504,20 @@ def introduce_timestamp_inconsistencies(
         col (str, optional): The name of the timestamp column. Default is 'timestamp'.
         inconsistency_rate (float, optional): The probability of introducing an inconsistency in a timestamp value.
             Default is 0.1 (10% chance).
+        seed (int or numpy.random.Generator, optional): The seed or generator for the random draws.
 
     Returns:
         pd.DataFrame: A new DataFrame with inconsistencies introduced in the timestamp column.
     """
-    for i in range(len(df)):
-        if random.random() < inconsistency_rate:
-            timestamp_str = df.loc[i, col]
-            try:
-                timestamp_dt = pd.to_datetime(timestamp_str)
-                offset_days = random.randint(
-                    -365, 365
-                )  # Offset between -1 year and +1 year
-                new_timestamp = timestamp_dt + timedelta(days=offset_days)
-                df.loc[i, col] = new_timestamp.strftime("%Y-%m-%d %H:%M:%S")
-            except pd.errors.ParserError:
-                # Skip the row if parsing fails
-                continue
+    rng = np.random.default_rng(seed)
+    df = df.copy()
+    selected = rng.random(len(df)) < inconsistency_rate
+    # Skip the rows where parsing fails
+    parsed = parse_dates(df.loc[selected, col])
+    parsed = parsed[parsed.notna()]
+    offset_days = rng.integers(-365, 366, len(parsed))  # Offset between -1 year and +1 year
+    new_timestamps = parsed + pd.to_timedelta(offset_days, unit="D")
+    df.loc[new_timestamps.index, col] = new_timestamps.dt.strftime("%Y-%m-%d %H:%M:%S")
     return df
 
 
@@ -296,6 +533,7 @@ def introduce_format_inconsistencies(
     name_abbreviation_rate=0.2,
     name_title_rate=0.3,
     timestamp_inconsistency_rate=0.1,
+    seed=None,
 ) -> pd.DataFrame:
     """
     Introduce format inconsistencies in the specified columns of the DataFrame.
@@ -322,10 +560,16 @@ def introduce_format_inconsistencies(
             Default is 0.3 (30% chance).
         timestamp_inconsistency_rate (float, optional): The probability of introducing an inconsistency in a timestamp value.
             Default is 0.1 (10% chance).
+        seed (int or numpy.random.Generator, optional): The seed or generator for the random draws.
+            If None, the inconsistencies are random.
 
     Returns:
         pd.DataFrame: A new DataFrame with format inconsistencies introduced in the specified columns.
+
+    Every rule works on whole columns at once: the rows to change are drawn as random masks, and
+    the changed values are computed with bulk datetime parsing and `.str` operations on those rows.
     """
+    rng = np.random.default_rng(seed)
     if columns is None:
         columns = []
         if "date" in df.columns:
@@ -341,10 +585,12 @@ def introduce_format_inconsistencies(
 
     for col in columns:
         if col == "date":
-            df = introduce_date_inconsistencies(df, col, date_inconsistency_rate)
+            df = introduce_date_inconsistencies(
+                df, col, date_inconsistency_rate, seed=rng
+            )
         elif col == "phone":
             df = introduce_phone_inconsistencies(
-                df, col, phone_inconsistency_rate, phone_variation_rate
+                df, col, phone_inconsistency_rate, phone_variation_rate, seed=rng
             )
         elif col == "address":
             df = introduce_address_inconsistencies(
@@ -353,14 +599,15 @@ def introduce_format_inconsistencies(
                 address_capitalization_rate,
                 address_comma_rate,
                 address_abbreviation_rate,
+                seed=rng,
             )
         elif col == "name":
             df = introduce_name_inconsistencies(
-                df, col, name_abbreviation_rate, name_title_rate
+                df, col, name_abbreviation_rate, name_title_rate, seed=rng
             )
         elif col == "timestamp":
             df = introduce_timestamp_inconsistencies(
-                df, col, timestamp_inconsistency_rate
+                df, col, timestamp_inconsistency_rate, seed=rng
             )
 
     return df